@@ -19,6 +19,16 @@ interface AnalysisResult {
   away_timer: number;
   alerts: string[];
   timestamp: number;
+  // full | no_device | cascade | loop_only: cheaper tiers mean a lower-confidence verdict
+  analysis_tier?: string;
+  hints?: ClientHints;
+}
+
+// Server flow-control hints: how fast, how large and at what JPEG quality to send
+interface ClientHints {
+  target_fps: number;
+  max_side: number;
+  jpeg_quality: number;
 }
 
 export default function ExamPage() {
@@ -169,6 +179,14 @@ export default function ExamPage() {
   const LOW_SCORE_THRESHOLD = 30; // Only capture if score < 30 (very suspicious)
   const CONSECUTIVE_LOW_SCORES = 3; // Need 3 consecutive low scores
 
+  // Frame pacing follows the ML server's hints; until the first reply, send as before
+  const hintsRef = useRef<ClientHints | null>(null);
+  const sendCanvasRef = useRef<HTMLCanvasElement | null>(null);
+  const DEFAULT_FRAME_INTERVAL = 33;
+  const DEFAULT_JPEG_QUALITY = 0.8;
+  // Lets the server time away alerts by capture rather than arrival
+  const frameSequenceRef = useRef(0);
+
   const detectorWarningCountRef = useRef(0);
   const detectorWarningActiveRef = useRef(false);
   const detectorCountdownIntervalRef = useRef<NodeJS.Timeout | null>(null);
@@ -830,6 +848,7 @@ export default function ExamPage() {
       return;
     }
 
+    const startedAt = Date.now();
     const canvas = canvasRef.current;
     const video = videoRef.current;
     
@@ -840,7 +859,23 @@ export default function ExamPage() {
     if (!ctx) return;
     
     ctx.drawImage(video, 0, 0);
-    const imageData = canvas.toDataURL('image/jpeg', 0.8);
+    const captureTimestamp = Date.now() / 1000;
+    frameSequenceRef.current += 1;
+
+    // Full-size frame stays on canvasRef for snapshots; the server gets the hinted size
+    const hints = hintsRef.current;
+    let sendCanvas = canvas;
+    const longSide = Math.max(canvas.width, canvas.height);
+    if (hints && hints.max_side > 0 && longSide > hints.max_side) {
+      const scale = hints.max_side / longSide;
+      sendCanvas = sendCanvasRef.current ?? document.createElement('canvas');
+      sendCanvasRef.current = sendCanvas;
+      sendCanvas.width = Math.round(canvas.width * scale);
+      sendCanvas.height = Math.round(canvas.height * scale);
+      sendCanvas.getContext('2d')?.drawImage(canvas, 0, 0, sendCanvas.width, sendCanvas.height);
+    }
+    const quality = hints ? hints.jpeg_quality / 100 : DEFAULT_JPEG_QUALITY;
+    const imageData = sendCanvas.toDataURL('image/jpeg', quality);
 
     // Send frame to ML server via HTTP POST
     try {
@@ -848,7 +883,12 @@ export default function ExamPage() {
       const response = await fetch(baseUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ frame: imageData }),
+        body: JSON.stringify({
+          frame: imageData,
+          session_id: sessionId,
+          sequence: frameSequenceRef.current,
+          capture_timestamp: captureTimestamp,
+        }),
       });
 
       if (response.ok) {
@@ -856,6 +896,10 @@ export default function ExamPage() {
         
         console.log('[ML Result]', result.success ? '✅' : '❌', `Focus: ${result.focus_score}`);
         
+        if (result.hints) {
+          hintsRef.current = result.hints;
+        }
+
         if (result.success) {
           setCurrentScore(Math.round(result.focus_score));
           setStatus(result.status);
@@ -912,8 +956,11 @@ export default function ExamPage() {
       console.error('[ML analysis error]', error);
     }
 
-    // Continue at 30 FPS
-    setTimeout(captureAndAnalyze, 33);
+    // Continue at the server's target rate (30 FPS until it sends hints)
+    const interval = hintsRef.current && hintsRef.current.target_fps > 0
+      ? 1000 / hintsRef.current.target_fps
+      : DEFAULT_FRAME_INTERVAL;
+    setTimeout(captureAndAnalyze, Math.max(0, interval - (Date.now() - startedAt)));
   };
 
   // Capture and save suspicious snapshot
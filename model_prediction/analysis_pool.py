@@ -0,0 +1,323 @@
+"""
+Worker pool that runs frame decode + analysis off the asyncio event loop
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from focus_monitor import FocusMonitor, FramePayload, SharedModels, decode_frame_payload, fit_to_max_side
+from frame_clock import FrameStamp
+from inference_workers import InferenceWorkers
+from metrics import FocusMetrics, stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Detectors owned by the current worker thread (thread mode). MediaPipe FaceMesh and
+# the YOLO predictor keep internal state and must not be entered from two threads
+# at once, so every worker builds its own set.
+_worker_local = threading.local()
+
+
+def _worker_models(factory: Callable[[], SharedModels] = SharedModels) -> SharedModels:
+    models = getattr(_worker_local, "models", None)
+    if models is None:
+        logger.info("Loading detectors for worker %s", threading.current_thread().name)
+        models = factory()
+        _worker_local.models = models
+    return models
+
+
+def _merge_readiness(workers: List[Dict[str, str]]) -> Dict[str, object]:
+    """Per-detector state across workers: loading while any worker still loads."""
+    merged: Dict[str, object] = {}
+    for name in sorted({name for states in workers for name in states}):
+        states = {states.get(name, "loading") for states in workers}
+        if "loading" in states:
+            merged[name] = "loading"
+        elif states == {"ready"}:
+            merged[name] = "ready"
+        elif "ready" in states:
+            merged[name] = "partial"
+        else:
+            merged[name] = "unavailable"
+    merged["ready"] = bool(workers) and "loading" not in merged.values()
+    merged["workers_reporting"] = len(workers)
+    return merged
+
+
+class AnalysisPool:
+    """
+    Run `FocusMonitor.analyze_frame` on a fixed set of workers.
+
+    mode="thread": each worker thread owns its own detectors; cheap handoff, and
+    OpenCV/onnx/torch release the GIL for the heavy parts.
+    mode="process": encoded frames are sent to dedicated inference processes
+    (InferenceWorkers) that decode and analyse them, sidestepping the GIL entirely.
+    Each session's state stays resident in one process; only a summary comes back.
+    mode="shm": like "process", but frames are decoded and resized here and written
+    into a shared-memory ring that the inference processes read in place.
+
+    When `metrics` is given, every result's `timings` block plus the time the frame
+    waited for a worker (`queue_wait`) is recorded there.
+
+    Workers build their SharedModels on first use; `warm_up` starts all of them up
+    front and `readiness` reports how far their detectors have loaded.
+    """
+
+    def __init__(
+        self,
+        mode: str = "thread",
+        workers: int = 0,
+        models_factory: Callable[[], SharedModels] = SharedModels,
+        metrics: Optional[FocusMetrics] = None,
+        shm_slot_bytes: int = 1920 * 1080 * 3
+    ):
+        if mode not in ("thread", "process", "shm"):
+            raise ValueError(f"Unsupported executor mode: {mode}")
+        self.mode = mode
+        # Process workers receive the factory by pickling, so it must not be a lambda there
+        self._models_factory = models_factory
+        self.metrics = metrics
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self.peak_queue_depth = 0
+        self.submitted_total = 0
+        self.completed_total = 0
+        self.failed_total = 0
+
+        self._worker_model_sets: List[SharedModels] = []
+        self._warm_up_futures: List[Future] = []
+        self._warmed_up = False
+
+        self._inference: Optional[InferenceWorkers] = None
+        self._inference_lock = threading.Lock()
+        self.shm_slot_bytes = shm_slot_bytes
+        if mode in ("process", "shm"):
+            # Dispatcher threads hold each session's lock while its frame is in a process
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers * 2,
+                thread_name_prefix="analysis-dispatch"
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="analysis-worker"
+            )
+        logger.info("Analysis pool started: %s mode, %d workers", self.mode, self.workers)
+
+    def submit(
+        self,
+        monitor: FocusMonitor,
+        payload: FramePayload,
+        frame_stamp: Optional[FrameStamp] = None
+    ) -> "Future[Dict]":
+        """
+        Queue decode + analysis of one frame for `monitor`. `frame_stamp` records when
+        the frame was taken and received, so the wait for a worker does not skew timers.
+        """
+        with self._stats_lock:
+            self.submitted_total += 1
+            self._queued += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, self._queued)
+        job = {
+            "thread": self._run_in_thread,
+            "process": self._run_in_process,
+            "shm": self._run_in_shm,
+        }[self.mode]
+        return self._executor.submit(job, monitor, payload, frame_stamp, time.perf_counter())
+
+    async def analyze(
+        self,
+        monitor: FocusMonitor,
+        payload: FramePayload,
+        frame_stamp: Optional[FrameStamp] = None
+    ) -> Dict:
+        """Awaitable wrapper around `submit` for request handlers."""
+        return await asyncio.wrap_future(self.submit(monitor, payload, frame_stamp))
+
+    def analyze_sync(self, monitor: FocusMonitor, payload: FramePayload) -> Dict:
+        """Blocking wrapper for callers that already run off the event loop."""
+        return self.submit(monitor, payload).result()
+
+    def _run_in_thread(
+        self,
+        monitor: FocusMonitor,
+        payload: FramePayload,
+        frame_stamp: Optional[FrameStamp],
+        submitted_at: float
+    ) -> Dict:
+        queue_wait = self._mark_started(submitted_at)
+        try:
+            timings: Dict[str, float] = {}
+            frame, source_size = decode_frame_payload(payload, monitor.processing_max_side, timings)
+            with monitor.analysis_lock:
+                result = monitor.analyze_frame(
+                    frame,
+                    models=_worker_models(self._build_worker_models),
+                    source_size=source_size,
+                    timings=timings,
+                    frame_stamp=frame_stamp
+                )
+        except BaseException:
+            self._mark_finished(failed=True)
+            raise
+        self._mark_finished(failed=False, result=result, queue_wait=queue_wait)
+        return result
+
+    def _run_in_process(
+        self,
+        monitor: FocusMonitor,
+        payload: FramePayload,
+        frame_stamp: Optional[FrameStamp],
+        submitted_at: float
+    ) -> Dict:
+        with monitor.analysis_lock:
+            queue_wait = self._mark_started(submitted_at)
+            try:
+                result = self._inference_workers().run_payload(monitor, payload, {}, frame_stamp)
+            except BaseException:
+                self._mark_finished(failed=True)
+                raise
+        self._mark_finished(failed=False, result=result, queue_wait=queue_wait)
+        return result
+
+    def _build_worker_models(self) -> SharedModels:
+        models = self._models_factory()
+        with self._stats_lock:
+            self._worker_model_sets.append(models)
+        return models
+
+    def warm_up(self) -> None:
+        """Start every worker so it builds its detectors before the first frame arrives (once)."""
+        with self._stats_lock:
+            if self._warmed_up:
+                return
+            self._warmed_up = True
+        if self.mode in ("process", "shm"):
+            # Inference processes load their detectors at start and report readiness themselves
+            self._inference_workers()
+            return
+        # Each job parks on the barrier until all have started, so none is picked up by an
+        # already-initialised thread and the executor spawns its full complement
+        barrier = threading.Barrier(self.workers)
+
+        def start_worker() -> None:
+            _worker_models(self._build_worker_models)
+            try:
+                barrier.wait(timeout=5.0)
+            except threading.BrokenBarrierError:
+                pass
+
+        for _ in range(self.workers):
+            self._warm_up_futures.append(self._executor.submit(start_worker))
+
+    def readiness(self) -> Dict[str, object]:
+        """Detector readiness merged across workers."""
+        if self.mode in ("process", "shm"):
+            workers = self._inference.worker_readiness() if self._inference is not None else []
+        else:
+            with self._stats_lock:
+                workers = [dict(models.readiness) for models in self._worker_model_sets]
+        return _merge_readiness(workers)
+
+    def release(self, monitor: FocusMonitor) -> None:
+        """Forget a session's state held by inference processes (called on session eviction)."""
+        if self._inference is not None:
+            self._inference.release(monitor.state_id)
+
+    def _inference_workers(self) -> InferenceWorkers:
+        with self._inference_lock:
+            if self._inference is None:
+                # One slot per dispatcher thread, so acquiring a slot never blocks
+                self._inference = InferenceWorkers(
+                    workers=self.workers,
+                    models_factory=self._models_factory,
+                    slots=self.workers * 2,
+                    slot_bytes=self.shm_slot_bytes if self.mode == "shm" else 0
+                )
+            return self._inference
+
+    def _run_in_shm(
+        self,
+        monitor: FocusMonitor,
+        payload: FramePayload,
+        frame_stamp: Optional[FrameStamp],
+        submitted_at: float
+    ) -> Dict:
+        timings: Dict[str, float] = {}
+        try:
+            frame, source_size = decode_frame_payload(payload, monitor.processing_max_side, timings)
+            # Resizing before the copy keeps slot writes small; the worker then has nothing to resize
+            with stage_timer(timings, "resize"):
+                frame = fit_to_max_side(frame, monitor.processing_max_side)
+        except BaseException:
+            self._mark_started(submitted_at)
+            self._mark_finished(failed=True)
+            raise
+        with monitor.analysis_lock:
+            queue_wait = self._mark_started(submitted_at)
+            try:
+                result = self._inference_workers().run(
+                    monitor, frame, source_size, timings, frame_stamp
+                )
+            except BaseException:
+                self._mark_finished(failed=True)
+                raise
+        self._mark_finished(failed=False, result=result, queue_wait=queue_wait)
+        return result
+
+    def _mark_started(self, submitted_at: float) -> float:
+        """Count the frame as active and return how long it waited for a worker (ms)."""
+        with self._stats_lock:
+            self._queued -= 1
+            self._active += 1
+        return (time.perf_counter() - submitted_at) * 1000.0
+
+    def _mark_finished(
+        self,
+        failed: bool,
+        result: Optional[Dict] = None,
+        queue_wait: float = 0.0
+    ) -> None:
+        with self._stats_lock:
+            self._active -= 1
+            if failed:
+                self.failed_total += 1
+            else:
+                self.completed_total += 1
+        if self.metrics is not None:
+            self.metrics.record_frame(failed=failed)
+            if result is not None:
+                self.metrics.observe_timings({**result.get("timings", {}), "queue_wait": queue_wait})
+
+    @property
+    def queue_depth(self) -> int:
+        """Frames waiting for a free worker."""
+        with self._stats_lock:
+            return self._queued
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "queue_depth": self._queued,
+                "active": self._active,
+                "peak_queue_depth": self.peak_queue_depth,
+                "submitted_total": self.submitted_total,
+                "completed_total": self.completed_total,
+                "failed_total": self.failed_total,
+                **(self._inference.stats() if self._inference is not None else {"worker_restarts": 0}),
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._inference is not None:
+            self._inference.shutdown()
@@ -0,0 +1,43 @@
+"""
+Latest-frame-wins handoff between a connection's reader and its analysis task
+"""
+import asyncio
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatestFrameSlot(Generic[T]):
+    """
+    Single-slot mailbox: `put` overwrites any frame that has not been picked up yet,
+    so the consumer always analyses the freshest frame and latency stays bounded by
+    one analysis, no matter how fast the client sends.
+    """
+
+    def __init__(self):
+        self._item: Optional[T] = None
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, item: T) -> None:
+        if self._item is not None:
+            self.dropped += 1
+        self._item = item
+        self.received += 1
+        self._ready.set()
+
+    async def take(self) -> Optional[T]:
+        """Wait for the next frame; returns None once the slot is closed and drained."""
+        while self._item is None:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        item, self._item = self._item, None
+        return item
+
+    def close(self) -> None:
+        self._closed = True
+        self._ready.set()
@@ -0,0 +1,541 @@
+"""
+Offline benchmark for FocusMonitor.analyze_frame.
+
+Replays local video files or deterministic synthetic frame sets through the same
+decode + analyze path the API uses, once per configuration (FaceMesh vs cascade
+fallback, YOLO on/off, input resolution, number of faces). Each configuration runs
+in a fresh process so peak RSS and model state do not leak between runs.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --video exam.mp4 --resolutions 1280x720 --baseline bench.json
+    python benchmark.py --video exam.mp4 --backends facemesh --mesh-every 1,3,5
+
+Synthetic faces are drawn shapes, so detectors mostly exercise their "no face" path;
+pass --face-image with a photo of one face to paste real faces into the frames.
+Exits with status 1 when --baseline is given and a configuration regressed, when
+a --mesh-every > 1 run (experimental landmark tracking) on a --video recording
+deviates from a cold every-frame FaceMesh pass by more than --pose-tolerance /
+--gaze-tolerance or finds no face to compare, when the loop detector's per-frame
+cost at the longest --loop-windows window exceeds the shortest by
+--loop-scaling-tolerance, or when its incremental clustering disagrees with greedy
+clustering of the window from scratch on a drifting scene. Tracking accuracy is only checked on recordings: drawn
+synthetic faces give FaceMesh nothing real to track.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from multiprocessing import get_context
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from device_backends import BACKENDS, DeviceDetectorConfig
+from focus_monitor import FocusMonitor, SharedModels, decode_frame_payload, load_phone_model
+from loop_detector import HashClusterWindow
+from metrics import FocusMetrics
+from scheduling import DetectorSchedule
+
+logger = logging.getLogger("benchmark")
+
+SYNTHETIC_SOURCE = "synthetic"
+POSE_KEYS = ("pitch", "yaw", "roll")
+GAZE_KEYS = ("left_horizontal_ratio", "right_horizontal_ratio", "left_vertical_ratio", "right_vertical_ratio")
+
+
+def _parse_resolution(value: str) -> Tuple[int, int]:
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height)
+
+
+def _face_patch(size: int, face_image: Optional[np.ndarray]) -> np.ndarray:
+    if face_image is not None:
+        return cv2.resize(face_image, (size, size), interpolation=cv2.INTER_AREA)
+    patch = np.zeros((size, size, 3), dtype=np.uint8)
+    center = (size // 2, size // 2)
+    cv2.ellipse(patch, center, (int(size * 0.38), int(size * 0.48)), 0, 0, 360, (120, 160, 205), -1)
+    for dx in (-0.16, 0.16):
+        cv2.circle(patch, (int(size * (0.5 + dx)), int(size * 0.42)), max(2, size // 18), (40, 40, 40), -1)
+    cv2.line(patch, (int(size * 0.38), int(size * 0.7)), (int(size * 0.62), int(size * 0.7)), (60, 60, 140), 2)
+    return patch
+
+
+def synthetic_frames(
+    resolution: Tuple[int, int],
+    faces: int,
+    count: int,
+    seed: int = 0,
+    face_image: Optional[np.ndarray] = None
+) -> Iterator[np.ndarray]:
+    """Deterministic webcam-like frames: static room, gently moving heads, sensor noise."""
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(60, 150, width, dtype=np.float32)
+    background = np.repeat(np.repeat(ramp[None, :, None], height, axis=0), 3, axis=2)
+    background = (background + rng.normal(0, 6, background.shape)).clip(0, 255).astype(np.uint8)
+    size = int(min(height * 0.45, width / (faces + 1)))
+    patch = _face_patch(size, face_image)
+
+    for index in range(count):
+        frame = background.copy()
+        for face in range(faces):
+            cx = width * (face + 1) / (faces + 1) + 12 * np.sin(index / 7.0 + face)
+            cy = height * 0.5 + 8 * np.cos(index / 11.0 + face)
+            x0 = int(np.clip(cx - size / 2, 0, width - size))
+            y0 = int(np.clip(cy - size / 2, 0, height - size))
+            frame[y0:y0 + size, x0:x0 + size] = patch
+        noise = rng.integers(-3, 4, size=(height // 4, width // 4, 1), dtype=np.int16)
+        noise = cv2.resize(noise.astype(np.float32), (width, height), interpolation=cv2.INTER_NEAREST)
+        yield (frame.astype(np.int16) + noise[..., None].astype(np.int16)).clip(0, 255).astype(np.uint8)
+
+
+def video_frames(path: str, resolution: Tuple[int, int], count: int) -> Iterator[np.ndarray]:
+    """Frames of a local video resized to `resolution`, looping the file if it is short."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    produced = 0
+    try:
+        while produced < count:
+            success, frame = capture.read()
+            if not success:
+                if produced == 0:
+                    raise ValueError(f"Video has no readable frames: {path}")
+                capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            yield cv2.resize(frame, resolution, interpolation=cv2.INTER_AREA)
+            produced += 1
+    finally:
+        capture.release()
+
+
+def _encode_frames(frames: Iterator[np.ndarray], quality: int) -> List[bytes]:
+    # Pre-encoded so the timed loop sees what a client would send
+    encoded = []
+    for frame in frames:
+        success, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not success:
+            raise ValueError("JPEG encoding failed")
+        encoded.append(buffer.tobytes())
+    return encoded
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def config_name(config: Dict[str, object]) -> str:
+    width, height = config["resolution"]
+    faces = f"-{config['faces']}f" if config["source"] == SYNTHETIC_SOURCE else ""
+    yolo = "off"
+    if config["yolo"]:
+        backend = config.get("device_backend", "torch")
+        yolo = "on" if backend == "torch" else f"{backend}{'_int8' if config.get('device_int8') else ''}"
+    mesh = f"-mesh{config['mesh_every']}" if config.get("mesh_every", 1) > 1 else ""
+    return (
+        f"{os.path.basename(str(config['source']))}-{config['backend']}{mesh}"
+        f"-yolo_{yolo}-{width}x{height}{faces}"
+    )
+
+
+def tracking_error(
+    tracked: List[Dict[str, float]],
+    reference: List[Dict[str, float]],
+    pose_tolerance: float,
+    gaze_tolerance: float
+) -> Dict[str, object]:
+    """Deviation of tracker-mode pose/gaze from the every-frame FaceMesh run on the same frames."""
+    pairs = [(a, b) for a, b in zip(tracked, reference) if "pitch" in a and "pitch" in b]
+    if not pairs:
+        return {"frames_compared": 0, "within_tolerance": None}
+    pose = np.array([[abs(a[key] - b[key]) for key in POSE_KEYS] for a, b in pairs])
+    gaze = np.array([[abs(a[key] - b[key]) for key in GAZE_KEYS] for a, b in pairs])
+    summary = {
+        name: {"p95": round(float(np.percentile(values, 95)), 4), "max": round(float(values.max()), 4)}
+        for name, values in (("pose_degrees", pose), ("gaze_ratio", gaze))
+    }
+    return {
+        "frames_compared": len(pairs),
+        **summary,
+        "within_tolerance": bool(
+            summary["pose_degrees"]["p95"] <= pose_tolerance and summary["gaze_ratio"]["p95"] <= gaze_tolerance
+        ),
+    }
+
+
+def run_config(config: Dict[str, object]) -> Dict[str, object]:
+    """Run one configuration; intended to execute in its own process."""
+    logging.disable(logging.WARNING)
+    result: Dict[str, object] = {"name": config_name(config), "config": config}
+
+    device_config = DeviceDetectorConfig(
+        backend=config.get("device_backend", "torch"),
+        imgsz=config.get("device_imgsz", 640),
+        int8=config.get("device_int8", False)
+    )
+    phone_model = load_phone_model(device_config) if config["yolo"] else None
+    if config["yolo"] and phone_model is None:
+        return {**result, "skipped": "YOLO weights or ultralytics unavailable"}
+    models = SharedModels(phone_model=phone_model, device_config=device_config)
+    if config["backend"] == "facemesh" and models.face_mesh is None:
+        return {**result, "skipped": "MediaPipe FaceMesh unavailable"}
+    if config["backend"] == "cascade":
+        models.face_mesh = None
+    if not config["yolo"]:
+        models.disable_phone_detection()
+        models.phone_disabled_logged = True
+
+    total = config["frames"] + config["warmup"]
+    face_image = cv2.imread(config["face_image"]) if config.get("face_image") else None
+    if config["source"] == SYNTHETIC_SOURCE:
+        frames = synthetic_frames(config["resolution"], config["faces"], total, config["seed"], face_image)
+    else:
+        frames = video_frames(str(config["source"]), config["resolution"], total)
+    payloads = _encode_frames(frames, config["jpeg_quality"])
+    rss_before = _peak_rss_mb()
+
+    mesh_every = config.get("mesh_every", 1)
+    schedule = DetectorSchedule(mesh_every_n_frames=mesh_every)
+    monitor = FocusMonitor(
+        models=models,
+        schedule=schedule,
+        processing_max_side=config["processing_max_side"]
+    )
+    metrics = FocusMetrics(window=max(1, config["frames"]))
+    details: List[Dict[str, float]] = []
+    started = None
+    for index, payload in enumerate(payloads):
+        if index == config["warmup"]:
+            started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        frame, source_size = decode_frame_payload(payload, monitor.processing_max_side, timings)
+        analysis = monitor.analyze_frame(frame, source_size=source_size, timings=timings)
+        if index >= config["warmup"]:
+            metrics.observe_timings(analysis.get("timings", {}))
+            details.append(dict(monitor.last_focus_details))
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+
+    accuracy = None
+    if mesh_every > 1 and config["backend"] == "facemesh" and config["source"] == SYNTHETIC_SOURCE:
+        accuracy = {"skipped": "landmark tracking is only checked on recorded video (--video)"}
+    elif mesh_every > 1 and config["backend"] == "facemesh":
+        # Untimed reference pass: what the API does without tracking, on its own models
+        reference_models = SharedModels(phone_model=phone_model, device_config=device_config)
+        if not config["yolo"]:
+            reference_models.disable_phone_detection()
+            reference_models.phone_disabled_logged = True
+        reference = FocusMonitor(
+            models=reference_models,
+            schedule=DetectorSchedule(static_gate=False, pose_warm_start=False, mesh_every_n_frames=1),
+            processing_max_side=config["processing_max_side"]
+        )
+        reference_details: List[Dict[str, float]] = []
+        for index, payload in enumerate(payloads):
+            frame, source_size = decode_frame_payload(payload, reference.processing_max_side, {})
+            reference.analyze_frame(frame, source_size=source_size)
+            if index >= config["warmup"]:
+                reference_details.append(dict(reference.last_focus_details))
+        accuracy = tracking_error(details, reference_details, config["pose_tolerance"], config["gaze_tolerance"])
+
+    stages = metrics.snapshot()["stages"]
+    return {
+        **result,
+        "frames": config["frames"],
+        "schedule": asdict(schedule),
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_fps": round(config["frames"] / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            stage: {key: value for key, value in values.items() if key != "count"}
+            for stage, values in stages.items()
+        },
+        "stage_runs": {stage: values["count"] for stage, values in stages.items()},
+        "rss_after_setup_mb": round(rss_before, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        **({"tracking_error": accuracy} if accuracy is not None else {}),
+    }
+
+
+def loop_window_scaling(
+    windows: List[float],
+    fps: float,
+    frames: int,
+    seed: int,
+    tolerance: float
+) -> Dict[str, object]:
+    """
+    Per-frame cost of HashClusterWindow on a moving scene (every hash distinct, so
+    every frame evicts a cluster) once each window is full; it should not grow with
+    the window length.
+    """
+    rng = np.random.default_rng(seed)
+    per_frame: Dict[str, float] = {}
+    for window_seconds in windows:
+        fill = int(window_seconds * fps)
+        hashes = rng.integers(0, 2 ** 63, fill + frames, dtype=np.int64).tolist()
+        window = HashClusterWindow(window_seconds=window_seconds, tolerance_bits=6)
+        for index in range(fill):
+            window.add(index / fps, hashes[index])
+        started = time.perf_counter()
+        for index in range(fill, fill + frames):
+            window.add(index / fps, hashes[index])
+            window.dominant()
+        per_frame[f"{window_seconds:g}"] = round((time.perf_counter() - started) * 1000.0 / frames, 4)
+    costs = list(per_frame.values())
+    ratio = costs[-1] / costs[0] if costs and costs[0] > 0 else 1.0
+    return {
+        "fps": fps,
+        "ms_per_frame": per_frame,
+        "longest_to_shortest": round(ratio, 2),
+        "within_tolerance": ratio <= tolerance,
+    }
+
+
+def _greedy_dominant(entries: List[Tuple[float, int]], tolerance_bits: int) -> Tuple[Tuple[int, float, float], int]:
+    """Reference: greedy clustering of the whole window in arrival order, as analyze_frame once did."""
+    clusters: List[List] = []
+    for timestamp, frame_hash in entries:
+        for cluster in clusters:
+            if (cluster[0] ^ frame_hash).bit_count() <= tolerance_bits:
+                cluster[1] += 1
+                cluster[2] = min(cluster[2], timestamp)
+                cluster[3] = max(cluster[3], timestamp)
+                break
+        else:
+            clusters.append([frame_hash, 1, timestamp, timestamp])
+    dominant = max(clusters, key=lambda cluster: cluster[1])
+    return (dominant[1], dominant[2], dominant[3]), len(clusters)
+
+
+def loop_window_equivalence(window_seconds: float, fps: float, frames: int, seed: int) -> Dict[str, object]:
+    """
+    Replay a scene that drifts one hash bit per second (the case where clusters chain
+    and evictions reshape the whole window) through HashClusterWindow and through the
+    from-scratch reference; the dominant cluster and cluster count must match on every frame.
+    """
+    rng = np.random.default_rng(seed)
+    frame_hash = int(rng.integers(0, 2 ** 63))
+    window = HashClusterWindow(window_seconds=window_seconds, tolerance_bits=6)
+    entries: List[Tuple[float, int]] = []
+    mismatched = 0
+    for index in range(frames):
+        if index % int(fps) == 0:
+            frame_hash ^= 1 << int(rng.integers(0, 64))
+        timestamp = index / fps
+        window.add(timestamp, frame_hash)
+        entries.append((timestamp, frame_hash))
+        while timestamp - entries[0][0] > window_seconds:
+            entries.pop(0)
+        if (window.dominant(), window.cluster_count) != _greedy_dominant(entries, 6):
+            mismatched += 1
+    return {"window_seconds": window_seconds, "frames": frames, "mismatched_frames": mismatched}
+
+
+def build_configs(args: argparse.Namespace) -> List[Dict[str, object]]:
+    sources = args.video or [SYNTHETIC_SOURCE]
+    configs = []
+    for source, backend, yolo, resolution in itertools.product(
+        sources, args.backends, args.yolo, args.resolutions
+    ):
+        face_counts = args.faces if source == SYNTHETIC_SOURCE else [None]
+        # Landmark tracking only exists on the FaceMesh path
+        mesh_cadences = args.mesh_every if backend == "facemesh" else [1]
+        for faces, mesh_every in itertools.product(face_counts, mesh_cadences):
+            configs.append({
+                "source": source,
+                "backend": backend,
+                "mesh_every": mesh_every,
+                "yolo": yolo,
+                "resolution": resolution,
+                "faces": faces,
+                "frames": args.frames,
+                "warmup": args.warmup,
+                "seed": args.seed,
+                "jpeg_quality": args.jpeg_quality,
+                "processing_max_side": args.processing_max_side,
+                "face_image": args.face_image,
+                "device_backend": args.device_backend,
+                "device_imgsz": args.device_imgsz,
+                "device_int8": args.device_int8,
+                "pose_tolerance": args.pose_tolerance,
+                "gaze_tolerance": args.gaze_tolerance,
+            })
+    return configs
+
+
+def compare_to_baseline(
+    results: List[Dict[str, object]],
+    baseline: Dict[str, object],
+    tolerance: float
+) -> List[Dict[str, object]]:
+    """Throughput and p95 total latency of each configuration against the stored run."""
+    previous = {entry["name"]: entry for entry in baseline.get("results", []) if "skipped" not in entry}
+    comparison = []
+    for entry in results:
+        old = previous.get(entry["name"])
+        if old is None or "skipped" in entry:
+            continue
+        old_fps, new_fps = old["throughput_fps"], entry["throughput_fps"]
+        old_p95 = old["latency_ms"].get("analyze_total", {}).get("p95", 0.0)
+        new_p95 = entry["latency_ms"].get("analyze_total", {}).get("p95", 0.0)
+        fps_change = (new_fps - old_fps) / old_fps if old_fps else 0.0
+        p95_change = (new_p95 - old_p95) / old_p95 if old_p95 else 0.0
+        comparison.append({
+            "name": entry["name"],
+            "throughput_fps": {"baseline": old_fps, "current": new_fps, "change": round(fps_change, 4)},
+            "p95_total_ms": {"baseline": old_p95, "current": new_p95, "change": round(p95_change, 4)},
+            "regressed": fps_change < -tolerance or p95_change > tolerance,
+        })
+    return comparison
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--video", action="append", help="local video file (repeatable); default is synthetic frames")
+    parser.add_argument("--face-image", help="photo of one face pasted into synthetic frames")
+    parser.add_argument("--backends", type=lambda v: v.split(","), default=["facemesh", "cascade"])
+    parser.add_argument(
+        "--yolo",
+        type=lambda v: [item == "on" for item in v.split(",")],
+        default=[False, True],
+        help="comma list of on/off"
+    )
+    parser.add_argument(
+        "--resolutions",
+        type=lambda v: [_parse_resolution(item) for item in v.split(",")],
+        default=[(640, 480), (1280, 720), (1920, 1080)]
+    )
+    parser.add_argument("--device-backend", choices=BACKENDS, default="torch", help="YOLO inference backend")
+    parser.add_argument("--device-imgsz", type=int, default=640, help="YOLO input size")
+    parser.add_argument("--device-int8", action="store_true", help="INT8-quantised onnx/openvino model")
+    parser.add_argument("--faces", type=lambda v: [int(item) for item in v.split(",")], default=[1, 2, 3])
+    parser.add_argument(
+        "--mesh-every",
+        type=lambda v: [int(item) for item in v.split(",")],
+        default=[1],
+        help="comma list of FaceMesh cadences; >1 tracks landmarks in between and is checked against every-frame FaceMesh"
+    )
+    parser.add_argument("--pose-tolerance", type=float, default=3.0, help="allowed p95 pose deviation (degrees) when tracking")
+    parser.add_argument("--gaze-tolerance", type=float, default=0.05, help="allowed p95 gaze-ratio deviation when tracking")
+    parser.add_argument(
+        "--loop-windows",
+        type=lambda v: sorted(float(item) for item in v.split(",")),
+        default=[12.0, 60.0, 300.0],
+        help="loop-detector windows (seconds) whose per-frame cost is compared"
+    )
+    parser.add_argument(
+        "--loop-scaling-tolerance",
+        type=float,
+        default=3.0,
+        help="allowed cost ratio of the longest to the shortest loop window"
+    )
+    parser.add_argument("--frames", type=int, default=150, help="timed frames per configuration")
+    parser.add_argument("--warmup", type=int, default=15, help="untimed frames before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jpeg-quality", type=int, default=85)
+    parser.add_argument("--processing-max-side", type=int, default=640, help="0 = analyse at native size")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    configs = build_configs(args)
+    results = []
+    for config in configs:
+        name = config_name(config)
+        logger.info("Running %s", name)
+        # A fresh process per configuration keeps peak RSS and detector state independent
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            entry = executor.submit(run_config, config).result()
+        if "skipped" in entry:
+            logger.info("Skipped %s: %s", name, entry["skipped"])
+        else:
+            logger.info(
+                "%s: %.1f fps, p95 %.1f ms, peak RSS %.0f MB",
+                name,
+                entry["throughput_fps"],
+                entry["latency_ms"].get("analyze_total", {}).get("p95", 0.0),
+                entry["peak_rss_mb"]
+            )
+        results.append(entry)
+
+    report: Dict[str, object] = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    scaling = loop_window_scaling(
+        args.loop_windows,
+        fps=10.0,
+        frames=1000,
+        seed=args.seed,
+        tolerance=args.loop_scaling_tolerance
+    )
+    report["loop_window_scaling"] = scaling
+    logger.info("Loop detector ms/frame by window: %s", scaling["ms_per_frame"])
+    equivalence = loop_window_equivalence(window_seconds=60.0, fps=5.0, frames=1500, seed=args.seed)
+    report["loop_window_equivalence"] = equivalence
+
+    exit_code = 0
+    if not scaling["within_tolerance"]:
+        logger.info("LOOP COST GROWS WITH WINDOW: %s", scaling)
+        exit_code = 1
+    if equivalence["mismatched_frames"]:
+        logger.info("LOOP CLUSTERING DIFFERS FROM GREEDY REFERENCE: %s", equivalence)
+        exit_code = 1
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        comparison = compare_to_baseline(results, baseline, args.tolerance)
+        report["comparison"] = comparison
+        for item in comparison:
+            logger.info(
+                "%s %s: fps %+.1f%%, p95 %+.1f%%",
+                "REGRESSED" if item["regressed"] else "ok",
+                item["name"],
+                100 * item["throughput_fps"]["change"],
+                100 * item["p95_total_ms"]["change"]
+            )
+        if any(item["regressed"] for item in comparison):
+            exit_code = 1
+    for entry in results:
+        accuracy = entry.get("tracking_error", {})
+        if accuracy.get("within_tolerance") is False:
+            logger.info("OUT OF TOLERANCE %s: %s", entry["name"], accuracy)
+            exit_code = 1
+        elif accuracy.get("frames_compared") == 0:
+            logger.info("TRACKING NOT CHECKED %s: no face found in the recording", entry["name"])
+            exit_code = 1
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output + "\n")
+        logger.info("Wrote %s", args.output)
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Configuration management for the focus monitoring service
+"""
+from pydantic_settings import BaseSettings
+from functools import lru_cache
+
+
+class Settings(BaseSettings):
+    """Application settings loaded from environment variables"""
+
+    # Session registry
+    FOCUS_MAX_SESSIONS: int = 256
+    FOCUS_SESSION_IDLE_TIMEOUT: float = 300.0
+
+    # Long side frames are decoded/analysed at (0 = native); overlays map back to client size
+    FOCUS_PROCESSING_MAX_SIDE: int = 640
+    # Include the per-stage `timings` block in every result (clients can also opt in per request)
+    FOCUS_RESULT_TIMINGS: bool = False
+    # `?delta=1` WebSocket streams: full keyframe every N results, changed fields in between
+    FOCUS_DELTA_KEYFRAME_INTERVAL: int = 30
+    # `hints` in every result: target fps, max frame side and JPEG quality from current load
+    FOCUS_CLIENT_HINTS: bool = True
+    FOCUS_HINT_MAX_FPS: float = 10.0
+    FOCUS_HINT_MIN_FPS: float = 1.0
+    FOCUS_HINT_MIN_SIDE: int = 320
+    FOCUS_HINT_MAX_QUALITY: int = 85
+    FOCUS_HINT_MIN_QUALITY: int = 50
+    # Load shedding: node load (1.0 = utilisation target) at which quiet sessions drop to
+    # FaceMesh without YOLO, Haar cascades, and loop detection only; sessions with alerts
+    # in the last FOCUS_SHED_RISK_HOLD_SECONDS stay two tiers richer
+    FOCUS_LOAD_SHEDDING: bool = True
+    FOCUS_SHED_NO_DEVICE_LOAD: float = 1.0
+    FOCUS_SHED_CASCADE_LOAD: float = 1.5
+    FOCUS_SHED_LOOP_ONLY_LOAD: float = 2.5
+    # loop_only still runs a cascade pass every N frames (and on a scene change)
+    FOCUS_SHED_LOOP_ONLY_FULL_EVERY_N_FRAMES: int = 10
+    FOCUS_SHED_RISK_HOLD_SECONDS: float = 60.0
+
+    # Analysis worker pool ("thread" or "process"; 0 workers = one per CPU core)
+    FOCUS_EXECUTOR_MODE: str = "thread"
+    FOCUS_EXECUTOR_WORKERS: int = 0
+    # Size of one shared-memory frame slot in "shm" mode (default fits 1920x1080 BGR)
+    FOCUS_SHM_SLOT_BYTES: int = 1920 * 1080 * 3
+
+    # Detector cadence (1 = every frame); YOLO also runs early on risk triggers
+    FOCUS_DEVICE_EVERY_N_FRAMES: int = 5
+    FOCUS_LOOP_EVERY_N_FRAMES: int = 1
+    FOCUS_SCENE_CHANGE_BITS: int = 14
+    # Haar fallback (no FaceMesh): ROI tracking between full-frame scans
+    FOCUS_CASCADE_FULL_SCAN_EVERY_N_FRAMES: int = 10
+    FOCUS_CASCADE_PARALLEL: bool = False
+    # FaceMesh every N frames; Lucas-Kanade landmark tracking in between (1 = every frame).
+    # Experimental: check it with `benchmark.py --video ... --mesh-every N` before enabling
+    FOCUS_MESH_EVERY_N_FRAMES: int = 1
+    # solvePnP from the previous pose (implied by landmark tracking)
+    FOCUS_POSE_WARM_START: bool = False
+    # Change gate: near-identical frames reuse the last verdict (timers still advance)
+    FOCUS_STATIC_GATE: bool = True
+    FOCUS_STATIC_GATE_BITS: int = 3
+    FOCUS_STATIC_GATE_MEAN_DIFF: float = 2.5
+    FOCUS_STATIC_FULL_EVERY_N_FRAMES: int = 10
+    FOCUS_LOOP_WINDOW_SECONDS: float = 12.0
+    # Session-long replay index size (distinct keyframes, oldest evicted first)
+    FOCUS_REPLAY_MAX_KEYFRAMES: int = 20000
+    # Client capture timestamps further than this behind / ahead of arrival fall back to arrival time
+    FOCUS_CLOCK_MAX_LAG_SECONDS: float = 10.0
+    FOCUS_CLOCK_MAX_LEAD_SECONDS: float = 1.0
+
+    # /webcam/stream analysis rate; 0 = as fast as a worker allows (viewers always get every frame)
+    FOCUS_WEBCAM_ANALYSIS_FPS: float = 0.0
+
+    # Offline analysis of uploaded recordings (0 workers = one per CPU core)
+    FOCUS_OFFLINE_WORKERS: int = 0
+    FOCUS_OFFLINE_SAMPLE_FPS: float = 5.0
+
+    # Device detector: torch, or onnx / openvino (exported from the weights on first start)
+    FOCUS_DEVICE_BACKEND: str = "torch"
+    FOCUS_DEVICE_WEIGHTS: str = "yolov8n.pt"
+    FOCUS_DEVICE_IMGSZ: int = 640
+    FOCUS_DEVICE_INT8: bool = False
+
+    # Per-session timeline files for GET /sessions/{id}/timeline (empty dir = disabled)
+    FOCUS_TIMELINE_DIR: str = ""
+    FOCUS_TIMELINE_BLOCK_ROWS: int = 512
+    FOCUS_TIMELINE_FLUSH_SECONDS: float = 5.0
+    # Sessions not written for this long are deleted (0 = keep forever)
+    FOCUS_TIMELINE_RETENTION_HOURS: float = 72.0
+
+    # Inbound /analyze traffic captured for loadgen.py --replay (empty dir = disabled)
+    FOCUS_CAPTURE_DIR: str = ""
+
+    # Cross-session YOLO micro-batching (thread executor only)
+    FOCUS_DEVICE_BATCHING: bool = True
+    FOCUS_DEVICE_BATCH_SIZE: int = 8
+    FOCUS_DEVICE_BATCH_WAIT_MS: float = 5.0
+
+    class Config:
+        env_file = ".env"
+        case_sensitive = True
+
+
+@lru_cache()
+def get_settings() -> Settings:
+    """Get cached settings instance"""
+    return Settings()
@@ -0,0 +1,130 @@
+"""
+Device detector backends: PyTorch weights, or an exported ONNX / OpenVINO model
+"""
+import logging
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+
+@dataclass
+class DeviceDetectorConfig:
+    """
+    Which YOLO artifact runs device detection. Non-torch backends are exported from
+    `weights` on first use with a dynamic batch dimension (cached next to it, keyed by
+    image size and precision) and executed by ultralytics through onnxruntime or OpenVINO.
+    """
+
+    backend: str = "torch"
+    weights: str = "yolov8n.pt"
+    imgsz: int = 640
+    int8: bool = False
+
+
+def _artifact_path(config: DeviceDetectorConfig) -> str:
+    # Absolute, so every process (API, offline pool, benchmark) resolves the same cache
+    stem, _ = os.path.splitext(os.path.abspath(config.weights))
+    # "dynamic": the batch dimension is free, so DeviceBatcher can stack any number of frames
+    tag = f"{stem}_{config.imgsz}_dynamic{'_int8' if config.int8 else ''}"
+    if config.backend == "onnx":
+        return f"{tag}.onnx"
+    # ultralytics recognises OpenVINO models by this directory suffix
+    return f"{tag}_openvino_model"
+
+
+def _quantize_onnx(source: str, target: str) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(source, target, weight_type=QuantType.QUInt8)
+
+
+def _export(YOLO, config: DeviceDetectorConfig, target: str) -> None:
+    """
+    Export into a private scratch directory next to `target`, then rename into place,
+    so a concurrent loader never sees a half-written artifact and two exporters do
+    not overwrite each other's intermediate files.
+    """
+    logger.info("Exporting %s to %s (imgsz %d, int8 %s)", config.weights, config.backend, config.imgsz, config.int8)
+    # Loading first fetches the weights if they are not on disk yet
+    weights = YOLO(config.weights).ckpt_path or config.weights
+    workdir = tempfile.mkdtemp(prefix=".export-", dir=os.path.dirname(target))
+    try:
+        # ultralytics writes exports next to the weights they came from
+        local_weights = shutil.copy2(weights, workdir)
+        model = YOLO(local_weights)
+        if config.backend == "onnx":
+            exported = model.export(format="onnx", imgsz=config.imgsz, dynamic=True)
+            if config.int8:
+                # ultralytics only quantises for OpenVINO/TFLite; ONNX gets onnxruntime's weight quantisation
+                quantized = os.path.join(workdir, "quantized.onnx")
+                _quantize_onnx(exported, quantized)
+                exported = quantized
+            os.replace(exported, target)
+        else:
+            exported = model.export(format="openvino", imgsz=config.imgsz, dynamic=True, int8=config.int8)
+            try:
+                os.replace(exported, target)
+            except OSError:
+                # Another process finished the same export first; keep its artifact
+                if not os.path.isdir(target):
+                    raise
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _load_exported(YOLO, config: DeviceDetectorConfig):
+    target = _artifact_path(config)
+    if not os.path.exists(target):
+        _export(YOLO, config, target)
+    model = YOLO(target, task="detect")
+    logger.info("Device detector loaded from %s", target)
+    return model
+
+
+def load_device_detector(config: Optional[DeviceDetectorConfig] = None):
+    """
+    Load the configured backend, falling back to the PyTorch weights and finally to
+    None (device detection disabled) when a backend or dependency is unavailable.
+    """
+    config = config or DeviceDetectorConfig()
+    try:
+        # Imported on first load: ultralytics pulls in torch, which dominates startup
+        from ultralytics import YOLO
+    except ImportError:
+        logger.error("ultralytics is not installed. Phone detection disabled.")
+        return None
+
+    if config.backend not in BACKENDS:
+        logger.error("Unknown device detector backend %r; using torch", config.backend)
+    elif config.backend != "torch":
+        try:
+            return _load_exported(YOLO, config)
+        except Exception as backend_error:
+            logger.error(
+                "Device detector backend %s unavailable (%s); falling back to torch",
+                config.backend,
+                backend_error
+            )
+
+    try:
+        model = YOLO(config.weights)
+        logger.info("YOLO model loaded for phone detection")
+        return model
+    except Exception as phone_error:
+        logger.error("Failed to initialize YOLO phone detector: %s", phone_error)
+        logger.error("Phone detection disabled until dependency issue is resolved.")
+        return None
+
+
+def target_class_ids(phone_model, target_names: Iterable[str]) -> List[int]:
+    """Indices of the detector's classes whose names are in `target_names`."""
+    targets = set(target_names)
+    return sorted(
+        int(index) for index, name in phone_model.names.items()
+        if str(name).strip().lower() in targets
+    )
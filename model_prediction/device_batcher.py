@@ -0,0 +1,179 @@
+"""
+Cross-session micro-batching for the YOLO device detector
+"""
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _BatchRequest:
+    __slots__ = ("frame", "options", "future", "enqueued_at")
+
+    def __init__(self, frame: np.ndarray, options: Tuple, future: Future):
+        self.frame = frame
+        self.options = options
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class DeviceBatcher:
+    """
+    Owns one YOLO model and a dispatcher thread. Sessions call `predict` exactly like
+    they would on the model; requests arriving within `max_wait_ms` of each other are
+    stacked into a single batched `predict` call and each caller gets its own result.
+
+    The model comes from `model_loader`, called on the dispatcher thread so that
+    construction returns immediately; `wait_loaded` blocks until it has run.
+    """
+
+    def __init__(
+        self,
+        model_loader: Callable[[], object],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0
+    ):
+        self.model = None
+        self._model_loader = model_loader
+        self._loaded = threading.Event()
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._requests: "queue.Queue[object]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batch_size_histogram: Counter = Counter()
+        self.frames_total = 0
+        self.batches_total = 0
+        self.failed_batches = 0
+        self._queue_wait_total = 0.0
+        self._thread = threading.Thread(target=self._run, name="device-batcher", daemon=True)
+        self._thread.start()
+        logger.info(
+            "Device batcher started: batch size %d, max wait %.1f ms",
+            self.max_batch_size,
+            max_wait_ms
+        )
+
+    @property
+    def names(self) -> Dict[int, str]:
+        return self.model.names
+
+    def wait_loaded(self, timeout: Optional[float] = None) -> bool:
+        """Block until the model loader has run; True when a model is available."""
+        self._loaded.wait(timeout)
+        return self.model is not None
+
+    def predict(self, source: np.ndarray, **kwargs) -> List:
+        """Blocking, YOLO-compatible predict for a single frame."""
+        future: Future = Future()
+        # Options double as the grouping key, so lists (e.g. `classes`) become tuples
+        options = tuple(sorted(
+            (key, tuple(value) if isinstance(value, list) else value)
+            for key, value in kwargs.items()
+        ))
+        self._requests.put(_BatchRequest(source, options, future))
+        return future.result()
+
+    def _collect(self, first: _BatchRequest) -> Tuple[List[_BatchRequest], bool]:
+        batch = [first]
+        stop = False
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self) -> None:
+        try:
+            self.model = self._model_loader()
+        except Exception as load_error:
+            logger.error("Device batcher model failed to load: %s", load_error)
+        finally:
+            self._loaded.set()
+        while True:
+            first = self._requests.get()
+            if first is _STOP:
+                self._fail_pending()
+                return
+            batch, stop = self._collect(first)
+
+            # Requests with different predict options cannot share one call
+            groups: Dict[Tuple, List[_BatchRequest]] = {}
+            for request in batch:
+                groups.setdefault(request.options, []).append(request)
+            for options, requests in groups.items():
+                self._predict_group(options, requests)
+
+            if stop:
+                self._fail_pending()
+                return
+
+    def _predict_group(self, options: Tuple, requests: List[_BatchRequest]) -> None:
+        started = time.perf_counter()
+        try:
+            if self.model is None:
+                raise RuntimeError("Device detector unavailable")
+            results = self.model.predict([request.frame for request in requests], **dict(options))
+        except Exception as inference_error:
+            with self._stats_lock:
+                self.failed_batches += 1
+            for request in requests:
+                request.future.set_exception(inference_error)
+            return
+
+        with self._stats_lock:
+            self.batches_total += 1
+            self.frames_total += len(requests)
+            self.batch_size_histogram[len(requests)] += 1
+            self._queue_wait_total += sum(started - request.enqueued_at for request in requests)
+
+        # ultralytics returns one Results object per input image, in order
+        for request, result in zip(requests, results):
+            request.future.set_result([result])
+
+    def _fail_pending(self) -> None:
+        while True:
+            try:
+                item = self._requests.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, _BatchRequest):
+                item.future.set_exception(RuntimeError("Device batcher stopped"))
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            mean_batch = self.frames_total / self.batches_total if self.batches_total else 0.0
+            mean_wait_ms = 1000.0 * self._queue_wait_total / self.frames_total if self.frames_total else 0.0
+            return {
+                "model_loaded": self._loaded.is_set() and self.model is not None,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._requests.qsize(),
+                "batches_total": self.batches_total,
+                "frames_total": self.frames_total,
+                "failed_batches": self.failed_batches,
+                "mean_batch_size": round(mean_batch, 3),
+                "mean_queue_wait_ms": round(mean_wait_ms, 3),
+                "batch_size_histogram": {
+                    str(size): count for size, count in sorted(self.batch_size_histogram.items())
+                },
+            }
+
+    def shutdown(self, timeout: Optional[float] = 1.0) -> None:
+        self._requests.put(_STOP)
+        self._thread.join(timeout)
@@ -0,0 +1,282 @@
+"""
+Server-driven flow control: send-rate, resolution and JPEG-quality hints for clients
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from scheduling import ANALYSIS_TIERS
+
+# Timing stages that make up what one frame costs a worker
+COST_STAGES = ("base64_decode", "imdecode", "resize", "analyze_total")
+
+
+@dataclass
+class HintLimits:
+    """Bounds of the hints sent to clients."""
+
+    max_fps: float = 10.0
+    min_fps: float = 1.0
+    # Below this rate the client is also asked for smaller, lower-quality frames
+    degrade_below_fps: float = 4.0
+    max_side: int = 640
+    min_side: int = 320
+    max_quality: int = 85
+    min_quality: int = 50
+
+
+class CpuMeter:
+    """Node CPU saturation (0..1) since the previous call, from /proc/stat or the load average."""
+
+    def __init__(self):
+        self._last = self._read()
+
+    @staticmethod
+    def _read() -> Optional[Tuple[float, float]]:
+        try:
+            with open("/proc/stat", "r") as handle:
+                fields = [float(value) for value in handle.readline().split()[1:9]]
+        except (OSError, ValueError):
+            return None
+        # user nice system idle iowait irq softirq steal
+        return sum(fields), fields[3] + fields[4]
+
+    def saturation(self) -> float:
+        current = self._read()
+        if current is None or self._last is None:
+            if not hasattr(os, "getloadavg"):
+                return 0.0
+            return min(1.0, os.getloadavg()[0] / (os.cpu_count() or 1))
+        total = current[0] - self._last[0]
+        idle = current[1] - self._last[1]
+        self._last = current
+        if total <= 0:
+            return 0.0
+        return min(1.0, max(0.0, 1.0 - idle / total))
+
+
+class NodeLoad:
+    """
+    Node load relative to the utilisation target (1.0 = at target): the larger of the
+    analysis backlog per worker and CPU saturation over `target_utilisation`.
+    Sampled at most every `refresh_seconds`. The utilisation target leaves headroom
+    for spikes.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_depth: Callable[[], int],
+        target_utilisation: float = 0.75,
+        refresh_seconds: float = 0.5
+    ):
+        self.workers = max(1, workers)
+        self.target_utilisation = target_utilisation
+        self.refresh_seconds = refresh_seconds
+        self._queue_depth = queue_depth
+        self._cpu = CpuMeter()
+        self._lock = threading.Lock()
+        self._sampled_at = 0.0
+        self.cpu_saturation = 0.0
+        self.backlog = 0.0
+        self.load = 0.0
+
+    def sample(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._sampled_at >= self.refresh_seconds:
+                self._sampled_at = now
+                self.cpu_saturation = self._cpu.saturation()
+                self.backlog = self._queue_depth() / float(self.workers)
+                self.load = max(self.backlog, self.cpu_saturation / self.target_utilisation)
+            return self.load
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "cpu_saturation": round(self.cpu_saturation, 3),
+            "backlog": round(self.backlog, 3),
+            "load": round(self.load, 3),
+        }
+
+
+class _SessionFlow:
+    __slots__ = ("cost_ms", "last_seen", "fps", "scale")
+
+    def __init__(self, cost_ms: float, now: float, limits: HintLimits):
+        self.cost_ms = cost_ms
+        self.last_seen = now
+        self.fps = limits.max_fps
+        self.scale = 1.0
+
+
+class FlowController:
+    """
+    Turns node load into per-session hints. Each active session gets an equal share
+    of `workers * target_utilisation` worker-seconds per second, so its frame rate is
+    that share over its own smoothed per-frame cost; a backlog in the analysis queue
+    or a saturated CPU scales every session down further. Sessions pushed below
+    `degrade_below_fps` are also asked for smaller frames at lower JPEG quality,
+    which cuts decode and upload cost before the rate drops to the floor.
+    Hints move gradually (EWMA) so clients do not oscillate.
+    """
+
+    def __init__(
+        self,
+        node_load: NodeLoad,
+        limits: Optional[HintLimits] = None,
+        active_window: float = 5.0,
+        smoothing: float = 0.3
+    ):
+        self.node_load = node_load
+        self.limits = limits or HintLimits()
+        self.active_window = active_window
+        self.smoothing = smoothing
+        self._sessions: Dict[str, _SessionFlow] = {}
+        self._lock = threading.Lock()
+        self._counted_at = 0.0
+        self.active_sessions = 0
+
+    def _count_active_locked(self, now: float) -> None:
+        if now - self._counted_at < self.node_load.refresh_seconds:
+            return
+        self._counted_at = now
+        for session_id in [key for key, flow in self._sessions.items() if now - flow.last_seen > 6 * self.active_window]:
+            del self._sessions[session_id]
+        self.active_sessions = sum(1 for flow in self._sessions.values() if now - flow.last_seen <= self.active_window)
+
+    def observe(self, session_id: str, timings: Dict[str, float]) -> Dict[str, object]:
+        """Record one analysed frame of `session_id` and return its current hints."""
+        cost_ms = max(1.0, sum(timings.get(stage, 0.0) for stage in COST_STAGES))
+        limits = self.limits
+        load = self.node_load.sample()
+        now = time.monotonic()
+        with self._lock:
+            flow = self._sessions.get(session_id)
+            if flow is None:
+                flow = self._sessions[session_id] = _SessionFlow(cost_ms, now, limits)
+            flow.cost_ms += self.smoothing * (cost_ms - flow.cost_ms)
+            flow.last_seen = now
+            self._count_active_locked(now)
+
+            share_ms = self.node_load.target_utilisation * self.node_load.workers * 1000.0 / max(1, self.active_sessions)
+            fps = share_ms / flow.cost_ms
+            if load > 1.0:
+                fps /= load
+            scale = min(1.0, fps / limits.degrade_below_fps)
+            fps = min(limits.max_fps, max(limits.min_fps, fps))
+            flow.fps += self.smoothing * (fps - flow.fps)
+            flow.scale += self.smoothing * (scale - flow.scale)
+
+            side = limits.min_side + flow.scale * (limits.max_side - limits.min_side)
+            quality = limits.min_quality + flow.scale * (limits.max_quality - limits.min_quality)
+            return {
+                "target_fps": round(flow.fps, 1),
+                # Multiples of 32 keep the hint stable across tiny scale changes
+                "max_side": int(min(limits.max_side, max(limits.min_side, round(side / 32.0) * 32))),
+                "jpeg_quality": int(round(quality / 5.0) * 5),
+            }
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"active_sessions": self.active_sessions, **self.node_load.stats()}
+
+
+class _SessionTier:
+    __slots__ = ("level", "tier", "changed_at", "risky_until", "last_seen")
+
+    def __init__(self, now: float):
+        self.level = 0
+        self.tier = ANALYSIS_TIERS[0]
+        self.changed_at = now
+        self.risky_until = 0.0
+        self.last_seen = now
+
+
+class LoadShedder:
+    """
+    Moves sessions between ANALYSIS_TIERS as node load crosses `thresholds` (the
+    load at which the 2nd, 3rd and 4th tier start). A session's load-driven level
+    moves one tier at a time, no more often than every `min_dwell_seconds`, and
+    only returns to a richer tier once load is `recovery_margin` below the
+    threshold that shed it. Sessions with an alert, a risk-triggered YOLO run or a
+    detected loop within `risk_hold_seconds` run two tiers richer than that level,
+    so the quiet majority is shed first.
+    """
+
+    def __init__(
+        self,
+        node_load: NodeLoad,
+        thresholds: Tuple[float, float, float] = (1.0, 1.5, 2.5),
+        risk_hold_seconds: float = 60.0,
+        min_dwell_seconds: float = 5.0,
+        recovery_margin: float = 0.2
+    ):
+        if len(thresholds) != len(ANALYSIS_TIERS) - 1:
+            raise ValueError(f"Expected {len(ANALYSIS_TIERS) - 1} load thresholds")
+        self.node_load = node_load
+        self.thresholds = tuple(thresholds)
+        self.risk_hold_seconds = risk_hold_seconds
+        self.min_dwell_seconds = min_dwell_seconds
+        self.recovery_margin = recovery_margin
+        self._sessions: Dict[str, _SessionTier] = {}
+        self._lock = threading.Lock()
+        self.transitions_total = 0
+
+    @staticmethod
+    def _is_risky(result: Dict) -> bool:
+        if result.get("alerts"):
+            return True
+        # Cadence and first-frame runs are routine; any other reason is a risk trigger
+        if result.get("device_check", {}).get("reason") not in (None, "cadence", "first_frame"):
+            return True
+        if result.get("tier_escalation") == "scene_change":
+            return True
+        return bool(result.get("loop_detection", {}).get("detected"))
+
+    def _load_level(self, load: float, current: int) -> int:
+        level = sum(1 for threshold in self.thresholds if load >= threshold)
+        if level < current and load >= self.thresholds[current - 1] - self.recovery_margin:
+            return current
+        return level
+
+    def tier_for(self, session_id: str, result: Dict) -> str:
+        """Tier for the session's next frame, given the result of its latest one."""
+        load = self.node_load.sample()
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                self._forget_idle_locked(now)
+                session = self._sessions[session_id] = _SessionTier(now)
+            session.last_seen = now
+            if self._is_risky(result):
+                session.risky_until = now + self.risk_hold_seconds
+
+            target = self._load_level(load, session.level)
+            if target != session.level and now - session.changed_at >= self.min_dwell_seconds:
+                session.level += 1 if target > session.level else -1
+                session.changed_at = now
+            level = max(0, session.level - 2) if now < session.risky_until else session.level
+            tier = ANALYSIS_TIERS[level]
+            if tier != session.tier:
+                session.tier = tier
+                self.transitions_total += 1
+            return tier
+
+    def _forget_idle_locked(self, now: float) -> None:
+        idle = [key for key, session in self._sessions.items() if now - session.last_seen > 300.0]
+        for key in idle:
+            del self._sessions[key]
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            sessions = {tier: 0 for tier in ANALYSIS_TIERS}
+            for session in self._sessions.values():
+                sessions[session.tier] += 1
+            return {
+                "sessions_by_tier": sessions,
+                "transitions_total": self.transitions_total,
+                **self.node_load.stats(),
+            }
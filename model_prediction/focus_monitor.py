@@ -0,0 +1,1459 @@
+"""
+Focus monitoring core: shared detectors, per-session FocusMonitor state and frame decoding
+"""
+
+import cv2
+import numpy as np
+import base64
+import binascii
+import time
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from device_backends import DeviceDetectorConfig, load_device_detector, target_class_ids
+from frame_clock import FrameClock, FrameStamp
+from landmark_tracker import LandmarkTracker
+from loop_detector import HashClusterWindow
+from metrics import stage_timer
+from replay_index import HashSequenceIndex
+from scheduling import ANALYSIS_TIERS, DetectorSchedule, DetectorScheduler
+
+logger = logging.getLogger(__name__)
+
+BytesLike = Union[bytes, bytearray, memoryview]
+# What a client sends for one frame: base64 text, encoded image bytes, or an already decoded image
+FramePayload = Union[str, BytesLike, np.ndarray]
+
+
+def load_phone_model(config: Optional[DeviceDetectorConfig] = None):
+    """Load the YOLO device detector, or return None when it is unavailable."""
+    return load_device_detector(config)
+
+
+def load_face_mesh():
+    """Build and warm up MediaPipe FaceMesh, or return None when it is unavailable."""
+    try:
+        # Imported here rather than at module load: it is optional and slow to import
+        import mediapipe as mp
+    except ImportError:
+        logger.warning("mediapipe is not installed; using the Haar cascade fallback")
+        return None
+    try:
+        # Static image mode: one instance serves many sessions (and offline segments),
+        # so landmarks must not be tracked over from whatever frame it processed last
+        face_mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=True,
+            max_num_faces=3,
+            refine_landmarks=True,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+        face_mesh.process(np.zeros((240, 320, 3), dtype=np.uint8))
+        logger.info("MediaPipe FaceMesh initialized")
+        return face_mesh
+    except Exception as mesh_error:
+        logger.warning(f"MediaPipe FaceMesh unavailable: {mesh_error}")
+        return None
+
+
+def phone_target_classes(phone_model, default: Set[str]) -> Set[str]:
+    """Class names of the detector that correspond to handheld devices."""
+    model_names = {
+        name.strip().lower()
+        for _, name in phone_model.names.items()
+    }
+    dynamic_targets = {
+        name for name in model_names
+        if "phone" in name or "remote" in name
+    }
+    return dynamic_targets or set(default)
+
+
+class SharedModels:
+    """
+    Heavy detectors loaded once per analysis worker and shared by every session it serves.
+    None of them keeps state between frames (FaceMesh runs in static image mode), so
+    interleaved sessions cannot see each other's faces.
+    Pass `phone_model` to reuse a device detector owned elsewhere (e.g. a DeviceBatcher)
+    instead of loading YOLO weights for this worker; `device_config` picks the backend
+    and input size either way. With `parallel_cascades` the two profile passes of a
+    full cascade scan overlap the frontal pass on helper threads. With
+    `background_load` only the cascades load inline; FaceMesh and YOLO load and warm
+    up on a helper thread and are picked up by the analysis as they become ready.
+    """
+
+    def __init__(
+        self,
+        phone_model=None,
+        parallel_cascades: bool = False,
+        device_config: Optional[DeviceDetectorConfig] = None,
+        background_load: bool = False
+    ):
+        self.face_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+        self.eye_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_eye.xml'
+        )
+        self.profile_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_profileface.xml'
+        )
+
+        # OpenCV releases the GIL inside detectMultiScale, but a classifier is not
+        # re-entrant, so the mirrored profile pass gets its own instance
+        self.cascade_executor: Optional[ThreadPoolExecutor] = None
+        self.profile_cascade_mirrored = self.profile_cascade
+        if parallel_cascades:
+            self.profile_cascade_mirrored = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_profileface.xml'
+            )
+            self.cascade_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cascade")
+
+        device_config = device_config or DeviceDetectorConfig()
+        self.face_mesh = None
+        self.phone_model = None
+        self.phone_target_classes = {"cell phone", "remote"}
+        self.phone_class_ids: Optional[List[int]] = None
+        self.phone_imgsz = device_config.imgsz
+        self.phone_detection_enabled = False
+        self.phone_disabled_logged = False
+
+        # "loading", "ready" or "unavailable" per detector; until FaceMesh is ready
+        # frames take the cascade path, and device detection reports nothing
+        self.readiness: Dict[str, str] = {
+            "cascades": "ready",
+            "face_mesh": "loading",
+            "device_detector": "loading",
+        }
+        self.loaded = threading.Event()
+        if background_load:
+            threading.Thread(
+                target=self._load_optional_models,
+                args=(phone_model, device_config),
+                name="model-loader",
+                daemon=True
+            ).start()
+        else:
+            self._load_optional_models(phone_model, device_config)
+
+    def _load_optional_models(self, phone_model, device_config: DeviceDetectorConfig) -> None:
+        face_mesh = load_face_mesh()
+        self.face_mesh = face_mesh
+        self.readiness["face_mesh"] = "ready" if face_mesh is not None else "unavailable"
+
+        if phone_model is None:
+            phone_model = load_phone_model(device_config)
+        elif hasattr(phone_model, "wait_loaded") and not phone_model.wait_loaded():
+            # A DeviceBatcher whose model failed to load
+            phone_model = None
+        if phone_model is not None:
+            self.phone_target_classes = phone_target_classes(phone_model, self.phone_target_classes)
+            # Restricting NMS to the device classes skips post-processing of the other 78
+            self.phone_class_ids = target_class_ids(phone_model, self.phone_target_classes) or None
+            try:
+                phone_model.predict(
+                    np.zeros((self.phone_imgsz, self.phone_imgsz, 3), dtype=np.uint8),
+                    classes=self.phone_class_ids,
+                    conf=0.3,
+                    imgsz=self.phone_imgsz,
+                    verbose=False
+                )
+            except Exception as warmup_error:
+                logger.warning("Device detector warm-up failed: %s", warmup_error)
+            self.phone_model = phone_model
+            logger.info(
+                "Phone detection enabled; target classes: %s",
+                ", ".join(sorted(self.phone_target_classes))
+            )
+            self.phone_detection_enabled = True
+        self.readiness["device_detector"] = "ready" if self.phone_detection_enabled else "unavailable"
+
+        self.loaded.set()
+        logger.info("Shared models initialized successfully")
+
+    def disable_phone_detection(self) -> None:
+        """Turn off YOLO for every session after an unrecoverable inference error."""
+        self.phone_detection_enabled = False
+        self.phone_model = None
+        self.readiness["device_detector"] = "unavailable"
+
+
+class FocusMonitor:
+    """
+    Per-session focus state. Detectors come from a SharedModels instance that is
+    either bound once at construction or passed per call by a worker that owns it.
+    """
+
+    # Attributes that belong to the worker rather than to the session state
+    _TRANSIENT_ATTRS = ("models", "analysis_lock")
+    # Settings the front end changes between frames; sent along with each remote frame
+    _CONTROL_ATTRS = ("processing_max_side", "analysis_tier")
+    # Outputs read between frames (stats, overlays, timelines); returned by a remote
+    # worker that keeps the full state resident
+    _SUMMARY_ATTRS = (
+        "focus_score",
+        "current_state",
+        "away_timer",
+        "last_status_text",
+        "last_face_box",
+        "last_pupil_points",
+        "last_head_pose",
+        "last_device_boxes",
+        "last_focus_details",
+        "last_additional_face_boxes",
+        "device_presence_score",
+        "loop_detection_state",
+    )
+    
+    def __init__(
+        self,
+        models: Optional[SharedModels] = None,
+        schedule: Optional[DetectorSchedule] = None,
+        loop_window_seconds: float = 12.0,
+        replay_max_keyframes: int = 20_000,
+        processing_max_side: int = 0,
+        clock_max_lag_seconds: float = 10.0,
+        clock_max_lead_seconds: float = 1.0
+    ):
+        self.models: Optional[SharedModels] = models
+        # Identifies this session's state in worker processes that keep it resident
+        self.state_id = uuid.uuid4().hex
+        # Frames are analysed with their long side capped here (0 = native size);
+        # overlay coordinates are scaled back to the client's frame size
+        self.processing_max_side = processing_max_side
+        self._output_scale = 1.0
+        # Per-stage wall time (ms) of the frame being analysed, returned as result["timings"]
+        self._timings: Dict[str, float] = {}
+        # Timeline position of the current frame; wall-clock time unless the caller supplies one
+        self._frame_time: Optional[float] = None
+        # Maps client capture timestamps of stamped frames onto that timeline
+        self.frame_clock = FrameClock(clock_max_lag_seconds, clock_max_lead_seconds)
+        self._clock_info: Optional[Dict[str, object]] = None
+        self.scheduler = DetectorScheduler(schedule)
+        # One of ANALYSIS_TIERS; a load-shedding controller may lower it between frames
+        self.analysis_tier = "full"
+        self._device_check: Dict[str, object] = {"ran": False, "reason": None}
+        # Inputs of the last full verdict and the scale it was drawn at, for static-frame reuse
+        self._last_verdict: Optional[Tuple[float, str, str, List[str], int, int]] = None
+        self._verdict_output_scale = 1.0
+        # Serialises analysis of one session when frames arrive on several workers
+        self.analysis_lock = threading.Lock()
+        
+        self.focus_score = 100.0
+        self.current_state = "focused"
+        self.away_timer = 0.0
+        self.away_start_time = None
+        self.last_status_text = ""
+
+        # Cache for drawing overlays and temporal smoothing
+        self.last_face_box: Optional[Tuple[int, int, int, int]] = None
+        self.last_pupil_points: List[Tuple[int, int]] = []
+        self.last_head_pose: Optional[Dict[str, object]] = None
+        self.last_device_boxes: List[np.ndarray] = []
+        self.last_focus_details: Dict[str, float] = {}
+        self.last_additional_face_boxes: List[Tuple[int, int, int, int]] = []
+        # (x, y, w, h) of the single frontal face the cascade fallback is tracking
+        self._cascade_track: Optional[Tuple[int, int, int, int]] = None
+        # FaceMesh tracker mode: landmarks carried between mesh runs and the last
+        # solvePnP pose (rotation, translation) used as the next extrinsic guess
+        self._landmark_tracker = LandmarkTracker()
+        self._pose_guess: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._metric_cache: Dict[str, float] = {}
+        self.device_presence_score: float = 0.0
+
+        # Rolling frame hash history for loop detection
+        self._loop_window = HashClusterWindow(window_seconds=loop_window_seconds, tolerance_bits=6)
+        # Session-long keyframe index for clips replayed minutes apart
+        self._replay_index = HashSequenceIndex(max_keyframes=replay_max_keyframes)
+        self._loop_detection_score: float = 0.0
+        self.loop_detection_state: Dict[str, object] = {
+            "detected": False,
+            "confidence": 0.0,
+            "hash_reuse_ratio": 0.0,
+            "samples_considered": 0,
+            "window_seconds": 0.0,
+            "dominant_cluster_frames": 0,
+            "dominant_cluster_duration": 0.0,
+            "unique_cluster_count": 0,
+            "last_updated": 0.0,
+            "last_hash": None,
+            **self._replay_index.state(),
+        }
+
+    def _detect_handheld_devices(self, frame: np.ndarray) -> bool:
+        """Detect handheld electronic devices using the YOLO model when available."""
+        models = self.models
+        if not models.phone_detection_enabled or models.phone_model is None:
+            if not models.phone_disabled_logged and models.readiness["device_detector"] != "loading":
+                logger.warning("Phone detection disabled; YOLO unavailable.")
+                models.phone_disabled_logged = True
+            self.last_device_boxes = []
+            self.device_presence_score = self._smooth_metric(
+                "device_presence",
+                0.0,
+                alpha=0.2,
+                max_delta=0.2
+            )
+            return False
+
+        previous_boxes = list(self.last_device_boxes)
+        self.last_device_boxes = []
+
+        try:
+            results = models.phone_model.predict(
+                frame,
+                classes=models.phone_class_ids,
+                conf=0.3,
+                imgsz=models.phone_imgsz,
+                verbose=False
+            )
+        except Exception as inference_error:
+            logger.error("Phone detection inference failed: %s", inference_error)
+            message = str(inference_error).lower()
+            if "numpy is not available" in message or "numpy" in message:
+                if not models.phone_disabled_logged:
+                    logger.error(
+                        "Disabling YOLO phone detection: dependency issue detected (%s).",
+                        inference_error
+                    )
+                    models.phone_disabled_logged = True
+                models.disable_phone_detection()
+            self.last_device_boxes = []
+            self.device_presence_score = self._smooth_metric(
+                "device_presence",
+                0.0,
+                alpha=0.2,
+                max_delta=0.2
+            )
+            return False
+
+        detections: List[Tuple[float, np.ndarray]] = []
+        for result in results:
+            boxes = result.boxes if hasattr(result, "boxes") else []
+            for box in boxes:
+                cls_index = int(box.cls[0])
+                class_name = str(result.names.get(cls_index, "")).strip().lower()
+                if class_name not in models.phone_target_classes:
+                    continue
+                conf = float(box.conf[0])
+                if conf < 0.3:
+                    continue
+                xyxy = box.xyxy[0].cpu().numpy()
+                x1, y1, x2, y2 = xyxy
+                rect_points = np.array(
+                    [
+                        [int(x1), int(y1)],
+                        [int(x2), int(y1)],
+                        [int(x2), int(y2)],
+                        [int(x1), int(y2)],
+                    ],
+                    dtype=np.int32
+                )
+                detections.append((conf, self._to_client(rect_points)))
+
+        detections.sort(key=lambda item: item[0], reverse=True)
+
+        if detections:
+            self.last_device_boxes = [pts for _, pts in detections[:3]]
+        elif self.device_presence_score > 0.4 and previous_boxes:
+            self.last_device_boxes = previous_boxes
+
+        raw_presence = detections[0][0] if detections else 0.0
+        self.device_presence_score = self._smooth_metric(
+            "device_presence",
+            raw_presence,
+            alpha=0.3,
+            max_delta=0.3
+        )
+
+        if not detections and self.device_presence_score < 0.2:
+            self.last_device_boxes = []
+
+        return self.device_presence_score >= 0.4
+    
+    @staticmethod
+    def _compute_frame_hash(gray_frame: np.ndarray) -> int:
+        """
+        Compute a perceptual hash (dHash) for a grayscale frame.
+        Downscales to 9x8 and compares neighbouring pixels to capture structure.
+        """
+        if gray_frame is None or gray_frame.size == 0:
+            return 0
+        try:
+            resized = cv2.resize(gray_frame, (9, 8), interpolation=cv2.INTER_AREA)
+        except Exception:
+            return 0
+        diff = resized[:, 1:] > resized[:, :-1]
+        packed = np.packbits(diff.astype(np.uint8), axis=None)
+        return int.from_bytes(packed.tobytes(), byteorder="big", signed=False)
+
+    def _update_loop_detector(self, gray_frame: np.ndarray, frame_hash: Optional[int] = None) -> None:
+        """
+        Track frame hashes in a sliding window and estimate whether the stream is looping.
+        """
+        timestamp = self._now()
+        if frame_hash is None:
+            frame_hash = self._compute_frame_hash(gray_frame)
+
+        window_seconds = self._loop_window.window_seconds
+        min_samples = 45
+
+        # Trims by time and keeps the greedy hash clusters up to date incrementally
+        self._loop_window.add(timestamp, frame_hash)
+        sample_count = len(self._loop_window)
+        replay_run = self._replay_index.add(timestamp, frame_hash)
+        replay_state = self._replay_index.state()
+
+        if sample_count < min_samples:
+            self.loop_detection_state.update({
+                "detected": replay_run is not None,
+                "confidence": 1.0 if replay_run is not None else 0.0,
+                "hash_reuse_ratio": 0.0,
+                "samples_considered": sample_count,
+                "window_seconds": window_seconds,
+                "dominant_cluster_frames": 0,
+                "dominant_cluster_duration": 0.0,
+                "unique_cluster_count": sample_count,
+                "last_updated": timestamp,
+                "last_hash": frame_hash,
+                **replay_state,
+            })
+            # Gently decay score when insufficient evidence
+            self._loop_detection_score *= 0.92
+            self._loop_detection_score = max(0.0, min(1.0, self._loop_detection_score))
+            return
+
+        dominant_count, dominant_first_seen, dominant_last_seen = self._loop_window.dominant()
+
+        reuse_ratio = dominant_count / float(sample_count)
+        dominant_duration = float(dominant_last_seen - dominant_first_seen)
+        unique_cluster_count = self._loop_window.cluster_count
+
+        raw_confidence = max(0.0, min(1.0, (reuse_ratio - 0.6) / 0.35))
+        if dominant_duration < 3.0:
+            raw_confidence = 0.0
+
+        # Smooth confidence over time to dampen noise
+        self._loop_detection_score = (
+            0.85 * self._loop_detection_score + 0.15 * raw_confidence
+        )
+        self._loop_detection_score = max(0.0, min(1.0, self._loop_detection_score))
+        stable_detected = self._loop_detection_score >= 0.6 and raw_confidence > 0.0
+
+        confidence = float(self._loop_detection_score if stable_detected else raw_confidence)
+        if replay_run is not None:
+            # A repeated sequence is direct evidence, independent of the short window
+            confidence = 1.0
+
+        self.loop_detection_state.update({
+            "detected": stable_detected or replay_run is not None,
+            "confidence": confidence,
+            "hash_reuse_ratio": reuse_ratio,
+            "samples_considered": sample_count,
+            "window_seconds": window_seconds,
+            "dominant_cluster_frames": dominant_count,
+            "dominant_cluster_duration": dominant_duration,
+            "unique_cluster_count": unique_cluster_count,
+            "last_updated": timestamp,
+            "last_hash": frame_hash,
+            **replay_state,
+        })
+
+    
+    def _smooth_metric(
+        self,
+        key: str,
+        value: float,
+        alpha: float = 0.3,
+        max_delta: Optional[float] = None
+    ) -> float:
+        """Exponentially smooth noisy metric values to stabilise UI feedback."""
+        if not np.isfinite(value):
+            return self._metric_cache.get(key, 0.0)
+        previous = self._metric_cache.get(key)
+        if previous is None or not np.isfinite(previous):
+            smoothed = value
+        else:
+            smoothed = previous + alpha * (value - previous)
+            if max_delta is not None:
+                delta = smoothed - previous
+                if delta > max_delta:
+                    smoothed = previous + max_delta
+                elif delta < -max_delta:
+                    smoothed = previous - max_delta
+        self._metric_cache[key] = smoothed
+        return smoothed
+
+    def _reset_pose_history(self) -> None:
+        """Clear cached pose/gaze metrics when tracking is unavailable."""
+        for metric_key in [
+            "pose_pitch",
+            "pose_yaw",
+            "pose_roll",
+            "gaze_left_h",
+            "gaze_right_h",
+            "gaze_left_v",
+            "gaze_right_v",
+        ]:
+            self._metric_cache.pop(metric_key, None)
+        self.last_head_pose = None
+        self.last_pupil_points = []
+        self._landmark_tracker.clear()
+        self._pose_guess = None
+
+    @staticmethod
+    def _rotation_to_euler(rotation_matrix: np.ndarray) -> Tuple[float, float, float]:
+        """
+        Convert a rotation matrix into pitch, yaw, roll angles in degrees.
+        Pitch: positive looking down, Yaw: positive turning right, Roll: positive clockwise tilt.
+        """
+        r = rotation_matrix
+        sy = np.sqrt(r[0, 0] ** 2 + r[1, 0] ** 2)
+        singular = sy < 1e-6
+
+        if not singular:
+            pitch = np.degrees(np.arctan2(-r[2, 0], sy))
+            yaw = np.degrees(np.arctan2(r[1, 0], r[0, 0]))
+            roll = np.degrees(np.arctan2(r[2, 1], r[2, 2]))
+        else:
+            pitch = np.degrees(np.arctan2(-r[2, 0], sy))
+            yaw = np.degrees(np.arctan2(-r[0, 1], r[1, 1]))
+            roll = 0.0
+
+        return pitch, yaw, roll
+
+    
+    def __getstate__(self) -> Dict[str, object]:
+        state = self.__dict__.copy()
+        for attr in self._TRANSIENT_ATTRS:
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.__dict__.update(state)
+        self.models = None
+        self.analysis_lock = threading.Lock()
+
+    def load_state(self, other: "FocusMonitor") -> None:
+        """Adopt the session state of a copy analysed elsewhere (e.g. in a worker process)."""
+        self.__dict__.update(other.__getstate__())
+
+    def controls(self) -> Dict[str, object]:
+        return {attr: getattr(self, attr) for attr in self._CONTROL_ATTRS}
+
+    def summary(self) -> Dict[str, object]:
+        return {attr: getattr(self, attr) for attr in self._SUMMARY_ATTRS}
+
+    def apply(self, values: Dict[str, object]) -> None:
+        """Take over controls or a summary produced by `controls` / `summary` elsewhere."""
+        self.__dict__.update(values)
+
+    def analyze_frame(
+        self,
+        frame: np.ndarray,
+        models: Optional[SharedModels] = None,
+        source_size: Optional[Tuple[int, int]] = None,
+        timings: Optional[Dict[str, float]] = None,
+        frame_time: Optional[float] = None,
+        frame_stamp: Optional[FrameStamp] = None
+    ) -> Dict:
+        """
+        Analyze a single frame and return focus metrics with head pose and gaze tracking.
+        `source_size` is the (width, height) the client sent when `frame` was already
+        decoded at reduced size; overlay coordinates are reported in that space.
+        `timings` carries stages measured before the call (e.g. decode) into the
+        result's per-stage `timings` block. `frame_time` (seconds) replaces the wall
+        clock for away timers and loop detection, e.g. when replaying a recording
+        faster than real time. `frame_stamp` (arrival time, client capture timestamp,
+        sequence) places a live frame on the session's timeline through `frame_clock`,
+        so time spent queued or batched does not count; how the time was derived is
+        reported as result["clock"]. `analysis_tier` selects how much of the pipeline runs;
+        the tier actually used is reported as result["analysis_tier"].
+        """
+        started = time.perf_counter()
+        if models is not None:
+            self.models = models
+        elif self.models is None:
+            self.models = SharedModels()
+
+        if frame is None or frame.size == 0:
+            return self._error_response("Invalid frame")
+
+        self._timings = dict(timings or {})
+        self._frame_time = frame_time
+        self._clock_info = None
+        if frame_time is None and frame_stamp is not None:
+            self._frame_time, self._clock_info = self.frame_clock.place(frame_stamp)
+        with stage_timer(self._timings, "resize"):
+            frame = self._fit_processing_size(frame, source_size)
+
+        previous_details = self.last_focus_details
+
+        with stage_timer(self._timings, "cvt_color"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        with stage_timer(self._timings, "frame_hash"):
+            frame_hash = self._compute_frame_hash(gray)
+        if self.scheduler.should_run_loop_detector():
+            with stage_timer(self._timings, "loop_detector"):
+                self._update_loop_detector(gray, frame_hash)
+
+        # A still scene keeps the last verdict; overlays are already in client space
+        with stage_timer(self._timings, "change_gate"):
+            thumbnail = self._gate_thumbnail(gray)
+            reuse = (
+                self._last_verdict is not None
+                and self._output_scale == self._verdict_output_scale
+                and self.scheduler.static_reuse(frame_hash, thumbnail)
+            )
+        tier = self.analysis_tier if self.analysis_tier in ANALYSIS_TIERS else "full"
+        escalation = None
+        if tier == "loop_only":
+            # The carried verdict goes stale: refresh it on cadence or as soon as the scene moves
+            escalation = "first_frame" if self._last_verdict is None else self.scheduler.loop_only_escalation(frame_hash)
+            if escalation is not None:
+                tier = "cascade"
+                reuse = False
+        if reuse or tier == "loop_only":
+            result = self._reuse_last_verdict()
+            result["analysis_tier"] = tier
+            result["tier_escalation"] = None
+            self._timings["analyze_total"] = (time.perf_counter() - started) * 1000.0
+            result["timings"] = {stage: round(value, 3) for stage, value in self._timings.items()}
+            return result
+
+        self.last_face_box = None
+        self.last_pupil_points = []
+        self.last_head_pose = None
+        self.last_focus_details = {}
+        self.last_additional_face_boxes = []
+
+        # YOLO is the expensive stage: run it on cadence or when a cheap signal looks risky
+        device_reason = None
+        if tier == "full":
+            device_reason = self.scheduler.device_run_reason(
+                frame_hash,
+                previous_details,
+                self.device_presence_score
+            )
+        if device_reason is not None:
+            with stage_timer(self._timings, "device_detection"):
+                device_detected = self._detect_handheld_devices(frame)
+            self.scheduler.mark_device_run(frame_hash, previous_details.get("faces_detected"))
+        else:
+            # Carry the last boxes and smoothed presence forward untouched
+            device_detected = self.device_presence_score >= 0.4
+            self.scheduler.mark_device_skipped()
+        self._device_check = {
+            "ran": device_reason is not None,
+            "reason": device_reason
+        }
+
+        result = None
+        if self.models.face_mesh is not None and tier in ("full", "no_device"):
+            try:
+                result = self._analyze_with_face_mesh(frame, gray, device_detected)
+            except Exception as mesh_error:
+                logger.error(f"Face mesh analysis failed: {mesh_error}", exc_info=True)
+
+        if result is None:
+            result = self._analyze_with_cascades(frame, gray, device_detected)
+        self._scale_overlays_to_client()
+        self.scheduler.mark_full_analysis(frame_hash, thumbnail)
+        self._verdict_output_scale = self._output_scale
+        result["reused"] = False
+        result["analysis_tier"] = tier
+        result["tier_escalation"] = escalation
+
+        self._timings["analyze_total"] = (time.perf_counter() - started) * 1000.0
+        result["timings"] = {stage: round(value, 3) for stage, value in self._timings.items()}
+        return result
+
+    def _gate_thumbnail(self, gray: np.ndarray) -> Optional[np.ndarray]:
+        if self.scheduler.schedule.static_gate_mean_diff <= 0:
+            return None
+        return cv2.resize(gray, (32, 24), interpolation=cv2.INTER_AREA)
+
+    def _reuse_last_verdict(self) -> Dict:
+        """Re-emit the last full verdict; only timers, smoothing and loop state advance."""
+        self.scheduler.mark_reused()
+        self.scheduler.mark_device_skipped()
+        self._device_check = {"ran": False, "reason": None}
+        frame_score, status_text, new_state, alerts, faces_detected, eyes_detected = self._last_verdict
+        result = self._finalize_result(
+            frame_score=frame_score,
+            status_text=status_text,
+            new_state=new_state,
+            alerts=list(alerts),
+            faces_detected=faces_detected,
+            eyes_detected=eyes_detected
+        )
+        result["reused"] = True
+        return result
+
+    def _now(self) -> float:
+        return self._frame_time if self._frame_time is not None else time.time()
+
+    def _fit_processing_size(
+        self,
+        frame: np.ndarray,
+        source_size: Optional[Tuple[int, int]]
+    ) -> np.ndarray:
+        """Downscale once to the processing size and remember the factor back to client space."""
+        source_long_side = max(source_size) if source_size else max(frame.shape[:2])
+        frame = fit_to_max_side(frame, self.processing_max_side)
+        self._output_scale = source_long_side / float(max(frame.shape[:2]))
+        return frame
+
+    def _to_client(self, points: np.ndarray) -> np.ndarray:
+        """Map pixel coordinates from the processing frame to the client's frame."""
+        return np.round(np.asarray(points, dtype=np.float64) * self._output_scale).astype(np.int32)
+
+    def _scale_overlays_to_client(self) -> None:
+        # Device boxes are mapped where they are detected, since they outlive a frame
+        if self._output_scale == 1.0:
+            return
+        if self.last_face_box is not None:
+            self.last_face_box = tuple(int(v) for v in self._to_client(self.last_face_box))
+        self.last_additional_face_boxes = [
+            tuple(int(v) for v in self._to_client(box)) for box in self.last_additional_face_boxes
+        ]
+        self.last_pupil_points = [
+            tuple(int(v) for v in self._to_client(point)) for point in self.last_pupil_points
+        ]
+        pose = self.last_head_pose
+        if pose is not None:
+            if pose.get("origin") is not None:
+                pose["origin"] = tuple(int(v) for v in self._to_client(pose["origin"]))
+            if pose.get("axis_points") is not None:
+                pose["axis_points"] = self._to_client(pose["axis_points"])
+
+    def _analyze_with_face_mesh(
+        self,
+        frame: np.ndarray,
+        gray: np.ndarray,
+        device_detected: bool
+    ) -> Optional[Dict]:
+        height, width = frame.shape[:2]
+        tracking = self.scheduler.mesh_tracking
+        landmark_points = None
+        mesh_reason = self.scheduler.mesh_run_reason(self._landmark_tracker.active) if tracking else None
+        if tracking and mesh_reason is None:
+            with stage_timer(self._timings, "landmark_tracking"):
+                landmark_points = self._landmark_tracker.track(gray)
+            if landmark_points is None:
+                mesh_reason = "drift"
+            else:
+                self.scheduler.mark_mesh_tracked()
+                self.last_face_box = self._landmark_tracker.face_box
+                self.last_additional_face_boxes = list(self._landmark_tracker.additional_face_boxes)
+        if landmark_points is None:
+            landmark_points = self._detect_mesh_landmarks(frame)
+            if landmark_points is None:
+                self._landmark_tracker.clear()
+                self._pose_guess = None
+                return None
+            if tracking:
+                self.scheduler.mark_mesh_run()
+                self._landmark_tracker.reset(
+                    gray,
+                    landmark_points,
+                    self.last_face_box,
+                    self.last_additional_face_boxes
+                )
+        result = self._score_landmarks(landmark_points, width, height, device_detected)
+        result["face_mesh_check"] = {"ran": not tracking or mesh_reason is not None, "reason": mesh_reason}
+        return result
+
+    def _detect_mesh_landmarks(self, frame: np.ndarray) -> Optional[np.ndarray]:
+        """Run FaceMesh; returns the primary face's pixel landmarks and sets the face boxes."""
+        height, width = frame.shape[:2]
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with stage_timer(self._timings, "face_mesh"):
+            results = self.models.face_mesh.process(rgb)
+
+        if not results.multi_face_landmarks:
+            return None
+
+        multi_face_boxes: List[Tuple[int, int, int, int]] = []
+        primary_landmarks = None
+        landmark_points = None
+
+        face_candidates: List[Tuple[float, Tuple[int, int, int, int], np.ndarray, object]] = []
+
+        for face_landmarks in results.multi_face_landmarks:
+            points = np.array(
+                [(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark],
+                dtype=np.float64
+            )
+            points[:, 0] *= width
+            points[:, 1] *= height
+            points[:, 2] *= width  # approximate depth scaling
+
+            min_x = int(max(np.min(points[:, 0]), 0))
+            min_y = int(max(np.min(points[:, 1]), 0))
+            max_x = int(min(np.max(points[:, 0]), width - 1))
+            max_y = int(min(np.max(points[:, 1]), height - 1))
+
+            center = ((min_x + max_x) / 2.0, (min_y + max_y) / 2.0)
+            frame_center = (width / 2.0, height / 2.0)
+            center_distance = np.linalg.norm(np.array(center) - np.array(frame_center))
+
+            face_area = (max_x - min_x) * (max_y - min_y)
+            frame_area = width * height
+            area_ratio = face_area / max(frame_area, 1)
+
+            center_score = max(0.0, 1.0 - center_distance / max(width, height))
+            area_score = min(max(area_ratio / 0.15, 0.0), 1.0)
+            combined_score = 0.6 * center_score + 0.4 * area_score
+
+            face_candidates.append((combined_score, (min_x, min_y, max_x, max_y), points, face_landmarks))
+
+        if not face_candidates:
+            return None
+
+        face_candidates.sort(key=lambda item: item[0], reverse=True)
+        best_score, best_box, best_points, best_landmarks = face_candidates[0]
+        landmark_points = best_points
+        primary_landmarks = best_landmarks
+        self.last_face_box = best_box
+
+        for _, box, points, landmarks in face_candidates[1:]:
+            multi_face_boxes.append(box)
+
+        if landmark_points is None:
+            return None
+
+        self.last_additional_face_boxes = multi_face_boxes
+        return landmark_points
+
+    def _score_landmarks(
+        self,
+        landmark_points: np.ndarray,
+        width: int,
+        height: int,
+        device_detected: bool
+    ) -> Dict:
+        def _pt(idx: int) -> np.ndarray:
+            return landmark_points[idx, :2].copy()
+
+        left_eye_outer = _pt(33)
+        left_eye_inner = _pt(133)
+        left_eye_top = _pt(159)
+        left_eye_bottom = _pt(145)
+        right_eye_outer = _pt(263)
+        right_eye_inner = _pt(362)
+        right_eye_top = _pt(386)
+        right_eye_bottom = _pt(374)
+        left_pupil = _pt(468)
+        right_pupil = _pt(473)
+
+        clamp_min = np.array([0, 0], dtype=int)
+        clamp_max = np.array([width - 1, height - 1], dtype=int)
+
+        left_pupil_clamped = np.clip(np.round(left_pupil).astype(int), clamp_min, clamp_max)
+        right_pupil_clamped = np.clip(np.round(right_pupil).astype(int), clamp_min, clamp_max)
+
+        self.last_pupil_points = [
+            (int(left_pupil_clamped[0]), int(left_pupil_clamped[1])),
+            (int(right_pupil_clamped[0]), int(right_pupil_clamped[1]))
+        ]
+
+        faces_detected = 1 + len(self.last_additional_face_boxes)
+
+        def _ratio(center: np.ndarray, a: np.ndarray, b: np.ndarray) -> float:
+            denom = (b[0] - a[0])
+            if abs(denom) < 1e-3:
+                return 0.5
+            return float((center[0] - a[0]) / denom)
+
+        def _vertical_ratio(center: np.ndarray, top: np.ndarray, bottom: np.ndarray) -> float:
+            denom = (bottom[1] - top[1])
+            if abs(denom) < 1e-3:
+                return 0.5
+            return float((center[1] - top[1]) / denom)
+
+        left_horizontal_ratio = _ratio(left_pupil, left_eye_inner, left_eye_outer)
+        right_horizontal_ratio = _ratio(right_pupil, right_eye_inner, right_eye_outer)
+        left_vertical_ratio = _vertical_ratio(left_pupil, left_eye_top, left_eye_bottom)
+        right_vertical_ratio = _vertical_ratio(right_pupil, right_eye_top, right_eye_bottom)
+
+        left_horizontal_ratio = self._smooth_metric("gaze_left_h", left_horizontal_ratio, alpha=0.35, max_delta=0.08)
+        right_horizontal_ratio = self._smooth_metric("gaze_right_h", right_horizontal_ratio, alpha=0.35, max_delta=0.08)
+        left_vertical_ratio = self._smooth_metric("gaze_left_v", left_vertical_ratio, alpha=0.35, max_delta=0.08)
+        right_vertical_ratio = self._smooth_metric("gaze_right_v", right_vertical_ratio, alpha=0.35, max_delta=0.08)
+
+        pose_indices = [1, 152, 33, 263, 61, 291]
+        face_3d = landmark_points[pose_indices].astype(np.float64)
+        face_2d = face_3d[:, :2].astype(np.float64)
+
+        focal_length = width
+        center = (width / 2, height / 2)
+        camera_matrix = np.array([
+            [focal_length, 0, center[0]],
+            [0, focal_length, center[1]],
+            [0, 0, 1]
+        ], dtype=np.float64)
+        dist_coeffs = np.zeros((4, 1), dtype=np.float64)
+
+        with stage_timer(self._timings, "head_pose"):
+            if self._pose_guess is not None:
+                # A few iterations from the last pose instead of a fresh solve
+                success, rotation_vec, translation_vec = cv2.solvePnP(
+                    face_3d,
+                    face_2d,
+                    camera_matrix,
+                    dist_coeffs,
+                    self._pose_guess[0].copy(),
+                    self._pose_guess[1].copy(),
+                    useExtrinsicGuess=True,
+                    flags=cv2.SOLVEPNP_ITERATIVE
+                )
+            else:
+                success, rotation_vec, translation_vec = cv2.solvePnP(
+                    face_3d,
+                    face_2d,
+                    camera_matrix,
+                    dist_coeffs,
+                    flags=cv2.SOLVEPNP_ITERATIVE
+                )
+        if self.scheduler.pose_warm_start:
+            self._pose_guess = (rotation_vec, translation_vec) if success else None
+
+        raw_pitch = raw_yaw = raw_roll = 0.0
+        axis_points_2d: Optional[np.ndarray] = None
+        origin_point: Optional[Tuple[int, int]] = None
+
+        if success:
+            rotation_matrix, _ = cv2.Rodrigues(rotation_vec)
+            raw_pitch, raw_yaw, raw_roll = self._rotation_to_euler(rotation_matrix)
+
+            nose_3d = face_3d[0]
+            nose_2d = face_2d[0]
+
+            axis = np.array([
+                [0.0, 0.0, 0.0],
+                [60.0, 0.0, 0.0],
+                [0.0, 60.0, 0.0],
+                [0.0, 0.0, 60.0]
+            ], dtype=np.float64)
+            with stage_timer(self._timings, "head_pose"):
+                axis_points, _ = cv2.projectPoints(
+                    axis,
+                    rotation_vec,
+                    translation_vec,
+                    camera_matrix,
+                    dist_coeffs
+                )
+            axis_points_2d = axis_points.reshape(-1, 2).astype(int)
+            origin_point = tuple(np.clip(np.round(nose_2d).astype(int), [0, 0], [width - 1, height - 1]))
+            self.last_head_pose = {
+                "angles": (raw_pitch, raw_yaw, raw_roll),
+                "origin": origin_point,
+                "axis_points": axis_points_2d
+            }
+        else:
+            self.last_head_pose = None
+
+        if success:
+            pitch = self._smooth_metric("pose_pitch", raw_pitch, alpha=0.2, max_delta=5.0)
+            yaw = self._smooth_metric("pose_yaw", raw_yaw, alpha=0.2, max_delta=5.0)
+            roll = self._smooth_metric("pose_roll", raw_roll, alpha=0.2, max_delta=5.0)
+        else:
+            pitch = self._metric_cache.get("pose_pitch", 0.0) * 0.9
+            yaw = self._metric_cache.get("pose_yaw", 0.0) * 0.9
+            roll = self._metric_cache.get("pose_roll", 0.0) * 0.9
+            self._metric_cache["pose_pitch"] = pitch
+            self._metric_cache["pose_yaw"] = yaw
+            self._metric_cache["pose_roll"] = roll
+
+        if self.last_head_pose is not None:
+            self.last_head_pose["angles"] = (pitch, yaw, roll)
+
+        frame_score = 100.0
+        alerts: List[str] = []
+        status_parts: List[str] = []
+        new_state = "focused"
+
+        if faces_detected > 1:
+            alerts.append(f"multiple_faces:{faces_detected}")
+            status_parts.append(f"{faces_detected} faces detected")
+            frame_score = max(frame_score - min(30.0 * (faces_detected - 1), 70.0), 0.0)
+            new_state = "away"
+
+        pitch_deviation = max(0.0, abs(pitch) - 8.0)
+        yaw_deviation = max(0.0, abs(yaw) - 10.0)
+        roll_deviation = max(0.0, abs(roll) - 12.0)
+
+        frame_score -= min(pitch_deviation * 1.1, 30.0)
+        frame_score -= min(yaw_deviation * 1.1, 30.0)
+        frame_score -= min(roll_deviation * 0.75, 18.0)
+
+        if abs(pitch) > 28.0:
+            alerts.append(f"head_pitch:{pitch:.1f}")
+            status_parts.append("Head pitched")
+            new_state = "away"
+        if abs(yaw) > 32.0:
+            alerts.append(f"head_yaw:{yaw:.1f}")
+            status_parts.append("Looking sideways")
+            new_state = "away"
+        if abs(roll) > 28.0:
+            alerts.append(f"head_roll:{roll:.1f}")
+            status_parts.append("Head tilted")
+
+        horizontal_soft_bounds = (0.34, 0.66)
+        horizontal_hard_bounds = (0.27, 0.73)
+        vertical_soft_bounds = (0.37, 0.63)
+        vertical_hard_bounds = (0.30, 0.70)
+
+        horizontal_soft_ok = (
+            horizontal_soft_bounds[0] <= left_horizontal_ratio <= horizontal_soft_bounds[1] and
+            horizontal_soft_bounds[0] <= right_horizontal_ratio <= horizontal_soft_bounds[1]
+        )
+        horizontal_hard_violation = (
+            left_horizontal_ratio < horizontal_hard_bounds[0] or
+            left_horizontal_ratio > horizontal_hard_bounds[1] or
+            right_horizontal_ratio < horizontal_hard_bounds[0] or
+            right_horizontal_ratio > horizontal_hard_bounds[1]
+        )
+
+        vertical_soft_ok = (
+            vertical_soft_bounds[0] <= left_vertical_ratio <= vertical_soft_bounds[1] and
+            vertical_soft_bounds[0] <= right_vertical_ratio <= vertical_soft_bounds[1]
+        )
+        vertical_hard_violation = (
+            left_vertical_ratio < vertical_hard_bounds[0] or
+            left_vertical_ratio > vertical_hard_bounds[1] or
+            right_vertical_ratio < vertical_hard_bounds[0] or
+            right_vertical_ratio > vertical_hard_bounds[1]
+        )
+
+        if horizontal_hard_violation:
+            frame_score -= 22.0
+            alerts.append("gaze_horizontal_off")
+            status_parts.append("Eyes off-center")
+            new_state = "away"
+        elif not horizontal_soft_ok:
+            frame_score -= 10.0
+            status_parts.append("Eyes drifting sideways")
+
+        if vertical_hard_violation:
+            frame_score -= 18.0
+            alerts.append("gaze_vertical_off")
+            status_parts.append("Eyes off-vertical")
+            new_state = "away"
+        elif not vertical_soft_ok:
+            frame_score -= 8.0
+            status_parts.append("Eyes drifting up/down")
+
+        gaze_ok = horizontal_soft_ok and vertical_soft_ok
+
+        if gaze_ok and new_state == "focused" and not status_parts:
+            status_parts.append("Focused on screen")
+        elif not status_parts:
+            status_parts.append("Analyzing")
+
+        if device_detected:
+            frame_score = max(frame_score - 40.0, 0.0)
+            if "device_detected" not in alerts:
+                alerts.append("device_detected")
+            status_parts.append("Device detected")
+            new_state = "away"
+
+        frame_score = max(0.0, min(100.0, frame_score))
+        alerts = list(dict.fromkeys(alerts))
+
+        status_text = " | ".join(status_parts)
+        status_text = f"{status_text} | pitch:{pitch:.1f}° yaw:{yaw:.1f}° roll:{roll:.1f}°"
+
+        self.last_focus_details = {
+            "pitch": pitch,
+            "yaw": yaw,
+            "roll": roll,
+            "left_horizontal_ratio": left_horizontal_ratio,
+            "right_horizontal_ratio": right_horizontal_ratio,
+            "left_vertical_ratio": left_vertical_ratio,
+            "right_vertical_ratio": right_vertical_ratio,
+            "gaze_ok": gaze_ok,
+            "device_presence": self.device_presence_score,
+            "faces_detected": faces_detected,
+            "multi_face_count": faces_detected
+        }
+
+        return self._finalize_result(
+            frame_score=frame_score,
+            status_text=status_text,
+            new_state=new_state,
+            alerts=alerts,
+            faces_detected=faces_detected,
+            eyes_detected=2
+        )
+
+    def _analyze_with_cascades(
+        self,
+        frame: np.ndarray,
+        gray: np.ndarray,
+        device_detected: bool
+    ) -> Dict:
+        self._reset_pose_history()
+
+        # Search around the tracked face; fall back to full-frame passes on cadence or loss
+        faces: Sequence[Tuple[int, int, int, int]] = []
+        profile_faces_right: Sequence[Tuple[int, int, int, int]] = []
+        profile_faces_left: Sequence[Tuple[int, int, int, int]] = []
+        scan_reason = self.scheduler.cascade_scan_reason(self._cascade_track is not None)
+        with stage_timer(self._timings, "cascades"):
+            if scan_reason is None:
+                faces = self._track_cascade_face(gray)
+                if len(faces) == 0:
+                    scan_reason = "face_lost"
+            if scan_reason is None:
+                self.scheduler.mark_cascade_tracked()
+            else:
+                faces, profile_faces_right, profile_faces_left = self._full_cascade_scan(gray)
+                self.scheduler.mark_cascade_full_scan()
+        # Only a lone face is tracked; several faces keep the full scan running
+        self._cascade_track = tuple(int(v) for v in faces[0]) if len(faces) == 1 else None
+
+        additional_boxes: List[Tuple[int, int, int, int]] = []
+
+        profile_faces_left_adjusted = []
+        for (x, y, w, h) in profile_faces_left:
+            x_adjusted = frame.shape[1] - x - w
+            profile_faces_left_adjusted.append((x_adjusted, y, w, h))
+
+        frame_score = 10.0
+        status_text = "No face detected"
+        new_state = "away"
+        alerts: List[str] = []
+        eyes_detected = 0
+
+        if len(faces) > 0:
+            face_candidates: List[Tuple[float, Tuple[int, int, int, int]]] = []
+            frame_center = (frame.shape[1] / 2.0, frame.shape[0] / 2.0)
+
+            for (fx, fy, fw, fh) in faces:
+                cx = fx + fw / 2.0
+                cy = fy + fh / 2.0
+                center_distance = np.linalg.norm(np.array([cx, cy]) - np.array(frame_center))
+                face_area = fw * fh
+                frame_area = frame.shape[0] * frame.shape[1]
+                area_ratio = face_area / max(frame_area, 1)
+
+                center_score = max(0.0, 1.0 - center_distance / max(frame.shape[1], frame.shape[0]))
+                area_score = min(max(area_ratio / 0.15, 0.0), 1.0)
+                combined_score = 0.6 * center_score + 0.4 * area_score
+
+                face_candidates.append((combined_score, (fx, fy, fw, fh)))
+
+            face_candidates.sort(key=lambda item: item[0], reverse=True)
+
+            best_score, (x, y, w, h) = face_candidates[0]
+            self.last_face_box = (x, y, x + w, y + h)
+
+            for _, (fx, fy, fw, fh) in face_candidates[1:]:
+                additional_boxes.append((fx, fy, fx + fw, fy + fh))
+
+            self.last_additional_face_boxes = additional_boxes
+            roi_gray = gray[y:y + h, x:x + w]
+
+            with stage_timer(self._timings, "cascades"):
+                eyes = self.models.eye_cascade.detectMultiScale(
+                    roi_gray,
+                    scaleFactor=1.05,
+                    minNeighbors=3,
+                    minSize=(10, 10)
+                )
+            eyes_detected = len(eyes)
+
+            self.last_pupil_points = []
+            for (ex, ey, ew, eh) in eyes[:2]:
+                eye_center = (x + ex + ew // 2, y + ey + eh // 2)
+                self.last_pupil_points.append(eye_center)
+
+            frame_score = 65.0
+            status_text = "Face detected - limited tracking"
+            new_state = "focused"
+
+            if len(eyes) >= 2:
+                frame_score += 15.0
+            elif len(eyes) == 1:
+                frame_score += 5.0
+            else:
+                frame_score -= 10.0
+                alerts.append("eyes_not_detected")
+
+        elif len(profile_faces_right) > 0 or len(profile_faces_left_adjusted) > 0:
+            frame_score = 15.0
+            new_state = "away"
+            status_text = "Profile detected - looking away"
+            if len(profile_faces_right) > 0:
+                alerts.append("looking_right")
+            if len(profile_faces_left_adjusted) > 0:
+                alerts.append("looking_left")
+            self.last_additional_face_boxes = []
+        else:
+            alerts.append("no_face")
+            self.last_additional_face_boxes = []
+
+        faces_detected_total = max(len(faces), 0)
+        if faces_detected_total > 1:
+            alerts.append(f"multiple_faces:{faces_detected_total}")
+            status_text = f"{faces_detected_total} faces detected"
+            frame_score = max(frame_score - min(30.0 * (faces_detected_total - 1), 70.0), 0.0)
+            new_state = "away"
+
+        if device_detected:
+            frame_score = max(frame_score - 35.0, 0.0)
+            status_text = "Device detected"
+            if "device_detected" not in alerts:
+                alerts.append("device_detected")
+            new_state = "away"
+
+        frame_score = max(0.0, min(100.0, frame_score))
+        alerts = list(dict.fromkeys(alerts))
+
+        self.last_focus_details = {
+            "device_presence": self.device_presence_score,
+            "faces_detected": faces_detected_total,
+            "eyes_detected": eyes_detected,
+            "multi_face_count": faces_detected_total
+        }
+
+        return self._finalize_result(
+            frame_score=frame_score,
+            status_text=status_text,
+            new_state=new_state,
+            alerts=alerts,
+            faces_detected=faces_detected_total,
+            eyes_detected=eyes_detected
+        )
+
+    def _track_cascade_face(self, gray: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """Run the frontal cascade on an expanded region around the tracked face."""
+        x, y, w, h = self._cascade_track
+        margin = self.scheduler.schedule.cascade_roi_margin
+        x0 = max(0, int(x - margin * w))
+        y0 = max(0, int(y - margin * h))
+        x1 = min(gray.shape[1], int(x + w + margin * w))
+        y1 = min(gray.shape[0], int(y + h + margin * h))
+        found = self.models.face_cascade.detectMultiScale(
+            gray[y0:y1, x0:x1], scaleFactor=1.1, minNeighbors=5, minSize=(80, 80)
+        )
+        return [(fx + x0, fy + y0, fw, fh) for (fx, fy, fw, fh) in found]
+
+    def _full_cascade_scan(self, gray: np.ndarray) -> Tuple[Sequence, Sequence, Sequence]:
+        """Frontal, profile and mirrored-profile passes over the whole frame."""
+        models = self.models
+        gray_flipped = cv2.flip(gray, 1)
+        if models.cascade_executor is not None:
+            right_job = models.cascade_executor.submit(
+                models.profile_cascade.detectMultiScale,
+                gray, scaleFactor=1.1, minNeighbors=5, minSize=(80, 80)
+            )
+            left_job = models.cascade_executor.submit(
+                models.profile_cascade_mirrored.detectMultiScale,
+                gray_flipped, scaleFactor=1.1, minNeighbors=5, minSize=(80, 80)
+            )
+            faces = models.face_cascade.detectMultiScale(
+                gray, scaleFactor=1.1, minNeighbors=5, minSize=(80, 80)
+            )
+            return faces, right_job.result(), left_job.result()
+
+        faces = models.face_cascade.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(80, 80)
+        )
+        profile_faces_right = models.profile_cascade.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(80, 80)
+        )
+        profile_faces_left = models.profile_cascade.detectMultiScale(
+            gray_flipped, scaleFactor=1.1, minNeighbors=5, minSize=(80, 80)
+        )
+        return faces, profile_faces_right, profile_faces_left
+
+    def _finalize_result(
+        self,
+        frame_score: float,
+        status_text: str,
+        new_state: str,
+        alerts: List[str],
+        faces_detected: int,
+        eyes_detected: int
+    ) -> Dict:
+        started = time.perf_counter()
+        self._last_verdict = (frame_score, status_text, new_state, list(alerts), faces_detected, eyes_detected)
+        current_time = self._now()
+        if new_state == "away":
+            if self.away_start_time is None:
+                self.away_start_time = current_time
+            self.away_timer = current_time - self.away_start_time
+            if self.away_timer >= 5.0 and "away_5_seconds" not in alerts:
+                alerts.append("away_5_seconds")
+        else:
+            self.away_start_time = None
+            self.away_timer = 0.0
+
+        alerts = list(dict.fromkeys(alerts))
+
+        self.focus_score = 0.7 * frame_score + 0.3 * self.focus_score
+        self.current_state = new_state
+        self.last_status_text = status_text
+
+        loop_state = dict(self.loop_detection_state)
+        if loop_state.get("detected") and "looping_video" not in alerts:
+            alerts.append("looping_video")
+        alerts = list(dict.fromkeys(alerts))
+
+        result = {
+            "success": True,
+            "focus_score": round(self.focus_score, 2),
+            "raw_frame_score": round(frame_score, 2),
+            "status": status_text,
+            "state": new_state,
+            "away_timer": round(self.away_timer, 2),
+            "alerts": alerts,
+            "faces_detected": faces_detected,
+            "eyes_detected": eyes_detected,
+            "loop_detection": loop_state,
+            "device_check": dict(self._device_check),
+            "timestamp": current_time
+        }
+        if self._clock_info is not None:
+            result["clock"] = dict(self._clock_info)
+        self._timings["finalize"] = (time.perf_counter() - started) * 1000.0
+        return result
+    
+    
+    def _error_response(self, message: str) -> Dict:
+        return {
+            "success": False,
+            "error": message,
+            "focus_score": 0.0,
+            "status": "ERROR",
+            "state": "unknown",
+            "timestamp": time.time()
+        }
+
+
+def decode_base64_frame(frame_payload: str) -> np.ndarray:
+    """
+    Decode a base64 encoded frame string into an OpenCV BGR image.
+    Raises ValueError with a clear message when decoding fails.
+    """
+    return decode_image_bytes(decode_base64_bytes(frame_payload))
+
+
+def decode_base64_bytes(frame_payload: str) -> bytes:
+    """Strip an optional data-URL prefix and base64-decode the encoded image bytes."""
+    if frame_payload is None:
+        raise ValueError("Missing frame data")
+    
+    base64_part = frame_payload.split(",")[-1].strip()
+    if not base64_part:
+        raise ValueError("Empty frame data")
+    
+    try:
+        frame_bytes = base64.b64decode(base64_part, validate=True)
+    except (binascii.Error, ValueError) as exc:
+        raise ValueError("Invalid base64 frame data") from exc
+    
+    if not frame_bytes:
+        raise ValueError("Decoded frame is empty")
+    
+    return frame_bytes
+
+
+# libjpeg can decode straight to 1/2, 1/4 or 1/8 size, skipping most of the IDCT work
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_dimensions(frame_bytes: BytesLike) -> Optional[Tuple[int, int]]:
+    """(width, height) from a JPEG or PNG header without decoding pixels; None if unknown."""
+    data = memoryview(frame_bytes).cast("B")
+    if len(data) >= 24 and bytes(data[:8]) == b"\x89PNG\r\n\x1a\n":
+        return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[offset + 5:offset + 7], "big")
+            width = int.from_bytes(data[offset + 7:offset + 9], "big")
+            return width, height
+        offset += 2 + int.from_bytes(data[offset + 2:offset + 4], "big")
+    return None
+
+
+def decode_image_bytes(frame_bytes: BytesLike, max_side: int = 0) -> np.ndarray:
+    """
+    Decode raw JPEG/WebP/PNG bytes into an OpenCV BGR image without intermediate copies.
+    With `max_side`, large images are decoded at the smallest 1/2, 1/4 or 1/8 scale
+    whose long side still covers `max_side`.
+    Raises ValueError with a clear message when decoding fails.
+    """
+    nparr = np.frombuffer(frame_bytes, np.uint8)
+    if nparr.size == 0:
+        raise ValueError("Decoded frame buffer is empty")
+    
+    flags = cv2.IMREAD_COLOR
+    dimensions = image_dimensions(frame_bytes) if max_side else None
+    if dimensions is not None:
+        long_side = max(dimensions)
+        for factor, reduced_flag in _REDUCED_DECODE_FLAGS:
+            if long_side // factor >= max_side:
+                flags = reduced_flag
+                break
+    
+    frame = cv2.imdecode(nparr, flags)
+    if frame is None:
+        raise ValueError("Failed to decode frame as image")
+    
+    return frame
+
+
+def fit_to_max_side(frame: np.ndarray, max_side: int) -> np.ndarray:
+    """Downscale (INTER_AREA) so the long side is at most `max_side`; 0 keeps the frame."""
+    height, width = frame.shape[:2]
+    long_side = max(width, height)
+    if not max_side or long_side <= max_side:
+        return frame
+    ratio = max_side / float(long_side)
+    return cv2.resize(
+        frame,
+        (max(1, round(width * ratio)), max(1, round(height * ratio))),
+        interpolation=cv2.INTER_AREA
+    )
+
+
+def decode_frame_payload(
+    payload: Union[str, BytesLike, np.ndarray],
+    max_side: int = 0,
+    timings: Optional[Dict[str, float]] = None
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Turn whatever a transport handed us into a BGR frame, decoded no larger than
+    needed for `max_side`, plus the (width, height) the client actually sent.
+    Decode stage durations (ms) are added to `timings` when given.
+    """
+    if isinstance(payload, np.ndarray):
+        return payload, (payload.shape[1], payload.shape[0])
+    if not isinstance(payload, (bytes, bytearray, memoryview)):
+        with stage_timer(timings, "base64_decode"):
+            payload = decode_base64_bytes(payload)
+    with stage_timer(timings, "imdecode"):
+        frame = decode_image_bytes(payload, max_side=max_side)
+    source_size = image_dimensions(payload) if max_side else None
+    return frame, source_size or (frame.shape[1], frame.shape[0])
@@ -0,0 +1,119 @@
+"""
+Per-session frame timeline built from client capture timestamps and sequence numbers
+"""
+import math
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+_SEQUENCE_MODULUS = 1 << 32
+
+
+class FrameStamp(NamedTuple):
+    """What the server knows about when a frame was taken, recorded as it arrives."""
+
+    # Server wall-clock time (epoch seconds) at which the frame was received
+    arrival: float
+    # Client clock at capture, in seconds; any epoch, the offset to the server is learned
+    capture_timestamp: Optional[float] = None
+    # Client frame counter (u32, wraps)
+    sequence: Optional[int] = None
+
+
+def stamp_from_fields(
+    capture_timestamp: object,
+    sequence: object,
+    arrival: Optional[float] = None
+) -> FrameStamp:
+    """Build a stamp from untrusted request fields; malformed values are ignored."""
+    try:
+        capture = float(capture_timestamp) if capture_timestamp is not None else None
+    except (TypeError, ValueError):
+        capture = None
+    if capture is not None and not (math.isfinite(capture) and capture > 0):
+        capture = None
+    try:
+        number = int(sequence) if sequence is not None and not isinstance(sequence, bool) else None
+    except (TypeError, ValueError):
+        number = None
+    if number is not None:
+        number %= _SEQUENCE_MODULUS
+    return FrameStamp(time.time() if arrival is None else arrival, capture, number)
+
+
+def _sequence_behind(sequence: int, reference: int) -> bool:
+    """Serial-number comparison (RFC 1982): True when `sequence` precedes `reference`."""
+    distance = (reference - sequence) % _SEQUENCE_MODULUS
+    return 0 < distance < _SEQUENCE_MODULUS // 2
+
+
+class FrameClock:
+    """
+    Places each frame of a session on one timeline, so away timers and loop windows
+    measure capture time however long the frame waited for a worker.
+
+    Capture timestamps are mapped onto the server clock with an offset learned from
+    the first stamped frame. A mapped time more than `max_lag_seconds` before or
+    `max_lead_seconds` after the frame's arrival is not trusted: the frame gets its
+    arrival time and the offset is learned again (client clock jumps, reconnects
+    with a fresh clock). Frames without a capture timestamp use their arrival time.
+    The timeline never runs backwards: a frame older than the last one placed (by
+    time, or by sequence number at the same time) is held at the last time and
+    flagged, as happens when frames of one session finish on different workers.
+    """
+
+    def __init__(self, max_lag_seconds: float = 10.0, max_lead_seconds: float = 1.0):
+        self.max_lag_seconds = max_lag_seconds
+        self.max_lead_seconds = max_lead_seconds
+        self.reset()
+
+    def reset(self) -> None:
+        self._offset: Optional[float] = None
+        self._last_time: Optional[float] = None
+        self._last_sequence: Optional[int] = None
+        self.clamped_total = 0
+        self.out_of_order_total = 0
+
+    def place(self, stamp: FrameStamp) -> Tuple[float, Dict[str, object]]:
+        """Timeline position of the frame and a summary of how it was derived."""
+        source = "arrival"
+        clamped = False
+        timestamp = stamp.arrival
+        if stamp.capture_timestamp is not None:
+            if self._offset is None:
+                self._offset = stamp.arrival - stamp.capture_timestamp
+            mapped = stamp.capture_timestamp + self._offset
+            if stamp.arrival - self.max_lag_seconds <= mapped <= stamp.arrival + self.max_lead_seconds:
+                timestamp = mapped
+                source = "capture"
+            else:
+                self._offset = stamp.arrival - stamp.capture_timestamp
+                clamped = True
+                self.clamped_total += 1
+
+        out_of_order = False
+        if self._last_time is not None:
+            if timestamp < self._last_time:
+                out_of_order = True
+            elif (
+                timestamp == self._last_time
+                and stamp.sequence is not None
+                and self._last_sequence is not None
+                and _sequence_behind(stamp.sequence, self._last_sequence)
+            ):
+                # Same instant (e.g. both held or clamped): the counter breaks the tie
+                out_of_order = True
+        if stamp.sequence is not None and not out_of_order:
+            # A counter that restarts on a newer frame (reconnect) simply becomes the new baseline
+            self._last_sequence = stamp.sequence
+        if out_of_order:
+            self.out_of_order_total += 1
+            timestamp = self._last_time
+        self._last_time = timestamp
+
+        return timestamp, {
+            "source": source,
+            "sequence": stamp.sequence,
+            "clamped": clamped,
+            "out_of_order": out_of_order,
+            "queued_ms": round(max(0.0, time.time() - stamp.arrival) * 1000.0, 1),
+        }
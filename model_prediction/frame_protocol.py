@@ -0,0 +1,172 @@
+"""
+Wire formats for the /analyze WebSocket: legacy JSON text frames and the binary protocol
+"""
+import struct
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency; binary mode is not offered without it
+    msgpack = None
+
+# Offered by clients in Sec-WebSocket-Protocol to opt into binary frames/replies
+BINARY_SUBPROTOCOL = "focus.binary.v1"
+PROTOCOL_VERSION = 1
+
+# version u8 | flags u8 | reserved u16 | sequence u32 | capture timestamp f64 (epoch seconds)
+FRAME_HEADER = struct.Struct("!BBHId")
+
+
+class BinaryFrame(NamedTuple):
+    sequence: int
+    capture_timestamp: Optional[float]
+    image: memoryview
+
+
+def binary_protocol_available() -> bool:
+    return msgpack is not None
+
+
+def negotiate_protocol(offered: Optional[str]) -> Optional[str]:
+    """Pick the binary subprotocol if the client offered it and we can speak it."""
+    if not offered or not binary_protocol_available():
+        return None
+    candidates = [item.strip() for item in offered.split(",")]
+    return BINARY_SUBPROTOCOL if BINARY_SUBPROTOCOL in candidates else None
+
+
+def parse_binary_frame(data: bytes) -> BinaryFrame:
+    """
+    Split a binary message into header fields and the encoded image bytes.
+    The image is returned as a memoryview so it reaches cv2.imdecode without a copy.
+    Raises ValueError for truncated or unsupported messages.
+    """
+    if len(data) <= FRAME_HEADER.size:
+        raise ValueError("Binary frame too short")
+    version, _flags, _reserved, sequence, capture_timestamp = FRAME_HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported binary frame version: {version}")
+    # A zero or non-finite timestamp means the client did not provide one
+    if not np.isfinite(capture_timestamp) or capture_timestamp <= 0:
+        capture_timestamp = None
+    return BinaryFrame(sequence, capture_timestamp, memoryview(data)[FRAME_HEADER.size:])
+
+
+def pack_binary_frame(image: bytes, sequence: int = 0, capture_timestamp: float = 0.0) -> bytes:
+    """Build a binary frame message; used by test clients and tools."""
+    return FRAME_HEADER.pack(PROTOCOL_VERSION, 0, 0, sequence & 0xFFFFFFFF, capture_timestamp) + image
+
+
+def _msgpack_default(value: object) -> object:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_binary_result(result: Dict) -> bytes:
+    """Serialize a result dict as msgpack for binary-mode clients."""
+    return msgpack.packb(result, default=_msgpack_default, use_bin_type=True)
+
+
+_MISSING = object()
+
+
+def _same(old: object, new: object) -> bool:
+    try:
+        return bool(old == new)
+    except ValueError:
+        # numpy arrays compare element-wise
+        return bool(np.array_equal(old, new))
+
+
+def diff_result(previous: Dict, current: Dict) -> Tuple[Dict, List[List[str]]]:
+    """
+    Changed fields of `current` relative to `previous`, plus the key paths it no longer has.
+    Nested dicts are diffed recursively, so one moving counter inside `loop_detection`
+    does not resend the whole block.
+    """
+    changed: Dict = {}
+    removed: List[List[str]] = []
+    for key, value in current.items():
+        old = previous.get(key, _MISSING)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested_changed, nested_removed = diff_result(old, value)
+            if nested_changed:
+                changed[key] = nested_changed
+            removed.extend([key] + path for path in nested_removed)
+        elif old is _MISSING or not _same(old, value):
+            changed[key] = value
+    removed.extend([key] for key in previous if key not in current)
+    return changed, removed
+
+
+class DeltaEncoder:
+    """
+    Opt-in delta stream for one /analyze connection.
+
+    Every message carries a per-connection `seq`. A keyframe
+    ({"type": "keyframe", "seq", "result"}) holds the full result and is sent first,
+    every `keyframe_interval` messages, for failed analyses and after a resync request.
+    In between, deltas ({"type": "delta", "seq", "base", "set", "unset"}) hold only
+    what changed since message `base`: clients merge `set` into their copy (objects
+    recursively, anything else replaced) and delete each key path in `unset`. Deltas
+    are never held back, so state and alert transitions go out with the frame that
+    caused them. A client that sees `base` differ from the last `seq` it applied sends
+    {"resync": true} and ignores deltas until the next keyframe.
+    """
+
+    def __init__(self, keyframe_interval: int = 30):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.sequence = 0
+        self._last: Optional[Dict] = None
+        self._since_keyframe = 0
+        self._resync = False
+
+    def request_keyframe(self) -> None:
+        self._resync = True
+
+    def encode(self, result: Dict) -> Dict:
+        self.sequence += 1
+        keyframe = (
+            self._last is None
+            or self._resync
+            or not result.get("success", False)
+            or self._since_keyframe + 1 >= self.keyframe_interval
+        )
+        if keyframe:
+            message = {"type": "keyframe", "seq": self.sequence, "result": result}
+            self._since_keyframe = 0
+            self._resync = False
+        else:
+            changed, removed = diff_result(self._last, result)
+            message = {"type": "delta", "seq": self.sequence, "base": self.sequence - 1, "set": changed}
+            if removed:
+                message["unset"] = removed
+            self._since_keyframe += 1
+        self._last = result
+        return message
+
+
+def apply_delta(state: Dict, message: Dict) -> Dict:
+    """Client-side merge of one delta-stream message; used by test clients and tools."""
+    if message["type"] == "keyframe":
+        return message["result"]
+
+    def merge(target: Dict, changes: Dict) -> None:
+        for key, value in changes.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                merge(target[key], value)
+            else:
+                target[key] = value
+
+    merge(state, message["set"])
+    for path in message.get("unset", []):
+        parent = state
+        for key in path[:-1]:
+            parent = parent.get(key, {})
+        parent.pop(path[-1], None)
+    return state
@@ -0,0 +1,425 @@
+"""
+Dedicated inference processes that keep session state resident.
+
+Each session is pinned to one inference process, which holds its FocusMonitor
+between frames. The full state crosses the process boundary only when a session
+is placed on a process (first frame, or after that process restarted) and as a
+periodic checkpoint; otherwise a job carries the frame reference plus the few
+settings the front end owns, and the reply carries the result plus the monitor's
+small summary fields (FocusMonitor._SUMMARY_ATTRS).
+
+Frames travel either as encoded bytes decoded in the worker, or decoded by the
+front end straight into a preallocated slot of one `multiprocessing.shared_memory`
+block, in which case only the slot index and shape are queued and the worker reads
+the pixels in place. Each process loads its detectors once, so model memory scales
+with the number of inference processes rather than with connection handlers.
+"""
+import itertools
+import logging
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from focus_monitor import FocusMonitor, FramePayload, SharedModels, decode_frame_payload
+from frame_clock import FrameStamp
+
+logger = logging.getLogger(__name__)
+
+_IDLE = -1
+# Reply to a job whose session the worker does not hold; the front end ships it and retries
+_MISSING = object()
+
+
+class SharedFrameRing:
+    """
+    `slots` fixed-size frame buffers in one shared-memory block. The creating process
+    owns the free list; other processes attach by name and only read the slots
+    they were handed.
+    """
+
+    def __init__(self, slots: int, slot_bytes: int, name: Optional[str] = None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name
+        self._free: "queue.Queue[int]" = queue.Queue()
+        if self.owner:
+            for slot in range(slots):
+                self._free.put(slot)
+
+    def acquire(self) -> int:
+        """Take a free slot, blocking while every slot holds a frame in flight."""
+        return self._free.get()
+
+    def release(self, slot: int) -> None:
+        self._free.put(slot)
+
+    def fit(self, frame: np.ndarray) -> np.ndarray:
+        """Downscale a frame that would not fit in one slot (native-resolution mode only)."""
+        if frame.nbytes <= self.slot_bytes:
+            return frame
+        ratio = math.sqrt(self.slot_bytes / float(frame.nbytes))
+        height, width = frame.shape[:2]
+        size = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def view(self, slot: int, shape: Tuple[int, ...]) -> np.ndarray:
+        return np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+
+    def write(self, slot: int, frame: np.ndarray) -> Tuple[int, ...]:
+        if frame.dtype != np.uint8 or frame.nbytes > self.slot_bytes:
+            raise ValueError("Frame does not fit a shared-memory slot")
+        self.view(slot, frame.shape)[...] = frame
+        return frame.shape
+
+    def close(self) -> None:
+        try:
+            self._shm.close()
+        except BufferError:
+            # A view is still alive somewhere; the mapping goes away with the process
+            pass
+        if self.owner:
+            self._shm.unlink()
+
+
+def _worker_main(
+    index: int,
+    ring_name: Optional[str],
+    slots: int,
+    slot_bytes: int,
+    models_factory: Callable[[], SharedModels],
+    jobs: "multiprocessing.Queue",
+    results: "multiprocessing.Queue",
+    current_jobs,
+    checkpoint_frames: int
+) -> None:
+    """Inference process: analyse frames of its resident sessions until a None job arrives."""
+    ring = SharedFrameRing(slots, slot_bytes, name=ring_name) if ring_name else None
+    models = models_factory()
+    # state_id -> [monitor, frames analysed since its full state was last returned]
+    sessions: Dict[str, List] = {}
+    reported: Optional[Dict[str, str]] = None
+    while True:
+        if models.readiness != reported:
+            reported = dict(models.readiness)
+            results.put(("status", index, reported))
+        try:
+            job = jobs.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if job is None:
+            break
+        if job[0] == "release":
+            sessions.pop(job[1], None)
+            continue
+        _, job_id, state_id, controls, shipped, frame_ref, source_size, timings, frame_stamp = job
+        current_jobs[index] = job_id
+        try:
+            if shipped is not None:
+                sessions[state_id] = [shipped, 0]
+            entry = sessions.get(state_id)
+            if entry is None:
+                results.put(("missing", job_id))
+                continue
+            monitor = entry[0]
+            monitor.apply(controls)
+            if frame_ref[0] == "shm":
+                frame = ring.view(frame_ref[1], frame_ref[2])
+            else:
+                frame, source_size = decode_frame_payload(frame_ref[1], monitor.processing_max_side, timings)
+            result = monitor.analyze_frame(
+                frame,
+                models=models,
+                source_size=source_size,
+                timings=timings,
+                frame_stamp=frame_stamp
+            )
+            del frame
+            entry[1] += 1
+            if entry[1] >= checkpoint_frames:
+                # Periodic full copy so a crashed process loses at most this many frames of history
+                entry[1] = 0
+                results.put(("result", job_id, result, monitor))
+            else:
+                results.put(("result", job_id, result, monitor.summary()))
+        except Exception as error:
+            results.put(("error", job_id, type(error).__name__, str(error)))
+        finally:
+            current_jobs[index] = _IDLE
+    if ring is not None:
+        ring.close()
+
+
+class InferenceWorkers:
+    """
+    A fixed set of inference processes, one job queue each. A session is placed on
+    the process holding the fewest sessions and stays there, so its monitor is
+    shipped once rather than with every frame; `release` drops it again. `run` and
+    `run_payload` block until the frame's result comes back and merge the returned
+    summary (or checkpoint) into the caller's monitor, which must not be analysed
+    elsewhere meanwhile (callers hold its analysis_lock). With `slot_bytes` > 0 a
+    shared-memory ring carries decoded frames; a slot is reused only after its
+    result returned. A process that dies is replaced: the frame it was working on
+    fails instead of hanging its caller, and its sessions resume on their next
+    frame from the last checkpoint the front end holds.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        models_factory: Callable[[], SharedModels],
+        slots: int,
+        slot_bytes: int,
+        checkpoint_frames: int = 300
+    ):
+        # spawn: the front end runs threads (event loop, dispatchers) that fork would copy mid-flight
+        self._context = multiprocessing.get_context("spawn")
+        self._models_factory = models_factory
+        self.checkpoint_frames = max(1, checkpoint_frames)
+        self.ring: Optional[SharedFrameRing] = SharedFrameRing(slots, slot_bytes) if slot_bytes > 0 else None
+        self._jobs = [self._context.Queue() for _ in range(workers)]
+        self._results = self._context.Queue()
+        self._current_jobs = self._context.Array("q", [_IDLE] * workers, lock=False)
+        self._processes: List[Optional[multiprocessing.process.BaseProcess]] = [None] * workers
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._job_ids = itertools.count()
+        self._stopping = False
+        # state_id -> (process index, incarnation of that process when the state was shipped)
+        self._resident: Dict[str, Tuple[int, int]] = {}
+        self._incarnations = [0] * workers
+        self._resident_counts = [0] * workers
+        self.readiness: Dict[int, Dict[str, str]] = {}
+        self.restarts = 0
+        self.states_shipped = 0
+        self.checkpoints = 0
+
+        for index in range(workers):
+            self._spawn(index)
+        self._collector = threading.Thread(target=self._collect, name="inference-results", daemon=True)
+        self._collector.start()
+        if self.ring is not None:
+            logger.info(
+                "Inference workers started: %d processes, %d slots of %.1f MB",
+                workers,
+                slots,
+                slot_bytes / (1024.0 * 1024.0)
+            )
+        else:
+            logger.info("Inference workers started: %d processes", workers)
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                index,
+                self.ring.name if self.ring is not None else None,
+                self.ring.slots if self.ring is not None else 0,
+                self.ring.slot_bytes if self.ring is not None else 0,
+                self._models_factory,
+                self._jobs[index],
+                self._results,
+                self._current_jobs,
+                self.checkpoint_frames,
+            ),
+            name=f"inference-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    def run(
+        self,
+        monitor: FocusMonitor,
+        frame: np.ndarray,
+        source_size: Tuple[int, int],
+        timings: Dict[str, float],
+        frame_stamp: Optional[FrameStamp] = None
+    ) -> Dict:
+        """Analyse a decoded `frame` for `monitor` through the shared-memory ring."""
+        if self.ring is None:
+            raise RuntimeError("Inference workers were started without a frame ring")
+        slot = self.ring.acquire()
+        try:
+            frame = self.ring.fit(frame)
+            started = time.perf_counter()
+            shape = self.ring.write(slot, frame)
+            timings["shm_write"] = (time.perf_counter() - started) * 1000.0
+            return self._analyse(monitor, ("shm", slot, shape), source_size, timings, frame_stamp)
+        finally:
+            self.ring.release(slot)
+
+    def run_payload(
+        self,
+        monitor: FocusMonitor,
+        payload: FramePayload,
+        timings: Dict[str, float],
+        frame_stamp: Optional[FrameStamp] = None
+    ) -> Dict:
+        """Analyse an encoded frame (JPEG/WebP bytes or base64); the worker decodes it."""
+        if isinstance(payload, memoryview):
+            # memoryviews cannot be pickled across the process boundary
+            payload = payload.tobytes()
+        return self._analyse(monitor, ("payload", payload), None, timings, frame_stamp)
+
+    def _analyse(
+        self,
+        monitor: FocusMonitor,
+        frame_ref: Tuple,
+        source_size: Optional[Tuple[int, int]],
+        timings: Dict[str, float],
+        frame_stamp: Optional[FrameStamp]
+    ) -> Dict:
+        force_ship = False
+        while True:
+            future: Future = Future()
+            with self._lock:
+                if self._stopping:
+                    raise RuntimeError("Inference workers stopped")
+                index, ship = self._place_locked(monitor.state_id, force_ship)
+                job_id = next(self._job_ids)
+                self._pending[job_id] = future
+                if ship:
+                    self.states_shipped += 1
+            self._jobs[index].put((
+                "frame",
+                job_id,
+                monitor.state_id,
+                monitor.controls(),
+                monitor if ship else None,
+                frame_ref,
+                source_size,
+                dict(timings),
+                frame_stamp,
+            ))
+            result, state = future.result()
+            if result is _MISSING:
+                force_ship = True
+                continue
+            if isinstance(state, FocusMonitor):
+                monitor.load_state(state)
+                with self._lock:
+                    self.checkpoints += 1
+            else:
+                monitor.apply(state)
+            return result
+
+    def _place_locked(self, state_id: str, force_ship: bool) -> Tuple[int, bool]:
+        """Process index for the session and whether its full state has to be shipped."""
+        placed = self._resident.get(state_id)
+        if placed is not None and placed[1] == self._incarnations[placed[0]] and not force_ship:
+            return placed[0], False
+        if placed is not None and placed[1] == self._incarnations[placed[0]]:
+            index = placed[0]
+        else:
+            index = min(range(len(self._resident_counts)), key=self._resident_counts.__getitem__)
+            self._resident_counts[index] += 1
+        self._resident[state_id] = (index, self._incarnations[index])
+        return index, True
+
+    def release(self, state_id: str) -> None:
+        """Drop a session's resident state, e.g. when the front end evicted the session."""
+        with self._lock:
+            placed = self._resident.pop(state_id, None)
+            if placed is None or placed[1] != self._incarnations[placed[0]]:
+                return
+            self._resident_counts[placed[0]] -= 1
+        self._jobs[placed[0]].put(("release", state_id))
+
+    def worker_readiness(self) -> List[Dict[str, str]]:
+        with self._lock:
+            return [dict(states) for states in self.readiness.values()]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "worker_restarts": self.restarts,
+                "resident_sessions": sum(self._resident_counts),
+                "states_shipped": self.states_shipped,
+                "checkpoints": self.checkpoints,
+            }
+
+    def _collect(self) -> None:
+        last_check = time.monotonic()
+        while True:
+            if time.monotonic() - last_check >= 1.0:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if self._stopping:
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+
+            if message[0] == "status":
+                _, index, readiness = message
+                with self._lock:
+                    self.readiness[index] = readiness
+                continue
+            with self._lock:
+                future = self._pending.pop(message[1], None)
+            if future is None:
+                continue
+            if message[0] == "result":
+                future.set_result((message[2], message[3]))
+            elif message[0] == "missing":
+                future.set_result((_MISSING, None))
+            else:
+                _, _, error_type, error_message = message
+                # Decode failures keep their type so handlers can answer 400 rather than 500
+                error_class = ValueError if error_type == "ValueError" else RuntimeError
+                future.set_exception(error_class(error_message))
+
+    def _check_workers(self) -> None:
+        if self._stopping:
+            return
+        for index, process in enumerate(self._processes):
+            if process is None or process.is_alive():
+                continue
+            job_id = self._current_jobs[index]
+            self._current_jobs[index] = _IDLE
+            logger.error("Inference worker %d exited with code %s; restarting", index, process.exitcode)
+            with self._lock:
+                # Sessions placed there are shipped again (from their last checkpoint) on their next frame
+                self._incarnations[index] += 1
+                self._resident_counts[index] = 0
+                self.readiness.pop(index, None)
+                self.restarts += 1
+                future = self._pending.pop(job_id, None) if job_id != _IDLE else None
+            if future is not None:
+                future.set_exception(RuntimeError("Inference worker crashed"))
+            self._spawn(index)
+
+    def shutdown(self, timeout: float = 1.0) -> None:
+        with self._lock:
+            self._stopping = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(RuntimeError("Inference workers stopped"))
+        for jobs in self._jobs:
+            jobs.put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._collector.join(timeout)
+        if self.ring is not None:
+            self.ring.close()
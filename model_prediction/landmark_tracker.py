@@ -0,0 +1,133 @@
+"""
+Lucas-Kanade tracking of the FaceMesh landmarks that gaze and head pose are computed from
+"""
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Eye corners and lids, pupils (468/473) and the solvePnP points (nose, chin, eye and mouth corners)
+TRACKED_LANDMARKS = np.array([1, 33, 61, 133, 145, 152, 159, 263, 291, 362, 374, 386, 468, 473])
+_EYE_CORNERS = (33, 263)
+
+_LK_PARAMS = dict(
+    winSize=(21, 21),
+    maxLevel=3,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+)
+
+
+class LandmarkTracker:
+    """
+    Carries the primary face's landmarks from the last FaceMesh run to later frames
+    with pyramidal Lucas-Kanade. Only a grey patch around the face is kept, so the
+    tracker travels cheaply with the session state. `track` gives up (returns None
+    and clears itself, forcing a FaceMesh run) when the forward-backward error says
+    too many points were lost, a point leaves the patch, or the eye distance changes
+    more than head motion between two runs plausibly explains.
+    """
+
+    def __init__(
+        self,
+        max_fb_error: float = 1.5,
+        min_good_fraction: float = 0.8,
+        max_scale_change: float = 0.15,
+        margin: float = 0.5
+    ):
+        self.max_fb_error = max_fb_error
+        self.min_good_fraction = min_good_fraction
+        self.max_scale_change = max_scale_change
+        self.margin = margin
+        self.clear()
+
+    def clear(self) -> None:
+        self._patch: Optional[np.ndarray] = None
+        self._region: Tuple[int, int, int, int] = (0, 0, 0, 0)
+        self._frame_shape: Tuple[int, ...] = ()
+        self._landmarks: Optional[np.ndarray] = None
+        self._reference_eye_distance = 0.0
+        self.face_box: Optional[Tuple[int, int, int, int]] = None
+        self.additional_face_boxes: List[Tuple[int, int, int, int]] = []
+
+    @property
+    def active(self) -> bool:
+        return self._patch is not None
+
+    @staticmethod
+    def _eye_distance(landmarks: np.ndarray) -> float:
+        return float(np.linalg.norm(landmarks[_EYE_CORNERS[0], :2] - landmarks[_EYE_CORNERS[1], :2]))
+
+    def reset(
+        self,
+        gray: np.ndarray,
+        landmarks: np.ndarray,
+        face_box: Tuple[int, int, int, int],
+        additional_face_boxes: List[Tuple[int, int, int, int]]
+    ) -> None:
+        """Start tracking from a FaceMesh result (pixel landmarks, (x1, y1, x2, y2) box)."""
+        height, width = gray.shape[:2]
+        x1, y1, x2, y2 = face_box
+        margin_x = (x2 - x1) * self.margin
+        margin_y = (y2 - y1) * self.margin
+        region = (
+            max(0, int(x1 - margin_x)),
+            max(0, int(y1 - margin_y)),
+            min(width, int(x2 + margin_x) + 1),
+            min(height, int(y2 + margin_y) + 1),
+        )
+        if region[2] - region[0] < 16 or region[3] - region[1] < 16:
+            self.clear()
+            return
+        self._region = region
+        self._frame_shape = gray.shape
+        self._patch = gray[region[1]:region[3], region[0]:region[2]].copy()
+        self._landmarks = landmarks.copy()
+        self._reference_eye_distance = self._eye_distance(landmarks)
+        self.face_box = face_box
+        self.additional_face_boxes = list(additional_face_boxes)
+
+    def track(self, gray: np.ndarray) -> Optional[np.ndarray]:
+        """Landmarks moved to `gray`, or None when tracking cannot be trusted."""
+        if self._patch is None or self._landmarks is None or gray.shape != self._frame_shape:
+            self.clear()
+            return None
+        x0, y0, x1, y1 = self._region
+        current = gray[y0:y1, x0:x1]
+        offset = np.array([x0, y0], dtype=np.float32)
+        previous = (self._landmarks[TRACKED_LANDMARKS, :2].astype(np.float32) - offset).reshape(-1, 1, 2)
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self._patch, current, previous, None, **_LK_PARAMS)
+        if moved is None:
+            self.clear()
+            return None
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(current, self._patch, moved, None, **_LK_PARAMS)
+        fb_error = np.linalg.norm((back - previous).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error <= self.max_fb_error)
+        if good.mean() < self.min_good_fraction:
+            self.clear()
+            return None
+
+        displacement = (moved - previous).reshape(-1, 2)
+        # The few points that lost track move with the rest of the face
+        shift = np.median(displacement[good], axis=0)
+        displacement[~good] = shift
+        tracked = previous.reshape(-1, 2) + displacement
+        patch_height, patch_width = current.shape[:2]
+        if (tracked < 0).any() or (tracked[:, 0] >= patch_width).any() or (tracked[:, 1] >= patch_height).any():
+            self.clear()
+            return None
+
+        landmarks = self._landmarks.copy()
+        landmarks[TRACKED_LANDMARKS, :2] = tracked + offset
+        eye_distance = self._eye_distance(landmarks)
+        if abs(eye_distance / max(self._reference_eye_distance, 1e-6) - 1.0) > self.max_scale_change:
+            self.clear()
+            return None
+
+        self._landmarks = landmarks
+        self._patch = current.copy()
+        if self.face_box is not None:
+            dx, dy = int(round(float(shift[0]))), int(round(float(shift[1])))
+            bx1, by1, bx2, by2 = self.face_box
+            self.face_box = (bx1 + dx, by1 + dy, bx2 + dx, by2 + dy)
+        return landmarks
@@ -0,0 +1,462 @@
+"""
+Load generator for a running focus monitoring API.
+
+Opens N concurrent /analyze WebSocket sessions (or /analyze-frame POST loops), each
+sending frames at a fixed rate from synthetic frames, a local video, or traffic
+captured with FOCUS_CAPTURE_DIR, and reports round-trip latency p50/p95/p99, achieved
+frames per second per session, error rate and, with --server-pid, server CPU.
+
+    python loadgen.py --sessions 50 --fps 10 --duration 60 --output load.json
+    python loadgen.py --video exam.mp4 --resolution 1280x720 --transport post
+    python loadgen.py --replay captures/ --speed 2
+
+Binary WebSocket sessions are open loop: frames leave on schedule whether or not
+replies came back, like a real camera, and the server's newest-frame-wins policy
+shows up as `server_frames_dropped`. JSON and POST sessions wait for each reply
+and skip the frames whose send time passed meanwhile (`frames_skipped`).
+"""
+import argparse
+import asyncio
+import base64
+import glob
+import json
+import logging
+import os
+import platform
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from benchmark import SYNTHETIC_SOURCE, _encode_frames, _parse_resolution, synthetic_frames, video_frames
+from frame_protocol import BINARY_SUBPROTOCOL, pack_binary_frame
+from traffic_capture import KIND_BASE64, KIND_IMAGE, read_capture
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger("loadgen")
+
+TRANSPORTS = ("ws", "ws-json", "post")
+Payload = Union[bytes, str]
+# (seconds after the session started, payload in the transport's wire form)
+Schedule = List[Tuple[float, Payload]]
+
+
+@dataclass
+class SessionStats:
+    index: int
+    source: str
+    frames_sent: int = 0
+    replies: int = 0
+    errors: int = 0
+    frames_skipped: int = 0
+    server_frames_dropped: int = 0
+    latencies_ms: List[float] = field(default_factory=list)
+    last_hints: Optional[Dict[str, object]] = None
+    started: float = 0.0
+    finished: float = 0.0
+    failure: Optional[str] = None
+
+    def achieved_fps(self) -> float:
+        elapsed = self.finished - self.started
+        return self.replies / elapsed if elapsed > 0 else 0.0
+
+
+def _to_wire(kind: int, payload: bytes, transport: str) -> Payload:
+    """Captured/encoded frame as the transport sends it: raw bytes or the base64 field."""
+    if transport == "ws":
+        if kind == KIND_BASE64:
+            text = payload.split(b",", 1)[1] if payload.startswith(b"data:") else payload
+            return base64.b64decode(text)
+        return payload
+    if kind == KIND_IMAGE:
+        return base64.b64encode(payload).decode("ascii")
+    return payload.decode("ascii")
+
+
+def build_schedules(args: argparse.Namespace) -> List[Tuple[str, Schedule]]:
+    """One (source name, schedule) per session."""
+    if args.replay:
+        paths = sorted(glob.glob(os.path.join(args.replay, "*.fcap"))) if os.path.isdir(args.replay) else [args.replay]
+        if not paths:
+            raise ValueError(f"No capture files in {args.replay}")
+        captures = []
+        for path in paths:
+            _, frames = read_capture(path)
+            schedule = [
+                (frame.offset / args.speed, _to_wire(frame.kind, frame.payload, args.transport))
+                for frame in frames
+                if args.duration is None or frame.offset / args.speed <= args.duration
+            ]
+            captures.append((os.path.basename(path), schedule))
+        sessions = args.sessions or len(captures)
+        return [captures[index % len(captures)] for index in range(sessions)]
+
+    duration = args.duration if args.duration is not None else 30.0
+    count = max(1, int(round(duration * args.fps)))
+    unique = min(count, args.unique_frames)
+    if args.video:
+        source = os.path.basename(args.video)
+        frames = video_frames(args.video, args.resolution, unique)
+    else:
+        source = SYNTHETIC_SOURCE
+        frames = synthetic_frames(args.resolution, args.faces, unique, seed=args.seed)
+    # Encoded once and shared; sessions start at different points of the clip
+    encoded = [_to_wire(KIND_IMAGE, frame, args.transport) for frame in _encode_frames(frames, args.jpeg_quality)]
+    sessions = args.sessions or 10
+    return [
+        (source, [(number / args.fps, encoded[(number + index * 7) % len(encoded)]) for number in range(count)])
+        for index in range(sessions)
+    ]
+
+
+def _record_reply(stats: SessionStats, reply: Dict, sent_at: float) -> None:
+    stats.replies += 1
+    stats.latencies_ms.append((time.perf_counter() - sent_at) * 1000.0)
+    if not reply.get("success", True):
+        stats.errors += 1
+    stats.server_frames_dropped = int(reply.get("frames_dropped", stats.server_frames_dropped))
+    stats.last_hints = reply.get("hints", stats.last_hints)
+
+
+async def _wait_until(started: float, offset: float) -> None:
+    delay = started + offset - time.perf_counter()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def _binary_session(websocket, schedule: Schedule, stats: SessionStats, drain_seconds: float) -> None:
+    sent_at: Dict[int, float] = {}
+    last_sequence = len(schedule)
+    done = asyncio.Event()
+
+    async def receive() -> None:
+        async for message in websocket:
+            reply = msgpack.unpackb(message, raw=False) if isinstance(message, bytes) else json.loads(message)
+            sequence = reply.get("sequence")
+            if sequence is None:
+                stats.errors += 1
+                continue
+            for older in [item for item in sent_at if item < sequence]:
+                del sent_at[older]  # superseded on the server; counted in frames_dropped
+            if sequence in sent_at:
+                _record_reply(stats, reply, sent_at.pop(sequence))
+            if sequence >= last_sequence:
+                done.set()
+                return
+
+    receiver = asyncio.create_task(receive())
+    try:
+        for sequence, (offset, payload) in enumerate(schedule, start=1):
+            await _wait_until(stats.started, offset)
+            sent_at[sequence] = time.perf_counter()
+            await websocket.send(pack_binary_frame(payload, sequence, time.time()))
+            stats.frames_sent += 1
+        # The newest frame is always analysed, so its reply marks the end of the session
+        await asyncio.wait_for(done.wait(), timeout=drain_seconds)
+    except asyncio.TimeoutError:
+        stats.failure = f"no reply to the last frame within {drain_seconds:.0f}s"
+    finally:
+        receiver.cancel()
+
+
+async def _closed_loop(send_and_wait, schedule: Schedule, stats: SessionStats) -> None:
+    index = 0
+    while index < len(schedule):
+        elapsed = time.perf_counter() - stats.started
+        # Closed loop cannot catch up: frames whose slot already passed are skipped
+        while index + 1 < len(schedule) and schedule[index + 1][0] <= elapsed:
+            index += 1
+            stats.frames_skipped += 1
+        offset, payload = schedule[index]
+        await _wait_until(stats.started, offset)
+        sent_at = time.perf_counter()
+        stats.frames_sent += 1
+        try:
+            reply = await send_and_wait(payload, stats.frames_sent)
+        except (OSError, ValueError) as request_error:
+            stats.errors += 1
+            logger.debug("Session %d request failed: %s", stats.index, request_error)
+        else:
+            _record_reply(stats, reply, sent_at)
+        index += 1
+
+
+def _post_frame(url: str, body: bytes, timeout: float) -> Dict:
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as http_error:
+        # 4xx/5xx still carry the API's {"success": false, ...} body
+        return json.loads(http_error.read() or b"{}") or {"success": False}
+
+
+async def run_session(
+    index: int,
+    source: str,
+    schedule: Schedule,
+    args: argparse.Namespace,
+    executor: ThreadPoolExecutor
+) -> SessionStats:
+    stats = SessionStats(index=index, source=source)
+    await asyncio.sleep(args.ramp * index / max(1, args.sessions_total))
+    stats.started = time.perf_counter()
+    try:
+        if args.transport == "post":
+            url = f"{args.url.rstrip('/')}/analyze-frame"
+            loop = asyncio.get_running_loop()
+            session_id = f"loadgen-{index}"
+
+            async def post(payload: str, sequence: int) -> Dict:
+                body = json.dumps({
+                    "frame": payload,
+                    "session_id": session_id,
+                    "sequence": sequence,
+                    "capture_timestamp": time.time()
+                }).encode("utf-8")
+                return await loop.run_in_executor(executor, _post_frame, url, body, args.timeout)
+
+            await _closed_loop(post, schedule, stats)
+        else:
+            import websockets
+
+            url = args.url.rstrip("/").replace("http", "ws", 1) + "/analyze"
+            binary = args.transport == "ws"
+            async with websockets.connect(
+                url,
+                subprotocols=[BINARY_SUBPROTOCOL] if binary else None,
+                max_size=None,
+                open_timeout=args.timeout
+            ) as websocket:
+                if binary:
+                    if websocket.subprotocol != BINARY_SUBPROTOCOL:
+                        raise RuntimeError("server did not accept the binary subprotocol")
+                    await _binary_session(websocket, schedule, stats, args.timeout)
+                else:
+                    async def exchange(payload: str, sequence: int) -> Dict:
+                        await websocket.send(json.dumps({
+                            "frame": payload,
+                            "sequence": sequence,
+                            "capture_timestamp": time.time()
+                        }))
+                        return json.loads(await asyncio.wait_for(websocket.recv(), args.timeout))
+
+                    await _closed_loop(exchange, schedule, stats)
+    except Exception as session_error:
+        stats.failure = f"{type(session_error).__name__}: {session_error}"
+        logger.warning("Session %d failed: %s", index, stats.failure)
+    stats.finished = time.perf_counter()
+    return stats
+
+
+def _process_tree_cpu_seconds(pid: int) -> Optional[float]:
+    """User+system CPU seconds of `pid` and its live descendants (Linux /proc)."""
+    parents: Dict[int, int] = {}
+    cpu: Dict[int, float] = {}
+    ticks = os.sysconf("SC_CLK_TCK")
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as handle:
+                data = handle.read()
+        except OSError:
+            continue
+        # Fields after the parenthesised command name: state, ppid, ..., utime (12th), stime (13th)
+        fields = data[data.rindex(")") + 2:].split()
+        parents[int(entry)] = int(fields[1])
+        cpu[int(entry)] = (int(fields[11]) + int(fields[12])) / ticks
+    if pid not in cpu:
+        return None
+    tree = {pid}
+    changed = True
+    while changed:
+        children = {child for child, parent in parents.items() if parent in tree} - tree
+        changed = bool(children)
+        tree |= children
+    return sum(cpu[member] for member in tree)
+
+
+async def sample_server_cpu(pid: int, samples: List[Tuple[float, float]], interval: float = 1.0) -> None:
+    while True:
+        total = _process_tree_cpu_seconds(pid)
+        if total is not None:
+            samples.append((time.perf_counter(), total))
+        await asyncio.sleep(interval)
+
+
+def summarize_cpu(samples: List[Tuple[float, float]]) -> Optional[Dict[str, float]]:
+    if len(samples) < 2:
+        return None
+    percents = [
+        100.0 * (cpu_b - cpu_a) / (time_b - time_a)
+        for (time_a, cpu_a), (time_b, cpu_b) in zip(samples, samples[1:])
+        if time_b > time_a
+    ]
+    (first_time, first_cpu), (last_time, last_cpu) = samples[0], samples[-1]
+    return {
+        "cpu_seconds": round(last_cpu - first_cpu, 2),
+        "mean_percent": round(100.0 * (last_cpu - first_cpu) / (last_time - first_time), 1),
+        "peak_percent": round(max(percents), 1),
+        "samples": len(samples),
+    }
+
+
+def _fetch_server_metrics(base_url: str, timeout: float) -> Optional[Dict]:
+    try:
+        with urllib.request.urlopen(f"{base_url.rstrip('/')}/metrics?format=json", timeout=timeout) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError) as metrics_error:
+        logger.warning("Could not read server metrics: %s", metrics_error)
+        return None
+
+
+def summarize(results: List[SessionStats], args: argparse.Namespace) -> Dict[str, object]:
+    latencies = np.array([value for stats in results for value in stats.latencies_ms], dtype=np.float64)
+    rates = np.array([stats.achieved_fps() for stats in results if stats.failure is None], dtype=np.float64)
+    sent = sum(stats.frames_sent for stats in results)
+    errors = sum(stats.errors for stats in results)
+    latency: Dict[str, float] = {}
+    if latencies.size:
+        latency = {
+            **{f"p{q}": round(float(np.percentile(latencies, q)), 2) for q in (50, 95, 99)},
+            "mean": round(float(latencies.mean()), 2),
+            "max": round(float(latencies.max()), 2),
+        }
+    return {
+        "frames_sent": sent,
+        "replies": sum(stats.replies for stats in results),
+        "errors": errors,
+        "error_rate": round(errors / sent, 4) if sent else 0.0,
+        "failed_sessions": sum(1 for stats in results if stats.failure is not None),
+        "frames_skipped": sum(stats.frames_skipped for stats in results),
+        "server_frames_dropped": sum(stats.server_frames_dropped for stats in results),
+        "latency_ms": latency,
+        "fps_per_session": {
+            "target": None if args.replay else args.fps,
+            "mean": round(float(rates.mean()), 2) if rates.size else 0.0,
+            "min": round(float(rates.min()), 2) if rates.size else 0.0,
+            "max": round(float(rates.max()), 2) if rates.size else 0.0,
+        },
+    }
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, object]:
+    schedules = build_schedules(args)
+    args.sessions_total = len(schedules)
+    logger.info(
+        "Starting %d %s sessions against %s (%d frames in total)",
+        len(schedules),
+        args.transport,
+        args.url,
+        sum(len(schedule) for _, schedule in schedules)
+    )
+    cpu_samples: List[Tuple[float, float]] = []
+    sampler = asyncio.create_task(sample_server_cpu(args.server_pid, cpu_samples)) if args.server_pid else None
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(schedules) if args.transport == "post" else 1) as executor:
+        results = await asyncio.gather(*(
+            run_session(index, source, schedule, args, executor)
+            for index, (source, schedule) in enumerate(schedules)
+        ))
+    elapsed = time.perf_counter() - started
+    if sampler is not None:
+        sampler.cancel()
+        total = _process_tree_cpu_seconds(args.server_pid)
+        if total is not None:
+            cpu_samples.append((time.perf_counter(), total))
+
+    report: Dict[str, object] = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "url": args.url,
+            "transport": args.transport,
+            "source": args.replay or args.video or SYNTHETIC_SOURCE,
+            "resolution": None if args.replay else list(args.resolution),
+            "sessions": len(schedules),
+            "elapsed_seconds": round(elapsed, 2),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        **summarize(results, args),
+        "server_cpu": summarize_cpu(cpu_samples),
+        "server_metrics": await asyncio.to_thread(_fetch_server_metrics, args.url, args.timeout),
+        "sessions": [
+            {
+                "index": stats.index,
+                "source": stats.source,
+                "frames_sent": stats.frames_sent,
+                "replies": stats.replies,
+                "errors": stats.errors,
+                "achieved_fps": round(stats.achieved_fps(), 2),
+                "p95_ms": round(float(np.percentile(stats.latencies_ms, 95)), 2) if stats.latencies_ms else None,
+                "last_hints": stats.last_hints,
+                "failure": stats.failure,
+            }
+            for stats in results
+        ],
+    }
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="API base URL")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="ws", help="binary WebSocket, JSON WebSocket or POST")
+    parser.add_argument("--sessions", type=int, default=0, help="concurrent sessions (default 10, or one per capture)")
+    parser.add_argument("--fps", type=float, default=10.0, help="frames per second per session")
+    parser.add_argument("--duration", type=float, help="seconds per session (default 30; replay: whole capture)")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which sessions start")
+    parser.add_argument("--video", help="local video file; default is synthetic frames")
+    parser.add_argument("--resolution", type=_parse_resolution, default=(640, 480))
+    parser.add_argument("--faces", type=int, default=1, help="faces in synthetic frames")
+    parser.add_argument("--unique-frames", type=int, default=150, help="distinct frames encoded and cycled")
+    parser.add_argument("--jpeg-quality", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", help="capture file or directory of .fcap files (FOCUS_CAPTURE_DIR)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument("--server-pid", type=int, help="server PID for CPU sampling (same host, Linux)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="connect/reply timeout in seconds")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.transport == "ws" and msgpack is None:
+        parser.error("the binary transport needs msgpack; install it or use --transport ws-json")
+    if args.fps <= 0 or args.speed <= 0:
+        parser.error("--fps and --speed must be positive")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    report = asyncio.run(run_load(args))
+    latency = report["latency_ms"]
+    logger.info(
+        "%d sessions: p50 %s ms, p95 %s ms, p99 %s ms, %.1f fps/session, error rate %.2f%%",
+        report["meta"]["sessions"],
+        latency.get("p50"),
+        latency.get("p95"),
+        latency.get("p99"),
+        report["fps_per_session"]["mean"],
+        100 * report["error_rate"]
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output + "\n")
+        logger.info("Wrote %s", args.output)
+    else:
+        print(output)
+    return 1 if report["failed_sessions"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,221 @@
+"""
+Incremental, vectorized clustering of frame hashes for loop-video detection
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+_POPCOUNT16 = np.array([bin(value).count("1") for value in range(1 << 16)], dtype=np.uint8)
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """Number of set bits in each element of a uint64 array."""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    words = values.view(np.uint16).reshape(values.shape + (4,))
+    # At most 64 bits set, so uint8 sums cannot overflow
+    return (
+        _POPCOUNT16[words[..., 0]] + _POPCOUNT16[words[..., 1]]
+        + _POPCOUNT16[words[..., 2]] + _POPCOUNT16[words[..., 3]]
+    )
+
+
+# Pending entries whose cluster choice is evaluated per vector pass in HashClusterWindow._settle
+_SETTLE_BATCH = 32
+
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    """Hamming distance between two 64-bit hashes."""
+    return (hash_a ^ hash_b).bit_count()
+
+
+class HashClusterWindow:
+    """
+    Time-bounded window of 64-bit frame hashes, greedily clustered in arrival order:
+    each hash joins the oldest cluster whose representative (first member) is within
+    `tolerance_bits`, otherwise it starts a new cluster.
+
+    Hashes live in a growable uint64 ring buffer. Appending compares against the
+    representatives in one vectorized XOR + popcount. The oldest entry always
+    represents the oldest cluster, so evicting it orphans that cluster's members.
+    `_settle` re-runs the greedy assignment for exactly the entries whose outcome can
+    change: the orphans, plus the later members of any cluster that a change of
+    representative captures or dissolves. The result is identical to clustering the
+    window from scratch, while a steady scene costs a few vector passes per frame.
+    """
+
+    def __init__(self, window_seconds: float, tolerance_bits: int, initial_capacity: int = 256):
+        self.window_seconds = window_seconds
+        self.tolerance_bits = tolerance_bits
+        self._capacity = max(16, initial_capacity)
+        self._hashes = np.zeros(self._capacity, dtype=np.uint64)
+        self._times = np.zeros(self._capacity, dtype=np.float64)
+        # Cluster of every entry, named by its representative's sequence number (-1 while unassigned)
+        self._labels = np.zeros(self._capacity, dtype=np.int64)
+        self._head = 0
+        self._tail = 0
+        # Live clusters in creation order: representative sequence number, its hash, member count
+        self._reps = np.zeros(0, dtype=np.int64)
+        self._rep_hashes = np.zeros(0, dtype=np.uint64)
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self._tail - self._head
+
+    @property
+    def cluster_count(self) -> int:
+        return int(self._reps.size)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def add(self, timestamp: float, frame_hash: int) -> None:
+        """Append a hash and drop every entry older than the window."""
+        if len(self) == self._capacity:
+            self._grow()
+        seq = self._tail
+        pos = seq % self._capacity
+        self._hashes[pos] = np.uint64(frame_hash)
+        self._times[pos] = timestamp
+        self._tail += 1
+        self._assign(seq)
+
+        while len(self) and timestamp - self._times[self._head % self._capacity] > self.window_seconds:
+            self._evict_oldest()
+
+    def dominant(self) -> Optional[Tuple[int, float, float]]:
+        """(count, first_seen, last_seen) of the largest cluster; ties go to the oldest."""
+        if not self._reps.size:
+            return None
+        index = int(np.argmax(self._counts))
+        positions = self._window_positions()
+        times = self._times[positions][self._labels[positions] == self._reps[index]]
+        return int(self._counts[index]), float(times.min()), float(times.max())
+
+    def clear(self) -> None:
+        self._head = self._tail = 0
+        self._reps = np.zeros(0, dtype=np.int64)
+        self._rep_hashes = np.zeros(0, dtype=np.uint64)
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    def _window_positions(self, start: Optional[int] = None) -> np.ndarray:
+        first = self._head if start is None else start
+        return np.arange(first, self._tail, dtype=np.int64) % self._capacity
+
+    def _assign(self, seq: int) -> None:
+        pos = seq % self._capacity
+        if self._reps.size:
+            distances = popcount64(self._rep_hashes ^ self._hashes[pos])
+            hits = np.flatnonzero(distances <= self.tolerance_bits)
+            if hits.size:
+                index = int(hits[0])
+                self._labels[pos] = self._reps[index]
+                self._counts[index] += 1
+                return
+        self._insert_rep(seq)
+
+    def _insert_rep(self, seq: int) -> None:
+        index = int(np.searchsorted(self._reps, seq))
+        pos = seq % self._capacity
+        self._labels[pos] = seq
+        # Slicing + concatenate: np.insert/np.delete cost more than the copy on arrays this small
+        self._reps = np.concatenate((self._reps[:index], (seq,), self._reps[index:]))
+        self._rep_hashes = np.concatenate(
+            (self._rep_hashes[:index], self._hashes[pos:pos + 1], self._rep_hashes[index:])
+        )
+        self._counts = np.concatenate((self._counts[:index], (1,), self._counts[index:]))
+
+    def _remove_rep(self, index: int) -> None:
+        self._reps = np.concatenate((self._reps[:index], self._reps[index + 1:]))
+        self._rep_hashes = np.concatenate((self._rep_hashes[:index], self._rep_hashes[index + 1:]))
+        self._counts = np.concatenate((self._counts[:index], self._counts[index + 1:]))
+
+    def _evict_oldest(self) -> None:
+        seq = self._head
+        self._head += 1
+        # The oldest entry is the representative of the oldest cluster
+        orphaned = int(self._counts[0]) > 1
+        self._remove_rep(0)
+        if not orphaned:
+            return
+        positions = self._window_positions()
+        members = positions[self._labels[positions] == seq]
+        self._labels[members] = -1
+        self._settle(np.sort(self._head + (members - self._head) % self._capacity))
+
+    def _settle(self, pending: np.ndarray) -> None:
+        """
+        Re-run the greedy assignment for `pending` (sorted sequence numbers) in arrival
+        order. Entries that stay or become plain members are relabelled in bulk; each
+        entry that becomes a representative, or stops being one, is handled on its own
+        because it changes the choice of every later entry within tolerance of it.
+        """
+        capacity = self._capacity
+        tolerance = self.tolerance_bits
+        window = self._window_positions()
+        while pending.size:
+            # Anything after the next change of representatives is recomputed anyway, so
+            # the distance matrix is only built for a short run of entries at a time
+            batch = pending[:_SETTLE_BATCH]
+            positions = batch % capacity
+            within = (
+                (popcount64(self._hashes[positions][:, None] ^ self._rep_hashes[None, :]) <= tolerance)
+                & (self._reps[None, :] < batch[:, None])
+            )
+            matched = within.any(axis=1)
+            first_match = np.full(batch.size, -1, dtype=np.int64)
+            if self._reps.size:
+                first_match[matched] = self._reps[np.argmax(within[matched], axis=1)]
+            labels = self._labels[positions]
+            was_rep = labels == batch
+            changes_reps = matched == was_rep
+            settled = int(np.argmax(changes_reps)) if changes_reps.any() else batch.size
+
+            moved = slice(0, settled)
+            moving = matched[moved] & ~was_rep[moved]
+            old_labels = labels[moved][moving]
+            new_labels = first_match[moved][moving]
+            np.subtract.at(self._counts, np.searchsorted(self._reps, old_labels[old_labels >= 0]), 1)
+            np.add.at(self._counts, np.searchsorted(self._reps, new_labels), 1)
+            self._labels[positions[moved][moving]] = new_labels
+            if settled == batch.size:
+                pending = pending[batch.size:]
+                continue
+
+            seq = int(pending[settled])
+            pos = seq % capacity
+            rest = pending[settled + 1:]
+            later = window[seq + 1 - self._head:]
+            later_labels = self._labels[later]
+            if was_rep[settled]:
+                # Now joins an older cluster: its own cluster dissolves
+                members = later[later_labels == seq]
+                self._remove_rep(int(np.searchsorted(self._reps, seq)))
+                cluster = int(first_match[settled])
+                self._labels[pos] = cluster
+                self._counts[int(np.searchsorted(self._reps, cluster))] += 1
+                self._labels[members] = -1
+            else:
+                # Matches no older cluster: it founds one, which later entries of younger
+                # clusters now reach first
+                if labels[settled] >= 0:
+                    self._counts[int(np.searchsorted(self._reps, labels[settled]))] -= 1
+                self._insert_rep(seq)
+                candidates = later[later_labels > seq]
+                members = candidates[popcount64(self._hashes[candidates] ^ self._hashes[pos]) <= tolerance]
+            if members.size:
+                member_seqs = seq + 1 + (members - (seq + 1)) % capacity
+                rest = np.union1d(rest, member_seqs)
+            pending = rest
+
+    def _grow(self) -> None:
+        new_capacity = self._capacity * 2
+        seqs = np.arange(self._head, self._tail, dtype=np.int64)
+        old_positions = seqs % self._capacity
+        new_positions = seqs % new_capacity
+        for name in ("_hashes", "_times", "_labels"):
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=old.dtype)
+            new[new_positions] = old[old_positions]
+            setattr(self, name, new)
+        self._capacity = new_capacity
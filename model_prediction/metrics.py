@@ -0,0 +1,144 @@
+"""
+Per-stage latency and throughput metrics, rendered in the Prometheus text format
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+@contextmanager
+def stage_timer(timings: Optional[Dict[str, float]], stage: str) -> Iterator[None]:
+    """Add the wall time of the block (ms) to `timings[stage]`; no-op when timings is None."""
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - started) * 1000.0
+
+
+class RollingHistogram:
+    """Latency samples (ms) of the last `window` observations plus lifetime count and sum."""
+
+    def __init__(self, window: int = 2048):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self._samples.append(value_ms)
+        self.count += 1
+        self.total += value_ms
+
+    def quantiles(self) -> Dict[float, float]:
+        if not self._samples:
+            return {quantile: 0.0 for quantile in QUANTILES}
+        values = np.quantile(np.fromiter(self._samples, dtype=np.float64), QUANTILES)
+        return dict(zip(QUANTILES, (float(value) for value in values)))
+
+
+class FocusMetrics:
+    """
+    Process-wide collector fed from analysis results. Workers (threads or processes)
+    only fill the `timings` block of each result; aggregation happens here, in the
+    API process, so both executor modes report the same way.
+    """
+
+    def __init__(self, window: int = 2048, rate_window_seconds: float = 10.0):
+        self.window = window
+        self.rate_window_seconds = rate_window_seconds
+        self._lock = threading.Lock()
+        self._stages: Dict[str, RollingHistogram] = {}
+        self._completed: Deque[float] = deque()
+        self.frames_total = 0
+        self.frames_failed = 0
+        self.frames_dropped = 0
+
+    def observe_timings(self, timings: Dict[str, float]) -> None:
+        with self._lock:
+            for stage, value_ms in timings.items():
+                histogram = self._stages.get(stage)
+                if histogram is None:
+                    histogram = self._stages[stage] = RollingHistogram(self.window)
+                histogram.observe(value_ms)
+
+    def record_frame(self, failed: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.frames_total += 1
+            if failed:
+                self.frames_failed += 1
+            self._completed.append(now)
+            self._trim_rate_window(now)
+
+    def record_dropped(self, count: int = 1) -> None:
+        with self._lock:
+            self.frames_dropped += count
+
+    def frames_per_second(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self._trim_rate_window(now)
+            return len(self._completed) / self.rate_window_seconds
+
+    def _trim_rate_window(self, now: float) -> None:
+        cutoff = now - self.rate_window_seconds
+        while self._completed and self._completed[0] < cutoff:
+            self._completed.popleft()
+
+    def snapshot(self) -> Dict[str, object]:
+        """JSON-friendly view: per-stage p50/p95/p99 in ms plus frame counters."""
+        frames_per_second = self.frames_per_second()
+        with self._lock:
+            stages = {
+                stage: {
+                    **{f"p{int(quantile * 100)}": round(value, 3)
+                       for quantile, value in histogram.quantiles().items()},
+                    "count": histogram.count,
+                }
+                for stage, histogram in sorted(self._stages.items())
+            }
+            return {
+                "frames_total": self.frames_total,
+                "frames_failed": self.frames_failed,
+                "frames_dropped": self.frames_dropped,
+                "frames_per_second": round(frames_per_second, 2),
+                "stages": stages,
+            }
+
+    def render_prometheus(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus text exposition; `gauges` adds point-in-time values (name -> value)."""
+        frames_per_second = self.frames_per_second()
+        lines: List[str] = [
+            "# HELP focus_stage_latency_seconds Per-stage analysis latency over recent frames",
+            "# TYPE focus_stage_latency_seconds summary",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._stages.items()):
+                for quantile, value in histogram.quantiles().items():
+                    lines.append(
+                        f'focus_stage_latency_seconds{{stage="{stage}",quantile="{quantile}"}} '
+                        f"{value / 1000.0:.6f}"
+                    )
+                lines.append(f'focus_stage_latency_seconds_sum{{stage="{stage}"}} {histogram.total / 1000.0:.6f}')
+                lines.append(f'focus_stage_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+            counters = {
+                "focus_frames_total": ("Frames analysed", self.frames_total),
+                "focus_frames_failed_total": ("Frames whose analysis raised", self.frames_failed),
+                "focus_frames_dropped_total": ("Frames superseded before analysis", self.frames_dropped),
+            }
+        for name, (help_text, value) in counters.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+
+        all_gauges = {"focus_frames_per_second": frames_per_second, **(gauges or {})}
+        for name, value in all_gauges.items():
+            lines += [f"# TYPE {name} gauge", f"{name} {float(value):g}"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,335 @@
+"""
+Parallel offline analysis of recorded exam videos.
+
+The recording is split into contiguous segments that are analysed on a process pool.
+Each segment gets its own FocusMonitor, primed on the frames just before it so that
+smoothed scores, away timers and the short loop window start warm, and every frame is
+analysed on the video's own timeline (frame index / fps) rather than the wall clock.
+Replays of a clip minutes apart span segments, so the frame hashes the workers return
+are run through one session-long replay index after the merge. The per-frame records
+are merged into one timeline plus a per-second roll-up.
+
+    python offline_analysis.py exam.mp4 --workers 16 --sample-fps 5 --output audit.json
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from typing import Dict, List, NamedTuple, Optional
+
+import cv2
+
+from device_backends import DeviceDetectorConfig
+from focus_monitor import FocusMonitor, SharedModels
+from replay_index import HashSequenceIndex
+from scheduling import DetectorSchedule
+
+logger = logging.getLogger(__name__)
+
+# Detectors of the current worker process, loaded on its first segment
+_process_models: Optional[SharedModels] = None
+
+
+class VideoSegment(NamedTuple):
+    index: int
+    start_frame: int
+    end_frame: int
+    warmup_frame: int
+
+
+def probe_video(path: str) -> Dict[str, object]:
+    """
+    Frame rate, frame count and duration from the container header. Containers that
+    do not record a frame count (common for WebM) are counted by grabbing to the end.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        if fps <= 0 or not math.isfinite(fps):
+            raise ValueError("Video does not report a usable frame rate")
+        reported = capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0.0
+        frame_count = int(reported) if math.isfinite(reported) and reported > 0 else 0
+        frame_count_source = "header"
+        if frame_count <= 0:
+            frame_count_source = "decoded"
+            while capture.grab():
+                frame_count += 1
+    finally:
+        capture.release()
+    if frame_count <= 0:
+        raise ValueError("Video has no decodable frames")
+    return {
+        "fps": fps,
+        "frame_count": frame_count,
+        "frame_count_source": frame_count_source,
+        "duration_seconds": frame_count / fps,
+    }
+
+
+def plan_segments(
+    frame_count: int,
+    fps: float,
+    segment_seconds: float,
+    warmup_seconds: float
+) -> List[VideoSegment]:
+    """Cut the recording into segments, each with the warm-up span that precedes it."""
+    segment_frames = max(1, int(round(segment_seconds * fps)))
+    warmup_frames = max(0, int(round(warmup_seconds * fps)))
+    segments = []
+    for index, start in enumerate(range(0, frame_count, segment_frames)):
+        segments.append(VideoSegment(
+            index=index,
+            start_frame=start,
+            end_frame=min(frame_count, start + segment_frames),
+            warmup_frame=max(0, start - warmup_frames)
+        ))
+    return segments
+
+
+def _frame_record(frame_index: int, frame_time: float, result: Dict) -> Dict[str, object]:
+    loop_state = result.get("loop_detection") or {}
+    alerts = result.get("alerts") or []
+    # Only frames the loop detector ran on feed the whole-video replay pass
+    hashed = loop_state.get("last_updated") == frame_time
+    return {
+        "frame": frame_index,
+        "t": round(frame_time, 3),
+        "focus_score": result.get("focus_score"),
+        "state": result.get("state"),
+        "alerts": alerts,
+        "faces_detected": result.get("faces_detected"),
+        "device_detected": "device_detected" in alerts,
+        "loop_detected": bool(loop_state.get("detected")),
+        "loop_confidence": round(float(loop_state.get("confidence", 0.0)), 3),
+        "frame_hash": loop_state.get("last_hash") if hashed else None,
+    }
+
+
+def mark_replays(records: List[Dict[str, object]], index: HashSequenceIndex) -> int:
+    """
+    Run the merged, in-order frame hashes through one session-long replay index and
+    flag every frame that continues a replay run, the way a live session would.
+    Strips the hashes from the records and returns how many frames were newly flagged.
+    """
+    flagged = 0
+    for record in records:
+        frame_hash = record.pop("frame_hash", None)
+        if frame_hash is None or index.add(record["t"], frame_hash) is None:
+            continue
+        if not record["loop_detected"]:
+            flagged += 1
+        record["loop_detected"] = True
+        record["loop_confidence"] = 1.0
+        if "looping_video" not in record["alerts"]:
+            record["alerts"].append("looping_video")
+    return flagged
+
+
+def analyze_segment(
+    path: str,
+    segment: VideoSegment,
+    fps: float,
+    frame_step: int,
+    processing_max_side: int,
+    device_config: Optional[DeviceDetectorConfig] = None,
+    schedule: Optional[DetectorSchedule] = None
+) -> List[Dict[str, object]]:
+    """Worker entry point: warm a fresh monitor up, then record every `frame_step`-th frame."""
+    global _process_models
+    if _process_models is None:
+        _process_models = SharedModels(device_config=device_config)
+    monitor = FocusMonitor(
+        models=_process_models,
+        schedule=schedule,
+        processing_max_side=processing_max_side
+    )
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    records: List[Dict[str, object]] = []
+    try:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, segment.warmup_frame)
+        for frame_index in range(segment.warmup_frame, segment.end_frame):
+            # Sample on the absolute frame index so segment boundaries do not shift the grid
+            if frame_index % frame_step:
+                if not capture.grab():
+                    break
+                continue
+            success, frame = capture.read()
+            if not success:
+                break
+            frame_time = frame_index / fps
+            result = monitor.analyze_frame(frame, frame_time=frame_time)
+            if frame_index >= segment.start_frame and result.get("success"):
+                records.append(_frame_record(frame_index, frame_time, result))
+    finally:
+        capture.release()
+    return records
+
+
+def summarize_seconds(records: List[Dict[str, object]]) -> List[Dict[str, object]]:
+    """Roll frame records up into one row per second of video."""
+    seconds: Dict[int, List[Dict[str, object]]] = {}
+    for record in records:
+        seconds.setdefault(int(record["t"]), []).append(record)
+    timeline = []
+    for second in sorted(seconds):
+        rows = seconds[second]
+        scores = [row["focus_score"] for row in rows]
+        alerts = Counter(alert for row in rows for alert in row["alerts"])
+        states = Counter(row["state"] for row in rows)
+        timeline.append({
+            "second": second,
+            "frames": len(rows),
+            "focus_score_mean": round(sum(scores) / len(scores), 2),
+            "focus_score_min": min(scores),
+            "state": states.most_common(1)[0][0],
+            "alerts": dict(alerts),
+            "max_faces": max(row["faces_detected"] or 0 for row in rows),
+            "device_detected": any(row["device_detected"] for row in rows),
+            "loop_detected": any(row["loop_detected"] for row in rows),
+        })
+    return timeline
+
+
+class OfflineVideoAnalyzer:
+    """Fan a recording out over worker processes and merge the results into a timeline."""
+
+    def __init__(
+        self,
+        workers: int = 0,
+        segment_seconds: float = 60.0,
+        warmup_seconds: float = 5.0,
+        sample_fps: float = 5.0,
+        processing_max_side: int = 640,
+        device_config: Optional[DeviceDetectorConfig] = None,
+        schedule: Optional[DetectorSchedule] = None
+    ):
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.segment_seconds = segment_seconds
+        self.warmup_seconds = warmup_seconds
+        self.sample_fps = sample_fps
+        self.processing_max_side = processing_max_side
+        self.device_config = device_config
+        # Every stage on every sampled frame unless the caller trades accuracy for speed
+        self.schedule = schedule or DetectorSchedule()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: the API process runs threads (event loop, batcher, writers) that fork would copy mid-flight
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def analyze(self, path: str, include_frames: bool = True) -> Dict[str, object]:
+        started = time.perf_counter()
+        info = probe_video(path)
+        fps = info["fps"]
+        frame_step = max(1, int(round(fps / self.sample_fps))) if self.sample_fps > 0 else 1
+        segments = plan_segments(info["frame_count"], fps, self.segment_seconds, self.warmup_seconds)
+        logger.info(
+            "Analysing %s: %.0f s at %.1f fps in %d segments on %d workers (every %d frames)",
+            path, info["duration_seconds"], fps, len(segments), self.workers, frame_step
+        )
+
+        pool = self._pool()
+        jobs = [
+            pool.submit(
+                analyze_segment, path, segment, fps, frame_step,
+                self.processing_max_side, self.device_config, self.schedule
+            )
+            for segment in segments
+        ]
+        # Segments are contiguous and in order, so concatenation is the merge
+        records: List[Dict[str, object]] = []
+        for job in jobs:
+            records.extend(job.result())
+        replay_index = HashSequenceIndex()
+        replay_frames = mark_replays(records, replay_index)
+
+        alert_totals = Counter(alert for record in records for alert in record["alerts"])
+        away_frames = sum(1 for record in records if record["state"] == "away")
+        report: Dict[str, object] = {
+            "video": {**info, "path": path},
+            "analysis": {
+                "frames_analyzed": len(records),
+                "frame_step": frame_step,
+                "segments": len(segments),
+                "workers": self.workers,
+                "schedule": asdict(self.schedule),
+                # Replays the per-segment monitors could not see, found by the whole-video pass
+                "replay_frames_added": replay_frames,
+                "replay_keyframes": len(replay_index),
+                "elapsed_seconds": round(time.perf_counter() - started, 2),
+            },
+            "summary": {
+                "mean_focus_score": round(
+                    sum(record["focus_score"] for record in records) / len(records), 2
+                ) if records else None,
+                "away_ratio": round(away_frames / len(records), 4) if records else None,
+                "alert_frames": dict(alert_totals),
+                "device_seconds": sorted({int(r["t"]) for r in records if r["device_detected"]}),
+                "loop_seconds": sorted({int(r["t"]) for r in records if r["loop_detected"]}),
+            },
+            "timeline": summarize_seconds(records),
+        }
+        if include_frames:
+            report["frames"] = records
+        return report
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Analyse a recorded exam video offline")
+    parser.add_argument("video", help="path to the recording")
+    parser.add_argument("--workers", type=int, default=0, help="0 = one per CPU core")
+    parser.add_argument("--segment-seconds", type=float, default=60.0)
+    parser.add_argument("--warmup-seconds", type=float, default=5.0)
+    parser.add_argument("--sample-fps", type=float, default=5.0, help="0 = analyse every frame")
+    parser.add_argument("--processing-max-side", type=int, default=640)
+    parser.add_argument("--no-frames", action="store_true", help="only emit the per-second timeline")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    analyzer = OfflineVideoAnalyzer(
+        workers=args.workers,
+        segment_seconds=args.segment_seconds,
+        warmup_seconds=args.warmup_seconds,
+        sample_fps=args.sample_fps,
+        processing_max_side=args.processing_max_side
+    )
+    try:
+        report = analyzer.analyze(args.video, include_frames=not args.no_frames)
+    finally:
+        analyzer.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output + "\n")
+        logger.info("Wrote %s", args.output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+Session-long replay detection: multi-index hashing over frame dHashes plus diagonal
+run tracking to find repeated *sequences* of frames (e.g. a clip played on repeat).
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from loop_detector import popcount64
+
+_BLOCK_SHIFTS = (48, 32, 16, 0)
+_BLOCK_MASK = 0xFFFF
+_SINGLE_BIT_FLIPS = tuple(1 << bit for bit in range(16))
+
+
+class _Run:
+    """Consecutive frames that matched history at (roughly) the same time offset."""
+
+    __slots__ = ("offset", "start_time", "last_time", "source_start", "matches", "sources")
+
+    def __init__(self, offset: float, now: float, source_time: float, source_seq: int):
+        self.offset = offset
+        self.start_time = now
+        self.last_time = now
+        self.source_start = source_time
+        self.matches = 1
+        self.sources = {source_seq}
+
+    @property
+    def duration(self) -> float:
+        return self.last_time - self.start_time
+
+
+class HashSequenceIndex:
+    """
+    Indexed history of keyframe hashes for a whole session.
+
+    Only "novel" frames (further than `tolerance_bits` from the previous keyframe) are
+    indexed, so static stretches cost one entry. Each keyframe is filed under its four
+    16-bit blocks; since `tolerance_bits` <= 7, any match within tolerance differs by
+    at most one bit in some block, so probing each block and its 16 one-bit neighbours
+    finds every candidate without scanning history. Buckets keep only their newest
+    `bucket_limit` entries and the keyframe ring holds at most `max_keyframes` (evicting
+    oldest first), which bounds memory for multi-hour sessions. The ring starts small
+    and doubles as keyframes arrive, and a pickled index carries only the keyframes
+    it holds, so short or idle sessions stay cheap to keep and to ship to workers.
+
+    A replay shows up as a run of frames that all match history at a constant time
+    offset; runs that last `min_run_seconds` and walk through at least
+    `min_distinct_sources` different source keyframes (i.e. the replayed segment has
+    motion) are reported with their offset and period.
+    """
+
+    INITIAL_CAPACITY = 256
+
+    def __init__(
+        self,
+        tolerance_bits: int = 7,
+        max_keyframes: int = 20_000,
+        bucket_limit: int = 32,
+        min_offset_seconds: float = 20.0,
+        min_run_seconds: float = 8.0,
+        min_distinct_sources: int = 4,
+        offset_resolution: float = 0.5,
+        gap_seconds: float = 1.5
+    ):
+        if tolerance_bits > 7:
+            raise ValueError("tolerance_bits above 7 is not covered by one-bit block probes")
+        self.tolerance_bits = tolerance_bits
+        self.max_keyframes = max_keyframes
+        self.bucket_limit = bucket_limit
+        self.min_offset_seconds = min_offset_seconds
+        self.min_run_seconds = min_run_seconds
+        self.min_distinct_sources = min_distinct_sources
+        self.offset_resolution = offset_resolution
+        self.gap_seconds = gap_seconds
+
+        self._hashes = np.zeros(min(max_keyframes, self.INITIAL_CAPACITY), dtype=np.uint64)
+        self._times = np.zeros(len(self._hashes), dtype=np.float64)
+        self._head = 0
+        self._tail = 0
+        # block value -> keyframe sequence numbers, oldest first
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in _BLOCK_SHIFTS]
+        self._last_keyframe_hash: Optional[int] = None
+        self._runs: Dict[int, _Run] = {}
+        self.session_start: Optional[float] = None
+        self.best_run: Optional[_Run] = None
+
+    def __len__(self) -> int:
+        return self._tail - self._head
+
+    def __getstate__(self) -> Dict[str, object]:
+        state = self.__dict__.copy()
+        # Live keyframes only, oldest first; __setstate__ lays them out again
+        positions = np.arange(self._head, self._tail) % len(self._hashes)
+        state["_hashes"] = self._hashes[positions]
+        state["_times"] = self._times[positions]
+        return state
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.__dict__.update(state)
+        hashes, times = self._hashes, self._times
+        capacity = min(self.max_keyframes, max(self.INITIAL_CAPACITY, len(hashes)))
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self._times = np.zeros(capacity, dtype=np.float64)
+        positions = np.arange(self._head, self._tail) % capacity
+        self._hashes[positions] = hashes
+        self._times[positions] = times
+
+    def _grow(self) -> None:
+        capacity = len(self._hashes)
+        new_capacity = min(self.max_keyframes, capacity * 2)
+        positions = np.arange(self._head, self._tail)
+        hashes = np.zeros(new_capacity, dtype=np.uint64)
+        times = np.zeros(new_capacity, dtype=np.float64)
+        # Keyframes stay at sequence % capacity, so bucket entries remain valid
+        hashes[positions % new_capacity] = self._hashes[positions % capacity]
+        times[positions % new_capacity] = self._times[positions % capacity]
+        self._hashes, self._times = hashes, times
+
+    def add(self, timestamp: float, frame_hash: int) -> Optional[_Run]:
+        """Match a frame against history, index it if novel, and return the active replay run."""
+        if self.session_start is None:
+            self.session_start = timestamp
+
+        self._match(timestamp, frame_hash)
+
+        if (
+            self._last_keyframe_hash is None
+            or (frame_hash ^ self._last_keyframe_hash).bit_count() > self.tolerance_bits
+        ):
+            self._insert(timestamp, frame_hash)
+
+        self.best_run = self._best_run()
+        return self.best_run
+
+    def _candidates(self, frame_hash: int) -> List[int]:
+        found = set()
+        for block_index, shift in enumerate(_BLOCK_SHIFTS):
+            buckets = self._buckets[block_index]
+            block = (frame_hash >> shift) & _BLOCK_MASK
+            for probe in (block, *(block ^ flip for flip in _SINGLE_BIT_FLIPS)):
+                bucket = buckets.get(probe)
+                if bucket:
+                    found.update(bucket)
+        return list(found)
+
+    def _match(self, timestamp: float, frame_hash: int) -> None:
+        candidates = self._candidates(frame_hash)
+        if candidates:
+            seqs = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            positions = seqs % len(self._hashes)
+            distances = popcount64(self._hashes[positions] ^ np.uint64(frame_hash))
+            offsets = timestamp - self._times[positions]
+            keep = (distances <= self.tolerance_bits) & (offsets >= self.min_offset_seconds)
+            for seq, offset in zip(seqs[keep], offsets[keep]):
+                self._extend_run(timestamp, float(offset), int(seq))
+
+        # Runs that have not been extended recently are over
+        stale = [key for key, run in self._runs.items() if timestamp - run.last_time > self.gap_seconds]
+        for key in stale:
+            del self._runs[key]
+
+    def _extend_run(self, timestamp: float, offset: float, source_seq: int) -> None:
+        key = int(round(offset / self.offset_resolution))
+        run = None
+        # Tolerate capture jitter by accepting neighbouring offset bins
+        for candidate_key in (key, key - 1, key + 1):
+            run = self._runs.get(candidate_key)
+            if run is not None:
+                key = candidate_key
+                break
+        source_time = float(self._times[source_seq % len(self._times)])
+        if run is None:
+            self._runs[key] = _Run(offset, timestamp, source_time, source_seq)
+            return
+        if run.last_time != timestamp:
+            run.matches += 1
+        run.last_time = timestamp
+        run.source_start = min(run.source_start, source_time)
+        run.sources.add(source_seq)
+
+    def _best_run(self) -> Optional[_Run]:
+        qualifying = [
+            run for run in self._runs.values()
+            if run.duration >= self.min_run_seconds and len(run.sources) >= self.min_distinct_sources
+        ]
+        if not qualifying:
+            return None
+        # A clip on repeat matches at every multiple of its period; the smallest is the period
+        return min(qualifying, key=lambda run: run.offset)
+
+    def _insert(self, timestamp: float, frame_hash: int) -> None:
+        if len(self) == len(self._hashes):
+            if len(self._hashes) < self.max_keyframes:
+                self._grow()
+            else:
+                self._evict_oldest()
+        seq = self._tail
+        position = seq % len(self._hashes)
+        self._hashes[position] = np.uint64(frame_hash)
+        self._times[position] = timestamp
+        self._tail += 1
+        self._last_keyframe_hash = frame_hash
+        for block_index, shift in enumerate(_BLOCK_SHIFTS):
+            block = (frame_hash >> shift) & _BLOCK_MASK
+            bucket = self._buckets[block_index].setdefault(block, [])
+            bucket.append(seq)
+            if len(bucket) > self.bucket_limit:
+                del bucket[0]
+
+    def _evict_oldest(self) -> None:
+        seq = self._head
+        frame_hash = int(self._hashes[seq % len(self._hashes)])
+        self._head += 1
+        # Buckets are in insertion order, so the evicted keyframe can only sit at the front
+        for block_index, shift in enumerate(_BLOCK_SHIFTS):
+            buckets = self._buckets[block_index]
+            block = (frame_hash >> shift) & _BLOCK_MASK
+            bucket = buckets.get(block)
+            if bucket and bucket[0] == seq:
+                del bucket[0]
+                if not bucket:
+                    del buckets[block]
+
+    def state(self) -> Dict[str, object]:
+        """Fields merged into FocusMonitor.loop_detection_state."""
+        run = self.best_run
+        if run is None:
+            return {
+                "replay_detected": False,
+                "replay_period_seconds": 0.0,
+                "replay_offset_seconds": 0.0,
+                "replay_match_seconds": 0.0,
+                "indexed_keyframes": len(self),
+            }
+        return {
+            "replay_detected": True,
+            "replay_period_seconds": round(run.offset, 2),
+            "replay_offset_seconds": round(run.source_start - (self.session_start or 0.0), 2),
+            "replay_match_seconds": round(run.duration, 2),
+            "indexed_keyframes": len(self),
+        }
@@ -0,0 +1,187 @@
+"""
+Risk-triggered scheduling of the expensive detector stages
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+
+from loop_detector import hamming_distance
+
+# Analysis tiers, richest first: FaceMesh + pose + YOLO; FaceMesh without YOLO; Haar
+# cascades with ROI tracking; loop detection only (the last verdict is carried forward)
+ANALYSIS_TIERS = ("full", "no_device", "cascade", "loop_only")
+
+
+@dataclass
+class DetectorSchedule:
+    """
+    Per-stage cadence. Cheap signals (frame hash, face analysis) run every frame;
+    YOLO device detection runs every `device_every_n_frames` frames unless one of
+    the triggers below asks for it sooner. The defaults analyse every frame fully
+    (offline analysis, benchmarks); the API turns on its cadence and the change
+    gate through settings.
+    """
+
+    device_every_n_frames: int = 1
+    loop_every_n_frames: int = 1
+    # Hamming distance between frame hashes that counts as a scene change
+    scene_change_bits: int = 14
+    pitch_trigger_degrees: float = 20.0
+    yaw_trigger_degrees: float = 24.0
+    gaze_drift_trigger: bool = True
+    # Keep YOLO hot while a device is (or was just) in view so it confirms or clears fast
+    device_presence_trigger: float = 0.2
+    # Cascade fallback: track the face in an expanded ROI, full-frame scan every N frames
+    cascade_full_every_n_frames: int = 10
+    cascade_roi_margin: float = 0.5
+    # FaceMesh cadence: in between, the gaze/pose landmarks are tracked with Lucas-Kanade
+    # and solvePnP starts from the last pose (1 = full mesh every frame, no tracking).
+    # Experimental; validated only by benchmark.py on recorded video
+    mesh_every_n_frames: int = 1
+    # Start solvePnP from the previous pose (always on while tracking); a fresh solve
+    # can land on the mirrored pose behind the camera and jump between frames
+    pose_warm_start: bool = False
+    # Change gate: a frame within these distances of the last fully analysed one reuses
+    # its verdict (mean diff is over a 32x24 grey thumbnail; 0 = hash only). A full
+    # analysis still runs at least every `static_full_every_n_frames` frames.
+    static_gate: bool = False
+    static_gate_bits: int = 3
+    static_gate_mean_diff: float = 2.5
+    static_full_every_n_frames: int = 10
+    # loop_only tier (load shedding) carries the last verdict forward; a cascade pass
+    # still runs every N frames, and at once when the frame hash moves by
+    # `scene_change_bits` from the last analysed frame (someone left, a phone came up)
+    loop_only_full_every_n_frames: int = 10
+
+
+class DetectorScheduler:
+    """Per-session bookkeeping that decides when each expensive stage runs."""
+
+    def __init__(self, schedule: Optional[DetectorSchedule] = None):
+        self.schedule = schedule or DetectorSchedule()
+        self._frames_since_device = 0
+        self._frames_since_loop = 0
+        self._frames_since_cascade_scan = 0
+        self._frames_since_mesh = 0
+        self._device_hash: Optional[int] = None
+        self._device_faces: Optional[int] = None
+        self._frames_since_full = 0
+        self._full_hash: Optional[int] = None
+        self._full_thumbnail: Optional[np.ndarray] = None
+
+    def device_run_reason(
+        self,
+        frame_hash: int,
+        previous_details: Dict[str, object],
+        device_presence: float
+    ) -> Optional[str]:
+        """Return why YOLO should run on this frame, or None to reuse the last boxes."""
+        schedule = self.schedule
+        if self._device_hash is None:
+            return "first_frame"
+        if self._frames_since_device + 1 >= schedule.device_every_n_frames:
+            return "cadence"
+        if device_presence >= schedule.device_presence_trigger:
+            return "device_presence"
+        if hamming_distance(frame_hash, self._device_hash) >= schedule.scene_change_bits:
+            return "scene_change"
+
+        faces = previous_details.get("faces_detected")
+        if faces is not None and self._device_faces is not None and faces != self._device_faces:
+            return "face_count"
+        pitch = previous_details.get("pitch")
+        if pitch is not None and abs(pitch) >= schedule.pitch_trigger_degrees:
+            return "head_pitch"
+        yaw = previous_details.get("yaw")
+        if yaw is not None and abs(yaw) >= schedule.yaw_trigger_degrees:
+            return "head_yaw"
+        if schedule.gaze_drift_trigger and previous_details.get("gaze_ok") is False:
+            return "gaze_drift"
+        return None
+
+    def mark_device_run(self, frame_hash: int, faces_detected: Optional[int]) -> None:
+        self._frames_since_device = 0
+        self._device_hash = frame_hash
+        self._device_faces = faces_detected
+
+    def mark_device_skipped(self) -> None:
+        self._frames_since_device += 1
+
+    def should_run_loop_detector(self) -> bool:
+        self._frames_since_loop += 1
+        if self._frames_since_loop >= self.schedule.loop_every_n_frames:
+            self._frames_since_loop = 0
+            return True
+        return False
+
+    def cascade_scan_reason(self, tracking: bool) -> Optional[str]:
+        """Return why the cascades need a full-frame scan, or None to search the tracked ROI."""
+        if not tracking:
+            return "face_lost"
+        if self._frames_since_cascade_scan + 1 >= self.schedule.cascade_full_every_n_frames:
+            return "cadence"
+        return None
+
+    def mark_cascade_full_scan(self) -> None:
+        self._frames_since_cascade_scan = 0
+
+    def mark_cascade_tracked(self) -> None:
+        self._frames_since_cascade_scan += 1
+
+    @property
+    def mesh_tracking(self) -> bool:
+        return self.schedule.mesh_every_n_frames > 1
+
+    @property
+    def pose_warm_start(self) -> bool:
+        return self.schedule.pose_warm_start or self.mesh_tracking
+
+    def mesh_run_reason(self, tracking: bool) -> Optional[str]:
+        """Return why FaceMesh must run on this frame, or None to track the last landmarks."""
+        if not tracking:
+            return "not_tracking"
+        if self._frames_since_mesh + 1 >= self.schedule.mesh_every_n_frames:
+            return "cadence"
+        return None
+
+    def mark_mesh_run(self) -> None:
+        self._frames_since_mesh = 0
+
+    def mark_mesh_tracked(self) -> None:
+        self._frames_since_mesh += 1
+
+    def static_reuse(self, frame_hash: int, thumbnail: Optional[np.ndarray]) -> bool:
+        """True when the frame barely differs from the last fully analysed one."""
+        schedule = self.schedule
+        if not schedule.static_gate or self._full_hash is None:
+            return False
+        if self._frames_since_full + 1 >= schedule.static_full_every_n_frames:
+            return False
+        if hamming_distance(frame_hash, self._full_hash) > schedule.static_gate_bits:
+            return False
+        if thumbnail is not None and self._full_thumbnail is not None:
+            if thumbnail.shape != self._full_thumbnail.shape:
+                return False
+            mean_diff = float(np.abs(thumbnail.astype(np.int16) - self._full_thumbnail).mean())
+            if mean_diff > schedule.static_gate_mean_diff:
+                return False
+        return True
+
+    def loop_only_escalation(self, frame_hash: int) -> Optional[str]:
+        """Return why a loop_only frame needs a real (cascade) analysis, or None to carry the verdict."""
+        if self._full_hash is None:
+            return "first_frame"
+        if self._frames_since_full + 1 >= self.schedule.loop_only_full_every_n_frames:
+            return "cadence"
+        if hamming_distance(frame_hash, self._full_hash) >= self.schedule.scene_change_bits:
+            return "scene_change"
+        return None
+
+    def mark_full_analysis(self, frame_hash: int, thumbnail: Optional[np.ndarray]) -> None:
+        self._frames_since_full = 0
+        self._full_hash = frame_hash
+        self._full_thumbnail = thumbnail
+
+    def mark_reused(self) -> None:
+        self._frames_since_full += 1
@@ -0,0 +1,135 @@
+"""
+Per-session FocusMonitor registry with LRU and idle-timeout eviction
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _SessionEntry(Generic[T]):
+    __slots__ = ("monitor", "created_at", "last_seen")
+
+    def __init__(self, monitor: T, now: float):
+        self.monitor = monitor
+        self.created_at = now
+        self.last_seen = now
+
+
+class SessionRegistry(Generic[T]):
+    """
+    Keep one monitor per session id so temporal state never leaks between students.
+    Entries are ordered by last use; idle sessions are dropped after `idle_timeout`
+    seconds and the least recently used one is evicted once `max_sessions` is reached.
+    `on_evict` is called with every monitor that leaves the registry, outside the lock.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], T],
+        max_sessions: int = 256,
+        idle_timeout: float = 300.0,
+        on_evict: Optional[Callable[[T], None]] = None
+    ):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self._factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._on_evict = on_evict
+        self._sessions: "OrderedDict[str, _SessionEntry[T]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created_total = 0
+        self.evicted_total = 0
+
+    def acquire(self, session_id: str) -> T:
+        """Return the monitor for `session_id`, creating it when missing."""
+        now = time.monotonic()
+        evicted: List[T] = []
+        with self._lock:
+            evicted.extend(self._evict_idle_locked(now))
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                while len(self._sessions) >= self.max_sessions:
+                    evicted_id, evicted_entry = self._sessions.popitem(last=False)
+                    evicted.append(evicted_entry.monitor)
+                    self.evicted_total += 1
+                    logger.warning("Session cap reached; evicted least recently used session %s", evicted_id)
+
+                entry = _SessionEntry(self._factory(), now)
+                self._sessions[session_id] = entry
+                self.created_total += 1
+            else:
+                entry.last_seen = now
+                self._sessions.move_to_end(session_id)
+        self._notify_evicted(evicted)
+        return entry.monitor
+
+    def get(self, session_id: str) -> Optional[T]:
+        """Return an existing monitor without creating or touching it."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry.monitor if entry is not None else None
+
+    def release(self, session_id: str) -> bool:
+        """Drop a session explicitly, e.g. when an anonymous connection closes."""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry is None:
+            return False
+        self._notify_evicted([entry.monitor])
+        return True
+
+    def evict_idle(self) -> int:
+        """Remove every session idle for longer than `idle_timeout`."""
+        with self._lock:
+            evicted = self._evict_idle_locked(time.monotonic())
+        self._notify_evicted(evicted)
+        return len(evicted)
+
+    def _notify_evicted(self, monitors: List[T]) -> None:
+        if self._on_evict is None:
+            return
+        for monitor in monitors:
+            try:
+                self._on_evict(monitor)
+            except Exception:
+                logger.exception("Session eviction callback failed")
+
+    def _evict_idle_locked(self, now: float) -> List[T]:
+        if self.idle_timeout <= 0:
+            return []
+        evicted: List[T] = []
+        # Entries are kept in LRU order, so the idle ones are at the front
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if now - entry.last_seen <= self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)
+            evicted.append(entry.monitor)
+            logger.info("Evicted idle session %s", session_id)
+        self.evicted_total += len(evicted)
+        return evicted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, session_id: object) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_timeout": self.idle_timeout,
+                "created_total": self.created_total,
+                "evicted_total": self.evicted_total,
+            }
@@ -0,0 +1,7 @@
+"""
+Make the model_prediction modules importable the way api.py imports them
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,47 @@
+import asyncio
+
+from backpressure import LatestFrameSlot
+
+
+def test_put_overwrites_unread_frame():
+    async def scenario():
+        slot = LatestFrameSlot()
+        slot.put(1)
+        slot.put(2)
+        slot.put(3)
+        assert await slot.take() == 3
+        slot.put(4)
+        assert await slot.take() == 4
+        return slot
+
+    slot = asyncio.run(scenario())
+    assert slot.received == 4
+    assert slot.dropped == 2
+
+
+def test_take_waits_for_put():
+    async def scenario():
+        slot = LatestFrameSlot()
+        waiter = asyncio.ensure_future(slot.take())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        slot.put("frame")
+        return await asyncio.wait_for(waiter, 1.0)
+
+    assert asyncio.run(scenario()) == "frame"
+
+
+def test_close_drains_then_returns_none():
+    async def scenario():
+        slot = LatestFrameSlot()
+        slot.put("last")
+        slot.close()
+        first = await slot.take()
+        second = await slot.take()
+        idle = LatestFrameSlot()
+        waiter = asyncio.ensure_future(idle.take())
+        await asyncio.sleep(0)
+        idle.close()
+        return first, second, await asyncio.wait_for(waiter, 1.0)
+
+    assert asyncio.run(scenario()) == ("last", None, None)
@@ -0,0 +1,59 @@
+from frame_clock import FrameClock, FrameStamp, stamp_from_fields
+
+
+def test_offset_learned_from_first_capture():
+    clock = FrameClock()
+    timestamp, info = clock.place(FrameStamp(arrival=1000.0, capture_timestamp=5.0, sequence=1))
+    assert timestamp == 1000.0 and info["source"] == "capture"
+    # Arrived late, but placed at capture time through the learned offset
+    timestamp, info = clock.place(FrameStamp(arrival=1003.0, capture_timestamp=5.5, sequence=2))
+    assert timestamp == 1000.5
+    assert info["source"] == "capture" and not info["clamped"]
+
+
+def test_untrusted_capture_time_is_clamped_and_relearned():
+    clock = FrameClock(max_lag_seconds=10.0, max_lead_seconds=1.0)
+    clock.place(FrameStamp(arrival=1000.0, capture_timestamp=5.0))
+    # Client clock jumped forward by an hour
+    timestamp, info = clock.place(FrameStamp(arrival=1001.0, capture_timestamp=3606.0))
+    assert timestamp == 1001.0
+    assert info["clamped"] and info["source"] == "arrival"
+    assert clock.clamped_total == 1
+    # The new offset is used from here on
+    timestamp, info = clock.place(FrameStamp(arrival=1002.5, capture_timestamp=3607.0))
+    assert timestamp == 1002.0 and not info["clamped"]
+
+
+def test_timeline_never_runs_backwards():
+    clock = FrameClock()
+    clock.place(FrameStamp(arrival=1000.0, capture_timestamp=10.0))
+    clock.place(FrameStamp(arrival=1001.0, capture_timestamp=11.0))
+    timestamp, info = clock.place(FrameStamp(arrival=1002.0, capture_timestamp=10.5))
+    assert timestamp == 1001.0 and info["out_of_order"]
+    assert clock.out_of_order_total == 1
+
+
+def test_sequence_breaks_ties_across_wrap():
+    clock = FrameClock()
+    clock.place(FrameStamp(arrival=1000.0, sequence=2**32 - 1))
+    # 0 follows 2**32 - 1 once the counter wraps
+    _, info = clock.place(FrameStamp(arrival=1000.0, sequence=0))
+    assert not info["out_of_order"]
+    _, info = clock.place(FrameStamp(arrival=1000.0, sequence=2**32 - 1))
+    assert info["out_of_order"]
+
+
+def test_reset_forgets_offset():
+    clock = FrameClock()
+    clock.place(FrameStamp(arrival=1000.0, capture_timestamp=5.0))
+    clock.reset()
+    timestamp, info = clock.place(FrameStamp(arrival=900.0, capture_timestamp=50.0))
+    assert timestamp == 900.0 and not info["out_of_order"]
+
+
+def test_stamp_from_fields_ignores_malformed_values():
+    stamp = stamp_from_fields("nan", True, arrival=5.0)
+    assert stamp == FrameStamp(5.0, None, None)
+    stamp = stamp_from_fields("12.5", 2**32 + 3, arrival=5.0)
+    assert stamp == FrameStamp(5.0, 12.5, 3)
+    assert stamp_from_fields(-1, "x", arrival=5.0) == FrameStamp(5.0, None, None)
@@ -0,0 +1,77 @@
+import copy
+import json
+
+import pytest
+
+from frame_protocol import DeltaEncoder, apply_delta, diff_result, pack_binary_frame, parse_binary_frame
+
+
+def _results():
+    base = {
+        "success": True,
+        "focus_score": 0.9,
+        "state": "focused",
+        "alerts": [],
+        "loop_detection": {"looping": False, "dominant_ratio": 0.1, "window": 60},
+    }
+    first = copy.deepcopy(base)
+    second = copy.deepcopy(base)
+    second["focus_score"] = 0.4
+    second["loop_detection"]["dominant_ratio"] = 0.2
+    third = copy.deepcopy(second)
+    third["alerts"] = ["no_face"]
+    del third["loop_detection"]["window"]
+    fourth = copy.deepcopy(third)
+    del fourth["loop_detection"]
+    failed = {"success": False, "error": "decode"}
+    return [first, second, third, fourth, failed, copy.deepcopy(base)]
+
+
+def test_delta_stream_round_trip():
+    encoder = DeltaEncoder(keyframe_interval=100)
+    state = {}
+    kinds = []
+    for result in _results():
+        # Over the wire, so the client never shares objects with the encoder
+        message = json.loads(json.dumps(encoder.encode(result)))
+        kinds.append(message["type"])
+        state = apply_delta(state, message)
+        assert state == result
+    assert kinds == ["keyframe", "delta", "delta", "delta", "keyframe", "delta"]
+
+
+def test_keyframe_interval_and_resync():
+    encoder = DeltaEncoder(keyframe_interval=3)
+    result = {"success": True, "focus_score": 1.0}
+    kinds = [encoder.encode(dict(result))["type"] for _ in range(6)]
+    assert kinds == ["keyframe", "delta", "delta", "keyframe", "delta", "delta"]
+    encoder.request_keyframe()
+    message = encoder.encode(dict(result))
+    assert message["type"] == "keyframe" and message["seq"] == 7
+
+
+def test_delta_references_previous_sequence():
+    encoder = DeltaEncoder()
+    encoder.encode({"success": True, "a": 1})
+    message = encoder.encode({"success": True, "a": 2})
+    assert message == {"type": "delta", "seq": 2, "base": 1, "set": {"a": 2}}
+
+
+def test_diff_result_handles_arrays_and_removed_paths():
+    np = pytest.importorskip("numpy")
+    changed, removed = diff_result(
+        {"v": np.zeros(3), "nested": {"x": 1, "y": 2}},
+        {"v": np.zeros(3), "nested": {"x": 1}},
+    )
+    assert changed == {} and removed == [["nested", "y"]]
+
+
+def test_binary_frame_round_trip():
+    data = pack_binary_frame(b"jpeg-bytes", sequence=2**32 + 5, capture_timestamp=123.5)
+    frame = parse_binary_frame(data)
+    assert frame.sequence == 5
+    assert frame.capture_timestamp == 123.5
+    assert bytes(frame.image) == b"jpeg-bytes"
+    assert parse_binary_frame(pack_binary_frame(b"x")).capture_timestamp is None
+    with pytest.raises(ValueError):
+        parse_binary_frame(data[:4])
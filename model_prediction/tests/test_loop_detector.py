@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from loop_detector import HashClusterWindow, hamming_distance, popcount64
+
+
+def _greedy_clusters(entries, tolerance):
+    """Cluster the window from scratch: each hash joins the oldest representative in reach."""
+    reps, members = [], []
+    for timestamp, frame_hash in entries:
+        for index, rep in enumerate(reps):
+            if hamming_distance(rep, frame_hash) <= tolerance:
+                members[index].append(timestamp)
+                break
+        else:
+            reps.append(frame_hash)
+            members.append([timestamp])
+    return members
+
+
+def _stream(kind, frames, seed):
+    rng = np.random.default_rng(seed)
+    frame_hash = int(rng.integers(0, 2**64, dtype=np.uint64))
+    for _ in range(frames):
+        if kind == "random":
+            frame_hash = int(rng.integers(0, 2**64, dtype=np.uint64))
+        else:
+            # Slow drift keeps chains of clusters in reach of each other
+            frame_hash ^= 1 << int(rng.integers(64))
+        yield frame_hash
+
+
+def test_popcount_matches_python():
+    values = np.random.default_rng(0).integers(0, 2**64, size=100, dtype=np.uint64)
+    assert popcount64(values).tolist() == [int(value).bit_count() for value in values]
+
+
+@pytest.mark.parametrize("kind", ["random", "drift"])
+def test_window_matches_greedy_baseline(kind):
+    window = HashClusterWindow(window_seconds=20.0, tolerance_bits=6, initial_capacity=16)
+    entries = []
+    for step, frame_hash in enumerate(_stream(kind, 600, seed=5)):
+        timestamp = step / 5.0
+        window.add(timestamp, frame_hash)
+        entries = [(t, h) for t, h in entries + [(timestamp, frame_hash)] if timestamp - t <= 20.0]
+        clusters = _greedy_clusters(entries, 6)
+        largest = max(clusters, key=len)
+        assert window.cluster_count == len(clusters)
+        assert window.dominant() == (len(largest), min(largest), max(largest))
+    assert len(window) == 101
+
+
+def test_clear_empties_window():
+    window = HashClusterWindow(window_seconds=10.0, tolerance_bits=6)
+    window.add(0.0, 1)
+    window.clear()
+    assert len(window) == 0 and window.dominant() is None
@@ -0,0 +1,101 @@
+import math
+
+import numpy as np
+import pytest
+
+import offline_analysis
+from offline_analysis import mark_replays, plan_segments, probe_video
+from replay_index import HashSequenceIndex
+
+
+class _FakeCapture:
+    def __init__(self, fps, reported_count, frames):
+        self.fps = fps
+        self.reported_count = reported_count
+        self.frames = frames
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        if prop == offline_analysis.cv2.CAP_PROP_FPS:
+            return self.fps
+        return self.reported_count
+
+    def grab(self):
+        self.frames -= 1
+        return self.frames >= 0
+
+    def release(self):
+        pass
+
+
+def _patch_capture(monkeypatch, *args):
+    monkeypatch.setattr(offline_analysis.cv2, "VideoCapture", lambda path: _FakeCapture(*args))
+
+
+def test_probe_uses_header_count(monkeypatch):
+    _patch_capture(monkeypatch, 25.0, 250.0, 999)
+    info = probe_video("exam.mp4")
+    assert info["frame_count"] == 250 and info["frame_count_source"] == "header"
+    assert info["duration_seconds"] == 10.0
+
+
+@pytest.mark.parametrize("reported", [0.0, -1.0, math.nan, -9.2e18])
+def test_probe_counts_frames_when_header_has_none(monkeypatch, reported):
+    _patch_capture(monkeypatch, 30.0, reported, 90)
+    info = probe_video("exam.webm")
+    assert info["frame_count"] == 90 and info["frame_count_source"] == "decoded"
+    assert info["duration_seconds"] == 3.0
+
+
+def test_probe_rejects_unusable_videos(monkeypatch):
+    _patch_capture(monkeypatch, 0.0, 100.0, 100)
+    with pytest.raises(ValueError):
+        probe_video("exam.mp4")
+    _patch_capture(monkeypatch, 30.0, 0.0, 0)
+    with pytest.raises(ValueError):
+        probe_video("exam.webm")
+
+
+def test_plan_segments_cover_video_with_warmup():
+    segments = plan_segments(frame_count=1000, fps=10.0, segment_seconds=30.0, warmup_seconds=5.0)
+    assert [(s.start_frame, s.end_frame, s.warmup_frame) for s in segments] == [
+        (0, 300, 0), (300, 600, 250), (600, 900, 550), (900, 1000, 850),
+    ]
+
+
+def _records(hashes, fps=5.0):
+    return [
+        {
+            "frame": frame,
+            "t": round(frame / fps, 3),
+            "alerts": [],
+            "loop_detected": False,
+            "loop_confidence": 0.0,
+            "frame_hash": frame_hash,
+        }
+        for frame, frame_hash in enumerate(hashes)
+    ]
+
+
+def test_replay_pass_finds_repeats_across_segments():
+    rng = np.random.default_rng(7)
+    clip = [int(value) for value in rng.integers(0, 2**64, size=200, dtype=np.uint64)]
+    other = [int(value) for value in rng.integers(0, 2**64, size=400, dtype=np.uint64)]
+    # The clip plays at 0-40 s and again at 120-160 s, two 60 s segments apart
+    records = _records(clip + other + clip)
+    flagged = mark_replays(records, HashSequenceIndex())
+    replayed = [record["t"] for record in records if record["loop_detected"]]
+    assert flagged == len(replayed) > 0
+    assert min(replayed) >= 120.0
+    assert max(replayed) - min(replayed) >= 30.0
+    assert all("looping_video" in record["alerts"] for record in records if record["loop_detected"])
+    assert all("frame_hash" not in record for record in records)
+
+
+def test_replay_pass_skips_frames_without_hash():
+    records = _records([None] * 50)
+    records[0]["loop_detected"] = True
+    assert mark_replays(records, HashSequenceIndex()) == 0
+    assert records[0]["loop_detected"] and not records[1]["loop_detected"]
@@ -0,0 +1,87 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from replay_index import HashSequenceIndex
+
+
+def _random_hashes(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [int(value) for value in rng.integers(0, 2**64, size=count, dtype=np.uint64)]
+
+
+def _flip(frame_hash, bits, seed):
+    rng = np.random.default_rng(seed)
+    for bit in rng.choice(64, size=bits, replace=False):
+        frame_hash ^= 1 << int(bit)
+    return frame_hash
+
+
+@pytest.mark.parametrize("bits", range(8))
+def test_probe_finds_every_hash_within_tolerance(bits):
+    index = HashSequenceIndex(tolerance_bits=7)
+    hashes = _random_hashes(50)
+    for second, frame_hash in enumerate(hashes):
+        index.add(float(second), frame_hash)
+    for seq, frame_hash in enumerate(hashes):
+        assert seq in index._candidates(_flip(frame_hash, bits, seed=seq))
+
+
+def test_detects_clip_played_on_repeat():
+    index = HashSequenceIndex()
+    clip = _random_hashes(150, seed=1)  # 30 s at 5 fps
+    run = None
+    for repeat in range(2):
+        for frame, frame_hash in enumerate(clip):
+            run = index.add(repeat * 30.0 + frame / 5.0, _flip(frame_hash, 2, seed=frame) if repeat else frame_hash)
+    assert run is not None
+    assert run.offset == pytest.approx(30.0, abs=0.5)
+    assert run.duration >= index.min_run_seconds
+    assert index.state()["replay_detected"]
+
+
+def test_short_offsets_and_static_scenes_are_not_replays():
+    index = HashSequenceIndex()
+    clip = _random_hashes(25, seed=2)
+    # A 5 s clip looped for 19 s only ever repeats closer than min_offset_seconds
+    for step in range(95):
+        index.add(step / 5.0, clip[step % len(clip)])
+    assert index.best_run is None
+    static = HashSequenceIndex()
+    for step in range(600):
+        static.add(step / 5.0, 12345)
+    assert static.best_run is None and len(static) == 1
+
+
+def test_ring_grows_then_evicts_oldest():
+    index = HashSequenceIndex(max_keyframes=300)
+    hashes = _random_hashes(1000, seed=3)
+    for step, frame_hash in enumerate(hashes):
+        index.add(float(step), frame_hash)
+        if step == 100:
+            assert len(index._hashes) == HashSequenceIndex.INITIAL_CAPACITY
+    assert len(index) == 300 and len(index._hashes) == 300
+    # Evicted keyframes leave no bucket entries behind; live ones are still found
+    for buckets in index._buckets:
+        for bucket in buckets.values():
+            assert bucket and min(bucket) >= index._head
+    assert index._head in index._candidates(hashes[index._head])
+    assert 0 not in index._candidates(hashes[0])
+
+
+def test_pickle_carries_only_live_keyframes():
+    index = HashSequenceIndex(max_keyframes=2000)
+    hashes = _random_hashes(300, seed=4)
+    for step, frame_hash in enumerate(hashes):
+        index.add(float(step), frame_hash)
+    state = index.__getstate__()
+    assert len(state["_hashes"]) == 300
+    restored = pickle.loads(pickle.dumps(index))
+    assert len(restored) == 300
+    assert len(restored._hashes) == 300
+    for seq in (0, 150, 299):
+        position = seq % len(restored._hashes)
+        assert int(restored._hashes[position]) == hashes[seq]
+        assert restored._times[position] == float(seq)
+        assert seq in restored._candidates(hashes[seq])
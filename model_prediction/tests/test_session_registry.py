@@ -0,0 +1,72 @@
+import pytest
+
+import session_registry
+from session_registry import SessionRegistry
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(session_registry.time, "monotonic", fake)
+    return fake
+
+
+def test_acquire_reuses_monitor():
+    registry = SessionRegistry(object)
+    first = registry.acquire("a")
+    assert registry.acquire("a") is first
+    assert registry.get("b") is None
+    assert "a" in registry and len(registry) == 1
+    assert registry.stats()["created_total"] == 1
+
+
+def test_lru_eviction_drops_least_recently_used(clock):
+    evicted = []
+    registry = SessionRegistry(object, max_sessions=2, idle_timeout=0, on_evict=evicted.append)
+    a = registry.acquire("a")
+    registry.acquire("b")
+    clock.now += 1
+    registry.acquire("a")  # "b" is now the least recently used
+    registry.acquire("c")
+    assert "b" not in registry
+    assert registry.get("a") is a and "c" in registry
+    assert len(evicted) == 1
+    assert registry.stats()["evicted_total"] == 1
+
+
+def test_idle_eviction_and_release_notify(clock):
+    evicted = []
+    registry = SessionRegistry(object, idle_timeout=10.0, on_evict=evicted.append)
+    old = registry.acquire("old")
+    clock.now += 5
+    fresh = registry.acquire("fresh")
+    clock.now += 6
+    assert registry.evict_idle() == 1
+    assert evicted == [old]
+    assert registry.release("fresh") is True
+    assert registry.release("fresh") is False
+    assert evicted == [old, fresh]
+    assert len(registry) == 0
+
+
+def test_failing_on_evict_does_not_break_registry():
+    def explode(monitor):
+        raise RuntimeError("boom")
+
+    registry = SessionRegistry(object, max_sessions=1, on_evict=explode)
+    registry.acquire("a")
+    registry.acquire("b")
+    assert "b" in registry and "a" not in registry
+
+
+def test_rejects_empty_cap():
+    with pytest.raises(ValueError):
+        SessionRegistry(object, max_sessions=0)
@@ -0,0 +1,86 @@
+import pytest
+
+from timeline_store import TimelineStore, alert_mask, alert_names
+
+
+@pytest.fixture
+def store(tmp_path):
+    timeline = TimelineStore(str(tmp_path), block_rows=10_000, flush_seconds=3600.0)
+    yield timeline
+    timeline.shutdown()
+
+
+def _record(store, session_id, start, frames, fps=5.0, away_after=None, alerts=()):
+    for frame in range(frames):
+        t = start + frame / fps
+        away = away_after is not None and t >= away_after
+        result = {
+            "success": True,
+            "timestamp": t,
+            "focus_score": 0.2 if away else 0.9,
+            "state": "away" if away else "focused",
+            "faces_detected": 0 if away else 1,
+            "alerts": list(alerts) if away else [],
+        }
+        store.record(session_id, result, {"pitch": 1.0, "yaw": None})
+
+
+def test_query_counts_stored_and_buffered_rows_once(store):
+    _record(store, "s1", 1000.0, 50)
+    store.flush()
+    _record(store, "s1", 1010.0, 50)
+    summary = store.query("s1")
+    assert summary["aggregates"]["frames"] == 100
+    assert summary["range"] == {"start": 1000.0, "end": pytest.approx(1019.8)}
+    store.flush()
+    assert store.query("s1")["aggregates"]["frames"] == 100
+    assert store.stats()["rows_written"] == 100
+
+
+def test_range_query_clips_and_aggregates(store):
+    _record(store, "s1", 1000.0, 300, away_after=1040.0, alerts=["no_face", "multiple_faces:2"])
+    store.flush()
+    summary = store.query("s1", start=1030.0, end=5000.0, max_points=10, worst_window_seconds=10.0)
+    aggregates = summary["aggregates"]
+    assert summary["range"]["start"] == 1030.0
+    assert summary["range"]["end"] == pytest.approx(1059.8)
+    assert aggregates["frames"] == 150
+    assert aggregates["away_seconds"] == pytest.approx(19.8, abs=0.01)
+    assert aggregates["alerts"]["no_face"] == {"frames": 100, "onsets": 1}
+    assert aggregates["alerts"]["multiple_faces"]["frames"] == 100
+    assert aggregates["worst_intervals"][0]["mean_focus_score"] == pytest.approx(0.2)
+    assert len(summary["series"]["t"]) == 10
+    assert sum(summary["series"]["frames"]) == 150
+
+
+def test_disconnect_gaps_are_capped(store):
+    _record(store, "s1", 1000.0, 10)
+    _record(store, "s1", 2000.0, 10)
+    aggregates = store.query("s1", gap_seconds=2.0)["aggregates"]
+    assert aggregates["frames"] == 20
+    assert aggregates["observed_seconds"] == pytest.approx(2 * 1.8 + 2.0)
+
+
+def test_empty_and_invalid_ranges(store):
+    assert store.query("missing") is None
+    _record(store, "s1", 1000.0, 10)
+    assert store.query("s1", start=5000.0, end=6000.0)["aggregates"] == {"frames": 0}
+    with pytest.raises(ValueError):
+        store.query("s1", start=10.0, end=5.0)
+
+
+def test_failed_results_are_not_recorded(store):
+    store.record("s1", {"success": False, "timestamp": 1.0}, {})
+    assert store.query("s1") is None
+
+
+def test_unsafe_session_ids_stay_inside_root(store, tmp_path):
+    _record(store, "../escape", 1000.0, 3)
+    store.flush()
+    assert [path.name.startswith("h-") for path in tmp_path.iterdir()] == [True]
+    assert store.query("../escape")["aggregates"]["frames"] == 3
+
+
+def test_alert_mask_round_trip():
+    mask = alert_mask(["no_face", "multiple_faces:3", "something_new"])
+    assert alert_names(mask) == ["no_face", "multiple_faces", "other"]
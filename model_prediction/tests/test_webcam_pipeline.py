@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from backpressure import LatestFrameSlot
+from webcam_pipeline import OverlaySnapshot, WebcamPipeline
+
+
+class _Camera:
+    def __init__(self, hold: threading.Event = None):
+        self.hold = hold
+        self.released = False
+
+    def set(self, prop, value):
+        return True
+
+    def read(self):
+        if self.hold is not None:
+            self.hold.wait()
+        threading.Event().wait(0.005)
+        return True, np.zeros((8, 8, 3), dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+def _analyze(frame):
+    result = {"focus_score": 90.0, "status": "ok", "state": "focused", "away_timer": 0.0}
+    return OverlaySnapshot(result, None, None, [], [], [])
+
+
+def _pipeline(cameras):
+    return WebcamPipeline(lambda: cameras.pop(0), _analyze)
+
+
+def test_viewers_share_one_run_and_release_camera():
+    cameras = [_Camera()]
+    camera = cameras[0]
+    pipeline = _pipeline(cameras)
+
+    async def scenario():
+        first, second = pipeline.stream(), pipeline.stream()
+        chunks = [await first.__anext__(), await second.__anext__()]
+        await first.aclose()
+        assert pipeline.stats()["running"]
+        await second.aclose()
+        return chunks
+
+    chunks = asyncio.run(scenario())
+    assert all(chunk.startswith(b"--frame") for chunk in chunks)
+    assert not pipeline.stats()["running"]
+    for thread in pipeline._run.threads:
+        thread.join(timeout=1.0)
+    assert camera.released
+
+
+def test_late_teardown_of_old_run_leaves_new_viewer_alone():
+    hold = threading.Event()
+    hold.set()
+    stuck, fresh = _Camera(hold), _Camera()
+    pipeline = _pipeline([stuck, fresh])
+
+    async def scenario():
+        old_viewer = pipeline.stream()
+        await old_viewer.__anext__()
+        hold.clear()  # the old camera's next read blocks past the one-second wait
+        await asyncio.sleep(0.05)
+        await old_viewer.aclose()
+        old_run = pipeline._run
+
+        new_viewer = pipeline.stream()
+        await new_viewer.__anext__()
+        assert pipeline._run is not old_run
+        hold.set()
+        for thread in old_run.threads:
+            await asyncio.to_thread(thread.join, 1.0)
+        assert stuck.released
+        # The old run is gone, the new viewer still streams
+        chunk = await asyncio.wait_for(new_viewer.__anext__(), 1.0)
+        await new_viewer.aclose()
+        return chunk
+
+    assert asyncio.run(scenario()).startswith(b"--frame")
+    pipeline.shutdown()
+
+
+def test_broadcast_to_closed_loop_does_not_kill_encoder():
+    pipeline = _pipeline([_Camera()])
+    closed_loop = asyncio.new_event_loop()
+    closed_loop.close()
+
+    async def scenario():
+        viewer = pipeline.stream()
+        await viewer.__anext__()
+        run = pipeline._run
+        with pipeline._lock:
+            run.clients[LatestFrameSlot()] = closed_loop
+        # Frames keep flowing to the live viewer after the dead one is dropped
+        for _ in range(3):
+            await asyncio.wait_for(viewer.__anext__(), 1.0)
+        alive = all(thread.is_alive() for thread in run.threads)
+        await viewer.aclose()
+        return run, alive
+
+    run, alive = asyncio.run(scenario())
+    assert alive
+    assert len(run.clients) == 0
@@ -0,0 +1,403 @@
+"""
+Append-only per-session focus timelines and the aggregation queries behind
+GET /sessions/{session_id}/timeline.
+
+Each session is one file of fixed-size NumPy records (TIMELINE_DTYPE). Results are
+buffered in memory and appended by a writer thread in batches; queries memory-map
+the file and reduce it chunk by chunk, so a long session is never loaded whole.
+"""
+import hashlib
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_DTYPE = np.dtype([
+    ("t", "<f8"),
+    ("focus_score", "<f4"),
+    ("raw_score", "<f4"),
+    ("state", "u1"),
+    ("faces", "u1"),
+    ("reused", "u1"),
+    ("pitch", "<f4"),
+    ("yaw", "<f4"),
+    ("roll", "<f4"),
+    ("left_horizontal_ratio", "<f4"),
+    ("right_horizontal_ratio", "<f4"),
+    ("left_vertical_ratio", "<f4"),
+    ("right_vertical_ratio", "<f4"),
+    ("device_presence", "<f4"),
+    ("alerts", "<u4"),
+])
+# Bumped whenever TIMELINE_DTYPE changes; older files are left untouched
+FILE_NAME = "frames.v1.bin"
+
+STATES = ("unknown", "focused", "away")
+_STATE_CODES = {name: code for code, name in enumerate(STATES)}
+_AWAY = _STATE_CODES["away"]
+
+ALERTS = (
+    "no_face",
+    "multiple_faces",
+    "eyes_not_detected",
+    "looking_left",
+    "looking_right",
+    "gaze_horizontal_off",
+    "gaze_vertical_off",
+    "device_detected",
+    "away_5_seconds",
+    "looping_video",
+)
+_ALERT_BITS = {name: 1 << bit for bit, name in enumerate(ALERTS)}
+_OTHER_ALERT = 1 << 31
+
+_DETAIL_FIELDS = (
+    "pitch",
+    "yaw",
+    "roll",
+    "left_horizontal_ratio",
+    "right_horizontal_ratio",
+    "left_vertical_ratio",
+    "right_vertical_ratio",
+)
+_SAFE_SESSION = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,99}")
+
+
+def alert_mask(alerts: List[str]) -> int:
+    mask = 0
+    for alert in alerts:
+        # "multiple_faces:3" and similar carry a count after the colon
+        mask |= _ALERT_BITS.get(alert.split(":", 1)[0], _OTHER_ALERT)
+    return mask
+
+
+def alert_names(mask: int) -> List[str]:
+    names = [name for name, bit in _ALERT_BITS.items() if mask & bit]
+    if mask & _OTHER_ALERT:
+        names.append("other")
+    return names
+
+
+def timeline_row(result: Dict, details: Dict[str, object]) -> Tuple:
+    """One TIMELINE_DTYPE record from a successful result and the monitor's focus details."""
+    return (
+        float(result.get("timestamp", 0.0)),
+        float(result.get("focus_score", 0.0)),
+        float(result.get("raw_frame_score", result.get("focus_score", 0.0))),
+        _STATE_CODES.get(str(result.get("state")), 0),
+        min(255, int(result.get("faces_detected") or 0)),
+        1 if result.get("reused") else 0,
+        *(float(details[name]) if details.get(name) is not None else math.nan for name in _DETAIL_FIELDS),
+        float(details.get("device_presence") or 0.0),
+        alert_mask(result.get("alerts") or []),
+    )
+
+
+def _session_dir_name(session_id: str) -> str:
+    if _SAFE_SESSION.fullmatch(session_id):
+        return session_id
+    return "h-" + hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+
+
+def _round(value: float, digits: int = 2) -> Optional[float]:
+    return None if value is None or not math.isfinite(value) else round(float(value), digits)
+
+
+class TimelineStore:
+    """
+    Buffered, append-only timeline writer plus streaming queries.
+
+    `record` only appends a tuple to the session's in-memory buffer. The writer thread
+    flushes a session once it holds `block_rows` rows, and every session at least
+    every `flush_seconds`. With `retention_seconds` set, it also deletes sessions
+    whose file has not been written for that long.
+    """
+
+    CHUNK_ROWS = 65_536
+    # Upper bound on worst-interval windows per query; wider windows are used beyond it
+    MAX_WORST_WINDOWS = 4096
+    PRUNE_INTERVAL_SECONDS = 300.0
+
+    def __init__(
+        self,
+        root: str,
+        block_rows: int = 512,
+        flush_seconds: float = 5.0,
+        retention_seconds: float = 0.0
+    ):
+        self.root = root
+        self.block_rows = max(1, block_rows)
+        self.flush_seconds = flush_seconds
+        self.retention_seconds = retention_seconds
+        self.sessions_pruned = 0
+        self._lock = threading.Lock()
+        # Held while rows move from a buffer to disk so queries see each row exactly once
+        self._write_lock = threading.Lock()
+        self._buffers: Dict[str, List[Tuple]] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.rows_written = 0
+        self.write_errors = 0
+        os.makedirs(root, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="timeline-writer", daemon=True)
+        self._thread.start()
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.root, _session_dir_name(session_id), FILE_NAME)
+
+    def record(self, session_id: str, result: Dict, details: Dict[str, object]) -> None:
+        if not result.get("success"):
+            return
+        row = timeline_row(result, details)
+        with self._lock:
+            buffer = self._buffers.setdefault(session_id, [])
+            buffer.append(row)
+            full = len(buffer) >= self.block_rows
+        if full:
+            self._wake.set()
+
+    def _run(self) -> None:
+        pruned_at = 0.0
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+            if self.retention_seconds > 0 and time.monotonic() - pruned_at >= self.PRUNE_INTERVAL_SECONDS:
+                pruned_at = time.monotonic()
+                self.prune()
+
+    def prune(self) -> int:
+        """Delete sessions not written for `retention_seconds`; returns how many."""
+        cutoff = time.time() - self.retention_seconds
+        removed = 0
+        with self._write_lock:
+            with self._lock:
+                buffered = {_session_dir_name(session_id) for session_id in self._buffers}
+            try:
+                entries = list(os.scandir(self.root))
+            except OSError:
+                return 0
+            for entry in entries:
+                if not entry.is_dir() or entry.name in buffered:
+                    continue
+                path = os.path.join(entry.path, FILE_NAME)
+                try:
+                    modified = os.path.getmtime(path) if os.path.exists(path) else entry.stat().st_mtime
+                    if modified >= cutoff:
+                        continue
+                    shutil.rmtree(entry.path)
+                    removed += 1
+                except OSError as prune_error:
+                    logger.warning("Failed to prune timeline %s: %s", entry.name, prune_error)
+        self.sessions_pruned += removed
+        return removed
+
+    def flush(self) -> None:
+        """Append every buffered row to its session file."""
+        with self._write_lock:
+            with self._lock:
+                buffers, self._buffers = self._buffers, {}
+            for session_id, rows in buffers.items():
+                if not rows:
+                    continue
+                path = self._path(session_id)
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, "ab") as handle:
+                        # Drop a record torn by a crash so later rows stay aligned
+                        torn = handle.tell() % TIMELINE_DTYPE.itemsize
+                        if torn:
+                            handle.truncate(handle.tell() - torn)
+                        handle.write(np.array(rows, dtype=TIMELINE_DTYPE).tobytes())
+                    self.rows_written += len(rows)
+                except OSError as write_error:
+                    self.write_errors += 1
+                    logger.error("Failed to write timeline for session %s: %s", session_id, write_error)
+
+    def _snapshot(self, session_id: str) -> Tuple[str, int, List[Tuple]]:
+        """Stored row count and unflushed rows, taken together so no row is seen twice."""
+        path = self._path(session_id)
+        with self._write_lock:
+            rows = os.path.getsize(path) // TIMELINE_DTYPE.itemsize if os.path.exists(path) else 0
+            with self._lock:
+                pending = list(self._buffers.get(session_id, ()))
+        return path, rows, pending
+
+    def _chunks(self, session_id: str) -> Iterator[np.ndarray]:
+        path, rows, pending = self._snapshot(session_id)
+        if rows:
+            stored = np.memmap(path, dtype=TIMELINE_DTYPE, mode="r", shape=(rows,))
+            for start in range(0, rows, self.CHUNK_ROWS):
+                yield np.array(stored[start:start + self.CHUNK_ROWS])
+            del stored
+        if pending:
+            yield np.array(pending, dtype=TIMELINE_DTYPE)
+
+    def _time_range(self, session_id: str) -> Optional[Tuple[float, float]]:
+        path, rows, pending = self._snapshot(session_id)
+        first = last = None
+        if rows:
+            stored = np.memmap(path, dtype=TIMELINE_DTYPE, mode="r", shape=(rows,))
+            first, last = float(stored["t"][0]), float(stored["t"][rows - 1])
+            del stored
+        if pending:
+            first = pending[0][0] if first is None else first
+            last = pending[-1][0]
+        return None if first is None else (first, last)
+
+    def query(
+        self,
+        session_id: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        max_points: int = 200,
+        worst_window_seconds: float = 30.0,
+        worst_count: int = 3,
+        gap_seconds: float = 2.0
+    ) -> Optional[Dict[str, object]]:
+        """
+        Downsampled series and aggregates for [start, end] (epoch seconds), or None when
+        the session has no rows. The range is clipped to the stored rows, and the worst
+        intervals widen past `worst_window_seconds` when the range would need more than
+        MAX_WORST_WINDOWS of them. Time between frames counts towards the earlier frame's
+        state, capped at `gap_seconds` so disconnects are not counted as time away.
+        """
+        if start is not None and end is not None and end < start:
+            raise ValueError("end must not be before start")
+        time_range = self._time_range(session_id)
+        if time_range is None:
+            return None
+        start = time_range[0] if start is None else max(start, time_range[0])
+        end = time_range[1] if end is None else min(end, time_range[1])
+        if end < start:
+            return {"range": {"start": start, "end": end}, "aggregates": {"frames": 0}, "series": {}}
+        bucket_seconds = max((end - start) / max(1, max_points), 1e-3)
+        buckets = max(1, min(max_points, int(math.ceil((end - start) / bucket_seconds)) or 1))
+        worst_window_seconds = max(worst_window_seconds, 1e-3, (end - start) / self.MAX_WORST_WINDOWS)
+        windows = min(self.MAX_WORST_WINDOWS, int((end - start) // worst_window_seconds)) + 1
+
+        counts = np.zeros(buckets, dtype=np.int64)
+        score_sum = np.zeros(buckets)
+        score_min = np.full(buckets, np.inf)
+        away_counts = np.zeros(buckets, dtype=np.int64)
+        bucket_alerts = np.zeros(buckets, dtype=np.uint32)
+        window_counts = np.zeros(windows, dtype=np.int64)
+        window_sum = np.zeros(windows)
+        alert_frames = np.zeros(len(ALERTS) + 1, dtype=np.int64)
+        alert_onsets = np.zeros(len(ALERTS) + 1, dtype=np.int64)
+        bits = np.array([1 << bit for bit in range(len(ALERTS))] + [_OTHER_ALERT], dtype=np.uint32)
+        frames = 0
+        reused = 0
+        observed_seconds = 0.0
+        away_seconds = 0.0
+        previous: Optional[np.void] = None
+
+        for chunk in self._chunks(session_id):
+            chunk = chunk[(chunk["t"] >= start) & (chunk["t"] <= end)]
+            if not len(chunk):
+                continue
+            t = chunk["t"]
+            scores = chunk["focus_score"].astype(np.float64)
+            away = chunk["state"] == _AWAY
+            frames += len(chunk)
+            reused += int(chunk["reused"].sum())
+
+            index = np.minimum(((t - start) / bucket_seconds).astype(np.int64), buckets - 1)
+            counts += np.bincount(index, minlength=buckets)
+            score_sum += np.bincount(index, weights=scores, minlength=buckets)
+            np.minimum.at(score_min, index, scores)
+            away_counts += np.bincount(index, weights=away, minlength=buckets).astype(np.int64)
+            np.bitwise_or.at(bucket_alerts, index, chunk["alerts"])
+
+            window_index = np.minimum(((t - start) // worst_window_seconds).astype(np.int64), windows - 1)
+            window_counts += np.bincount(window_index, minlength=windows)
+            window_sum += np.bincount(window_index, weights=scores, minlength=windows)
+
+            # Durations and onsets look one row back, across chunk boundaries too
+            previous_t = np.concatenate(([previous["t"]], t[:-1])) if previous is not None else t[:-1]
+            previous_away = (
+                np.concatenate(([previous["state"] == _AWAY], away[:-1])) if previous is not None else away[:-1]
+            )
+            current_t = t if previous is not None else t[1:]
+            durations = np.clip(current_t - previous_t, 0.0, gap_seconds)
+            observed_seconds += float(durations.sum())
+            away_seconds += float(durations[previous_away].sum())
+
+            masks = chunk["alerts"]
+            previous_masks = np.concatenate((
+                [previous["alerts"] if previous is not None else 0], masks[:-1]
+            )).astype(np.uint32)
+            active = (masks[:, None] & bits) != 0
+            was_active = (previous_masks[:, None] & bits) != 0
+            alert_frames += active.sum(axis=0)
+            alert_onsets += (active & ~was_active).sum(axis=0)
+            previous = chunk[-1]
+
+        if not frames:
+            return {"range": {"start": start, "end": end}, "aggregates": {"frames": 0}, "series": {}}
+
+        filled = counts > 0
+        names = list(ALERTS) + ["other"]
+        window_means = np.where(window_counts > 0, window_sum / np.maximum(window_counts, 1), np.inf)
+        worst = [
+            {
+                "start": round(start + int(window) * worst_window_seconds, 3),
+                "end": round(start + (int(window) + 1) * worst_window_seconds, 3),
+                "mean_focus_score": _round(window_means[window]),
+                "frames": int(window_counts[window]),
+            }
+            for window in np.argsort(window_means)[:worst_count]
+            if np.isfinite(window_means[window])
+        ]
+        return {
+            "range": {"start": start, "end": end},
+            "aggregates": {
+                "frames": frames,
+                "reused_frames": reused,
+                "observed_seconds": round(observed_seconds, 2),
+                "away_seconds": round(away_seconds, 2),
+                "away_ratio": round(away_seconds / observed_seconds, 4) if observed_seconds else None,
+                "mean_focus_score": _round(float(score_sum.sum()) / frames),
+                "alerts": {
+                    name: {"frames": int(alert_frames[bit]), "onsets": int(alert_onsets[bit])}
+                    for bit, name in enumerate(names)
+                    if alert_frames[bit]
+                },
+                "worst_window_seconds": round(worst_window_seconds, 3),
+                "worst_intervals": worst,
+            },
+            "series": {
+                "bucket_seconds": round(bucket_seconds, 3),
+                "t": [round(start + int(bucket) * bucket_seconds, 3) for bucket in np.flatnonzero(filled)],
+                "frames": counts[filled].tolist(),
+                "focus_score_mean": [_round(value) for value in (score_sum[filled] / counts[filled])],
+                "focus_score_min": [_round(value) for value in score_min[filled]],
+                "away_ratio": [round(float(value), 3) for value in (away_counts[filled] / counts[filled])],
+                "alerts": [alert_names(int(mask)) for mask in bucket_alerts[filled]],
+            },
+        }
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            buffered = sum(len(rows) for rows in self._buffers.values())
+        return {
+            "root": self.root,
+            "buffered_rows": buffered,
+            "rows_written": self.rows_written,
+            "write_errors": self.write_errors,
+            "sessions_pruned": self.sessions_pruned,
+        }
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=2.0)
+        self.flush()
@@ -0,0 +1,156 @@
+"""
+Capture of inbound /analyze WebSocket traffic (frames plus arrival timing) for replay.
+
+One file per connection: a magic line, a JSON metadata line, then records of
+(offset seconds since the connection opened, payload kind, length) followed by the
+payload exactly as the client sent it. Files are written by a background thread;
+frames that arrive while it is `max_queued_frames` behind are counted and skipped.
+Opening and closing a capture are never skipped and never block the caller.
+`loadgen.py --replay` plays captures back against a server.
+"""
+import json
+import logging
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Iterator, NamedTuple, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FCAP1\n"
+# offset f64 | kind u8 | length u32
+RECORD_HEADER = struct.Struct("!dBI")
+KIND_IMAGE = 0   # raw image bytes (binary protocol, header stripped)
+KIND_BASE64 = 1  # the JSON "frame" field as sent (base64 or data URL)
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+_CLOSE = object()
+
+
+class CapturedFrame(NamedTuple):
+    offset: float
+    kind: int
+    payload: bytes
+
+
+class SessionCapture:
+    """Recording handle of one connection; `record` never blocks the event loop."""
+
+    def __init__(self, recorder: "TrafficRecorder", path: str):
+        self._recorder = recorder
+        self.path = path
+        self.started = time.monotonic()
+        self.frames = 0
+
+    def record(self, frame_field: Union[str, bytes, bytearray, memoryview]) -> None:
+        if isinstance(frame_field, str):
+            kind, payload = KIND_BASE64, frame_field.encode("ascii", errors="replace")
+        else:
+            kind, payload = KIND_IMAGE, bytes(frame_field)
+        if self._recorder.enqueue_frame((self, time.monotonic() - self.started, kind, payload)):
+            self.frames += 1
+
+    def close(self) -> None:
+        self._recorder.enqueue_control((self, _CLOSE, 0, b""))
+
+
+class TrafficRecorder:
+    """Owns the capture directory and the writer thread shared by every connection."""
+
+    def __init__(self, root: str, max_queued_frames: int = 1024):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        # Unbounded so open/close items always get in, in order with the frames around
+        # them; frames are bounded by the semaphore instead
+        self._queue: "queue.Queue[Tuple]" = queue.Queue()
+        self._frame_slots = threading.BoundedSemaphore(max_queued_frames)
+        self._files: Dict[SessionCapture, BinaryIO] = {}
+        self.frames_written = 0
+        self.frames_skipped = 0
+        self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self._thread.start()
+
+    def start(self, session_id: str, mode: str) -> SessionCapture:
+        name = f"{_UNSAFE_NAME.sub('_', session_id)[:80]}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:6]}.fcap"
+        capture = SessionCapture(self, os.path.join(self.root, name))
+        metadata = {"session_id": session_id, "mode": mode, "started_at": time.time()}
+        self.enqueue_control((capture, None, 0, json.dumps(metadata).encode("utf-8")))
+        return capture
+
+    def enqueue_frame(self, item: Tuple) -> bool:
+        """Queue a frame record unless the writer is too far behind; never blocks."""
+        if not self._frame_slots.acquire(blocking=False):
+            self.frames_skipped += 1
+            return False
+        self._queue.put(item)
+        return True
+
+    def enqueue_control(self, item: Tuple) -> None:
+        """Queue opening or closing a capture file; never blocks and is never dropped."""
+        self._queue.put(item)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            capture, offset, kind, payload = item
+            try:
+                if offset is None:
+                    handle = open(capture.path, "wb")
+                    handle.write(MAGIC + payload + b"\n")
+                    self._files[capture] = handle
+                elif offset is _CLOSE:
+                    handle = self._files.pop(capture, None)
+                    if handle is not None:
+                        handle.close()
+                else:
+                    self._frame_slots.release()
+                    handle = self._files.get(capture)
+                    if handle is not None:
+                        handle.write(RECORD_HEADER.pack(offset, kind, len(payload)) + payload)
+                        self.frames_written += 1
+            except OSError as write_error:
+                logger.error("Traffic capture write failed for %s: %s", capture.path, write_error)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "root": self.root,
+            "open_captures": len(self._files),
+            "frames_written": self.frames_written,
+            "frames_skipped": self.frames_skipped,
+        }
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=2.0)
+        for handle in list(self._files.values()):
+            handle.close()
+        self._files.clear()
+
+
+def read_capture(path: str) -> Tuple[Dict[str, object], Iterator[CapturedFrame]]:
+    """Metadata of a capture file and an iterator over its frames (a torn tail is ignored)."""
+    handle = open(path, "rb")
+    if handle.readline() != MAGIC:
+        handle.close()
+        raise ValueError(f"Not a capture file: {path}")
+    metadata = json.loads(handle.readline())
+
+    def frames() -> Iterator[CapturedFrame]:
+        with handle:
+            while True:
+                header = handle.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                offset, kind, length = RECORD_HEADER.unpack(header)
+                payload = handle.read(length)
+                if len(payload) < length:
+                    return
+                yield CapturedFrame(offset, kind, payload)
+
+    return metadata, frames()
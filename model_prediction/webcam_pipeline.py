@@ -0,0 +1,341 @@
+"""
+Shared capture -> analysis -> encode pipeline behind /webcam/stream
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from backpressure import LatestFrameSlot
+from focus_monitor import FocusMonitor
+
+logger = logging.getLogger(__name__)
+
+
+class OverlaySnapshot(NamedTuple):
+    """One analysis result plus the monitor's overlay geometry at the time it was produced."""
+
+    result: Dict
+    head_pose: Optional[Dict[str, object]]
+    face_box: Optional[Tuple[int, int, int, int]]
+    additional_face_boxes: List[Tuple[int, int, int, int]]
+    pupil_points: List[Tuple[int, int]]
+    device_boxes: List[np.ndarray]
+
+
+def snapshot_overlay(result: Dict, monitor: FocusMonitor) -> OverlaySnapshot:
+    # Copied because the monitor keeps mutating while older snapshots are still drawn
+    head_pose = dict(monitor.last_head_pose) if monitor.last_head_pose else None
+    return OverlaySnapshot(
+        result=result,
+        head_pose=head_pose,
+        face_box=monitor.last_face_box,
+        additional_face_boxes=list(monitor.last_additional_face_boxes),
+        pupil_points=list(monitor.last_pupil_points),
+        device_boxes=list(monitor.last_device_boxes)
+    )
+
+
+def draw_overlay(frame: np.ndarray, overlay: OverlaySnapshot) -> None:
+    """Draw score, state, head pose, faces, pupils, devices and the away timer in place."""
+    result = overlay.result
+    height, width = frame.shape[:2]
+
+    # Determine color based on score
+    score = result["focus_score"]
+    if score >= 85:
+        color = (0, 255, 0)  # Green
+    elif score >= 70:
+        color = (0, 255, 255)  # Yellow
+    elif score >= 50:
+        color = (0, 165, 255)  # Orange
+    else:
+        color = (0, 0, 255)  # Red
+
+    # Draw score
+    cv2.putText(frame, f"FOCUS: {score:.0f}%", (10, 40),
+               cv2.FONT_HERSHEY_SIMPLEX, 1.2, color, 3)
+
+    # Draw status
+    cv2.putText(frame, result["status"], (10, 80),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+    # Draw state
+    cv2.putText(frame, f"State: {result['state'].upper()}", (10, 110),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+    # Draw head pose axes
+    pose_info = overlay.head_pose
+    if pose_info and pose_info.get("axis_points") is not None and pose_info.get("origin") is not None:
+        origin = tuple(pose_info["origin"])
+        axis_points = pose_info["axis_points"]
+        if axis_points is not None and len(axis_points) >= 4:
+            cv2.line(frame, origin, tuple(axis_points[1]), (0, 0, 255), 2)  # X-axis
+            cv2.line(frame, origin, tuple(axis_points[2]), (0, 255, 0), 2)  # Y-axis
+            cv2.line(frame, origin, tuple(axis_points[3]), (255, 0, 0), 2)  # Z-axis
+
+    # Draw face bounding box
+    if overlay.face_box:
+        fx1, fy1, fx2, fy2 = overlay.face_box
+        cv2.rectangle(frame, (fx1, fy1), (fx2, fy2), (255, 255, 0), 2)
+
+    if overlay.additional_face_boxes:
+        for idx, (ax1, ay1, ax2, ay2) in enumerate(overlay.additional_face_boxes, start=1):
+            cv2.rectangle(frame, (ax1, ay1), (ax2, ay2), (0, 0, 255), 2)
+            cv2.putText(frame, f"FACE {idx+1}", (ax1, max(ay1 - 10, 0)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+
+    # Draw pupils
+    for pupil in overlay.pupil_points:
+        cv2.circle(frame, pupil, 4, (0, 255, 255), -1)
+
+    # Draw detected device boxes
+    if overlay.device_boxes:
+        for box in overlay.device_boxes:
+            cv2.polylines(frame, [box], True, (0, 140, 255), 2)
+
+    # Draw away timer if active
+    if result["away_timer"] > 0:
+        timer_color = (0, 165, 255) if result["away_timer"] < 5.0 else (0, 0, 255)
+        cv2.putText(frame, f"Away: {result['away_timer']:.1f}s / 5.0s",
+                   (10, height - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, timer_color, 2)
+
+        # Warning if >= 5 seconds
+        if result["away_timer"] >= 5.0:
+            cv2.putText(frame, "!!! WARNING: LOOK AT SCREEN !!!",
+                       (width//2 - 300, height//2),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 255), 3)
+
+
+class _Run:
+    """
+    State of one capture/analysis/encode run. Threads only touch the run they were
+    started for, so a run that is still winding down cannot reach the viewers or
+    frames of the run that replaced it.
+    """
+
+    def __init__(self):
+        self.stop = threading.Event()
+        self.frame_ready = threading.Condition()
+        self.frame: Optional[np.ndarray] = None
+        self.frame_seq = 0
+        self.overlay: Optional[OverlaySnapshot] = None
+        self.clients: Dict[LatestFrameSlot, asyncio.AbstractEventLoop] = {}
+        self.threads: List[threading.Thread] = []
+
+
+class WebcamPipeline:
+    """
+    One camera, one analysis loop and one JPEG encoder shared by every MJPEG viewer.
+
+    The capture thread keeps only the newest camera frame. The analysis thread picks
+    up whatever frame is newest when it is free (optionally capped at `analysis_fps`)
+    and publishes an OverlaySnapshot; the encoder draws the latest snapshot onto each
+    captured frame, encodes it once and hands the bytes to every viewer's single-slot
+    mailbox, so a slow viewer only drops frames for itself. The pipeline starts with
+    the first viewer and releases the camera when the last one disconnects.
+    """
+
+    def __init__(
+        self,
+        open_camera: Callable[[], Optional[cv2.VideoCapture]],
+        analyze: Callable[[np.ndarray], OverlaySnapshot],
+        analysis_fps: float = 0.0,
+        jpeg_quality: int = 85,
+        capture_size: Tuple[int, int] = (640, 480),
+        capture_fps: int = 30
+    ):
+        self._open_camera = open_camera
+        self._analyze = analyze
+        self.analysis_interval = 1.0 / analysis_fps if analysis_fps > 0 else 0.0
+        self.jpeg_quality = jpeg_quality
+        self.capture_size = capture_size
+        self.capture_fps = capture_fps
+
+        self._lock = threading.Lock()
+        self._run: Optional[_Run] = None
+
+        self.frames_captured = 0
+        self.frames_analyzed = 0
+        self.frames_encoded = 0
+        self.client_frames_dropped = 0
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """multipart/x-mixed-replace body for one viewer."""
+        slot: LatestFrameSlot[bytes] = LatestFrameSlot()
+        # Joining threads blocks, so it happens off the event loop and before the viewer is
+        # registered: a viewer that disconnects meanwhile leaves nothing behind
+        await asyncio.to_thread(self._wait_for_previous_run)
+        run = self._subscribe(slot, asyncio.get_running_loop())
+        try:
+            while True:
+                chunk = await slot.take()
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self._unsubscribe(run, slot)
+
+    def _wait_for_previous_run(self) -> None:
+        """
+        Give a run that is winding down a moment to release the camera before it is
+        opened again. Runs share no state, so one that outlives the wait is harmless.
+        """
+        with self._lock:
+            run = self._run
+            winding_down = list(run.threads) if run is not None and run.stop.is_set() else []
+        for thread in winding_down:
+            thread.join(timeout=1.0)
+
+    def _subscribe(self, slot: LatestFrameSlot, loop: asyncio.AbstractEventLoop) -> _Run:
+        with self._lock:
+            run = self._run
+            if run is None or run.stop.is_set():
+                run = self._start()
+            run.clients[slot] = loop
+            return run
+
+    def _unsubscribe(self, run: _Run, slot: LatestFrameSlot) -> None:
+        with self._lock:
+            if run.clients.pop(slot, None) is not None:
+                self.client_frames_dropped += slot.dropped
+            if not run.clients:
+                run.stop.set()
+                with run.frame_ready:
+                    run.frame_ready.notify_all()
+
+    def _start(self) -> _Run:
+        run = _Run()
+        run.threads = [
+            threading.Thread(target=self._capture_loop, args=(run,), name="webcam-capture", daemon=True),
+            threading.Thread(target=self._analysis_loop, args=(run,), name="webcam-analysis", daemon=True),
+            threading.Thread(target=self._encode_loop, args=(run,), name="webcam-encode", daemon=True),
+        ]
+        self._run = run
+        for thread in run.threads:
+            thread.start()
+        return run
+
+    def _capture_loop(self, run: _Run) -> None:
+        camera = self._open_camera()
+        if camera is None:
+            logger.error("Failed to open camera after backend probe")
+            self._shutdown_run(run)
+            return
+        camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.capture_size[0])
+        camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.capture_size[1])
+        camera.set(cv2.CAP_PROP_FPS, self.capture_fps)
+        logger.info("Webcam stream started")
+        try:
+            while not run.stop.is_set():
+                success, frame = camera.read()
+                if not success:
+                    logger.warning("Failed to read frame")
+                    break
+                with run.frame_ready:
+                    run.frame = frame
+                    run.frame_seq += 1
+                    self.frames_captured += 1
+                    run.frame_ready.notify_all()
+        except Exception as e:
+            logger.error(f"Error in webcam capture: {e}")
+        finally:
+            camera.release()
+            logger.info("Webcam stream stopped and camera released")
+            self._shutdown_run(run)
+
+    def _next_frame(self, run: _Run, last_seq: int) -> Tuple[Optional[np.ndarray], int]:
+        with run.frame_ready:
+            run.frame_ready.wait_for(lambda: run.stop.is_set() or run.frame_seq != last_seq)
+            if run.stop.is_set():
+                return None, last_seq
+            return run.frame, run.frame_seq
+
+    def _analysis_loop(self, run: _Run) -> None:
+        last_seq = 0
+        while True:
+            frame, last_seq = self._next_frame(run, last_seq)
+            if frame is None:
+                return
+            started = time.perf_counter()
+            try:
+                run.overlay = self._analyze(frame)
+                self.frames_analyzed += 1
+            except Exception as e:
+                logger.error(f"Error analysing webcam frame: {e}")
+            if self.analysis_interval:
+                run.stop.wait(max(0.0, self.analysis_interval - (time.perf_counter() - started)))
+
+    def _encode_loop(self, run: _Run) -> None:
+        last_seq = 0
+        while True:
+            frame, last_seq = self._next_frame(run, last_seq)
+            if frame is None:
+                return
+            # The analysis thread may still be reading this frame; draw on a copy
+            frame = frame.copy()
+            overlay = run.overlay
+            if overlay is not None:
+                draw_overlay(frame, overlay)
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ret:
+                continue
+            self.frames_encoded += 1
+            chunk = (b'--frame\r\n'
+                     b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+            self._broadcast(run, chunk)
+
+    def _notify(
+        self,
+        run: _Run,
+        slot: LatestFrameSlot,
+        loop: asyncio.AbstractEventLoop,
+        callback: Callable[..., None],
+        *args: object
+    ) -> None:
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The viewer's event loop is already closed (server shutting down); nobody is left to read it
+            with self._lock:
+                run.clients.pop(slot, None)
+
+    def _broadcast(self, run: _Run, chunk: bytes) -> None:
+        with self._lock:
+            clients = list(run.clients.items())
+        for slot, loop in clients:
+            self._notify(run, slot, loop, slot.put, chunk)
+
+    def _shutdown_run(self, run: _Run) -> None:
+        """End a run: wake its worker threads and finish the streams of its viewers."""
+        run.stop.set()
+        with run.frame_ready:
+            run.frame_ready.notify_all()
+        with self._lock:
+            clients = list(run.clients.items())
+        for slot, loop in clients:
+            self._notify(run, slot, loop, slot.close)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            run = self._run
+            clients = list(run.clients) if run is not None else []
+            running = run is not None and not run.stop.is_set()
+        return {
+            "running": running,
+            "viewers": len(clients),
+            "frames_captured": self.frames_captured,
+            "frames_analyzed": self.frames_analyzed,
+            "frames_encoded": self.frames_encoded,
+            "client_frames_dropped": self.client_frames_dropped + sum(slot.dropped for slot in clients),
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            run = self._run
+        if run is not None:
+            self._shutdown_run(run)